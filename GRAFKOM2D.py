@@ -4,26 +4,310 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 import numpy as np
 import math
+import functools
+import os
+import struct
+import sys
+from collections import OrderedDict
+
+from freehand import StrokeSimplifier
+from glstate import GLStateCache
+from history import History, CreateCommand, ClearCommand, GroupCommand, UngroupCommand
+from profiler import Profiler
+
+SHAPE_KINDS = {'point': 0, 'line': 1, 'rectangle': 2, 'ellipse': 3, 'polyline': 4}
+SHAPE_KIND_NAMES = {code: name for name, code in SHAPE_KINDS.items()}
+KIND_POINT, KIND_LINE, KIND_POLYLINE = SHAPE_KINDS['point'], SHAPE_KINDS['line'], SHAPE_KINDS['polyline']
+
+def compose_transforms(params, centers):
+    """Batched version of Shape.compute_transform.
+
+    params rows are (drag_x, drag_y, rotation_angle, scale_x, scale_y) and
+    centers the rotation centers; returns an (N, 3, 3) array of
+    translate @ rotate-about-center @ scale matrices.
+    """
+    params = np.asarray(params, dtype=np.float64)
+    centers = np.asarray(centers, dtype=np.float64)
+    angle = np.radians(params[:, 2])
+    cos_a, sin_a = np.cos(angle), np.sin(angle)
+    sx, sy = params[:, 3], params[:, 4]
+    cx, cy = centers[:, 0], centers[:, 1]
+    m = np.zeros((len(params), 3, 3))
+    m[:, 0, 0] = cos_a * sx
+    m[:, 0, 1] = -sin_a * sy
+    m[:, 0, 2] = params[:, 0] + cx * (1 - cos_a) + cy * sin_a
+    m[:, 1, 0] = sin_a * sx
+    m[:, 1, 1] = cos_a * sy
+    m[:, 1, 2] = params[:, 1] + cy * (1 - cos_a) - cx * sin_a
+    m[:, 2, 2] = 1.0
+    return m
+
+def hit_test(kinds, thickness, points, counts, point, tolerance=3.0):
+    """Exact test of one point against many shapes at once.
+
+    points holds the transformed vertices of all shapes back to back,
+    counts[i] of them per shape. Points are hit within their drawn radius,
+    lines and polylines within half their thickness plus tolerance, and rectangles and
+    ellipses when the point lies inside the polygon or near its outline.
+    Returns a boolean mask with one entry per shape.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if len(counts) == 0:
+        return np.zeros(0, dtype=bool)
+    kinds = np.asarray(kinds)
+    starts = np.cumsum(counts) - counts
+    local = np.arange(len(points)) - np.repeat(starts, counts)
+    kind = np.repeat(kinds, counts)
+    last = np.repeat(counts - 1, counts)
+
+    # Every vertex starts a segment to the next one; loops wrap around
+    nxt = np.arange(len(points)) + 1
+    nxt[starts + counts - 1] = starts
+    a = np.asarray(points, dtype=np.float64)
+    b = a[nxt]
+    p = np.asarray(point, dtype=np.float64)
+    ab = b - a
+    ap = p - a
+    length2 = np.einsum('ij,ij->i', ab, ab)
+    t = np.clip(np.einsum('ij,ij->i', ap, ab) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+    dist = np.hypot(*(ap - ab * t[:, None]).T)
+
+    # GL_LINES pairs vertices (0, 1), (2, 3), ...; points have no segments
+    dist = np.where(kind == KIND_POINT, np.hypot(ap[:, 0], ap[:, 1]), dist)
+    is_line_segment = (local % 2 == 0) & (local != last)
+    dist[(kind == KIND_LINE) & ~is_line_segment] = np.inf
+    dist[(kind == KIND_POLYLINE) & (local == last)] = np.inf  # open strip: no closing edge
+    min_dist = np.minimum.reduceat(dist, starts)
+
+    # Crossing number for the closed outlines
+    dy = np.where(ab[:, 1] != 0, ab[:, 1], 1.0)
+    crosses = ((a[:, 1] > p[1]) != (b[:, 1] > p[1])) & (p[0] < ab[:, 0] * (p[1] - a[:, 1]) / dy + a[:, 0])
+    closed = (kind > KIND_LINE) & (kind != KIND_POLYLINE)
+    inside = (np.add.reduceat(crosses & closed, starts) % 2) == 1
+
+    thickness = np.asarray(thickness, dtype=np.float64)
+    reach = np.where(kinds == KIND_POINT, np.maximum(thickness, 1.0), thickness / 2) + tolerance
+    return inside | (min_dist <= reach)
+
+def points_in_polygon(points, polygon):
+    """Even-odd test of many points against one polygon (e.g. a lasso)"""
+    points = np.asarray(points, dtype=np.float64)
+    polygon = np.asarray(polygon, dtype=np.float64)
+    inside = np.zeros(len(points), dtype=bool)
+    if len(polygon) < 3:
+        return inside
+    x, y = points[:, 0], points[:, 1]
+    # Loop over the (few) lasso edges, vectorized over the (many) points
+    for (ax, ay), (bx, by) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        if ay == by:
+            continue
+        crosses = ((ay > y) != (by > y)) & (x < (bx - ax) * (y - ay) / (by - ay) + ax)
+        inside ^= crosses
+    return inside
+
+ELLIPSE_TOLERANCE = 0.25   # max distance (pixels) between true ellipse and polygon
+ELLIPSE_MIN_SEGMENTS = 8
+ELLIPSE_MAX_SEGMENTS = 1024
+
+@functools.lru_cache(maxsize=64)
+def unit_circle(segments):
+    """Cached (segments, 2) table of cos/sin around the unit circle"""
+    angles = np.arange(segments) * (2 * np.pi / segments)
+    table = np.column_stack([np.cos(angles), np.sin(angles)]).astype(np.float32)
+    table.flags.writeable = False
+    return table
+
+def ellipse_segments(rx, ry, scale=1.0, tolerance=ELLIPSE_TOLERANCE):
+    """Segment count keeping the on-screen chord error below tolerance.
+
+    A chord spanning angle 2*pi/n on a circle of radius r deviates from
+    the arc by r * (1 - cos(pi / n)), so n = pi / acos(1 - tolerance / r).
+    """
+    radius = max(abs(rx), abs(ry)) * scale
+    return int(ellipse_segment_counts(radius, tolerance))
+
+def ellipse_segment_counts(radius, tolerance=ELLIPSE_TOLERANCE):
+    """ellipse_segments for an array of on-screen radii"""
+    radius = np.maximum(np.asarray(radius, dtype=np.float64), tolerance)
+    n = np.ceil(np.pi / np.arccos(1 - tolerance / radius)).astype(np.int64)
+    n = -(-n // 4) * 4  # multiple of 4 keeps the outline symmetric
+    return np.clip(n, ELLIPSE_MIN_SEGMENTS, ELLIPSE_MAX_SEGMENTS)
+
+def needs_retessellation(wanted, current):
+    """Hysteresis: only refine past +25% or coarsen below half (arrays too)"""
+    return (wanted <= current // 2) | (wanted > current * 5 // 4)
+
+def tessellate_ellipse(cx, cy, rx, ry, segments):
+    return unit_circle(segments) * np.array([rx, ry], dtype=np.float32) + np.array([cx, cy], dtype=np.float32)
+
+class _TrackedVector(list):
+    """List that marks its owning shape dirty whenever an item is assigned"""
+    def __init__(self, values, owner):
+        super().__init__(values)
+        self._owner = owner
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._owner.invalidate()
 
 class Shape:
-    def _init_(self, shape_type, points, color, thickness=1):
+    def __init__(self, shape_type, points, color, thickness=1):
+        # Until the shape is added to a ShapeStore it keeps its own arrays
+        self.store = None
+        self.index = -1
         self.type = shape_type
-        self.original_points = np.array(points, dtype=np.float32)
-        self.transformed_points = np.array(points, dtype=np.float32)
         self.color = color
         self.thickness = thickness
         self.selected = False
-        self.drag_offset = [0, 0]
-        self.rotation_angle = 0
-        self.scale_factor = [1.0, 1.0]
-        self.transform_matrix = np.identity(3)
+        self._original_points = np.array(points, dtype=np.float32).reshape(-1, 2)
+        self._transformed_points = self._original_points.copy()
+        # Analytic (cx, cy, rx, ry) for ellipses, so they can be re-tessellated
+        self.ellipse = None
+        self._transform_matrix = np.identity(3)
+        self._center = None
+        self._bounds = None
+        self._transformed_center = None
+        # Derived geometry is rebuilt lazily; the counters record each rebuild
+        self._dirty = True
+        self._recompute_counts = {'matrix': 0, 'points': 0, 'bbox': 0, 'center': 0}
+        self._drag_offset = _TrackedVector([0, 0], self)
+        self._rotation_angle = 0
+        self._scale_factor = _TrackedVector([1.0, 1.0], self)
+
+    # Draw state is mirrored into the store so the renderer can batch on it
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, value):
+        self._color = tuple(value)
+        if self.store is not None:
+            self.store.set_style(self.index, color=self._color)
+
+    @property
+    def thickness(self):
+        return self._thickness
+
+    @thickness.setter
+    def thickness(self, value):
+        self._thickness = value
+        if self.store is not None:
+            self.store.set_style(self.index, thickness=value)
+
+    # Transform parameters: editing any of them only marks the shape dirty
+    @property
+    def drag_offset(self):
+        return self._drag_offset
+
+    @drag_offset.setter
+    def drag_offset(self, value):
+        self._drag_offset = _TrackedVector(value, self)
+        self.invalidate()
+
+    @property
+    def rotation_angle(self):
+        return self._rotation_angle
+
+    @rotation_angle.setter
+    def rotation_angle(self, value):
+        self._rotation_angle = value
+        self.invalidate()
+
+    @property
+    def scale_factor(self):
+        return self._scale_factor
+
+    @scale_factor.setter
+    def scale_factor(self, value):
+        self._scale_factor = _TrackedVector(value, self)
+        self.invalidate()
+
+    @property
+    def recompute_counts(self):
+        """How often each piece of derived geometry has been rebuilt"""
+        counts = dict(self._recompute_counts)
+        if self.store is not None:
+            rebuilt = int(self.store.rebuild_counts[self.index])
+            for key in ('points', 'bbox', 'center'):
+                counts[key] += rebuilt
+        return counts
+
+    def invalidate(self):
+        """Mark derived geometry stale; it is rebuilt on the next read"""
+        if self._dirty:
+            return
+        self._dirty = True
+        if self.store is not None:
+            self.store.mark_dirty(self.index)
+        else:
+            self._bounds = None
+            self._transformed_center = None
+
+    def _ensure_clean(self):
+        if not self._dirty:
+            return
+        if self.store is not None:
+            self.store.flush()
+        else:
+            self.apply_transform()
+
+    @property
+    def original_points(self):
+        if self.store is not None:
+            return self.store.original_points(self.index)
+        return self._original_points
+
+    @property
+    def transformed_points(self):
+        self._ensure_clean()
+        if self.store is not None:
+            return self.store.transformed_points(self.index)
+        return self._transformed_points
+
+    @property
+    def transform_matrix(self):
+        self._ensure_clean()
+        if self.store is not None:
+            return self.store.matrices[self.index]
+        return self._transform_matrix
         
     def update_transform(self):
-        """Update all transformations"""
-        # Reset to original points
-        self.transformed_points = self.original_points.copy()
-        
-        # Apply transformations in order: scale -> rotate -> translate
+        """Mark transformations for update (applied lazily on next read)"""
+        self.invalidate()
+
+    @classmethod
+    def from_store(cls, store, index):
+        """Create the Python handle for a shape that so far only exists in a store"""
+        shape = cls.__new__(cls)
+        shape.store = store
+        shape.index = index
+        shape.type = SHAPE_KIND_NAMES[store._kinds[index]]
+        shape._color = tuple(store._colors[index].tolist())
+        shape._thickness = float(store._thickness[index])
+        shape.selected = False
+        shape._original_points = shape._transformed_points = None
+        shape._transform_matrix = None
+        ellipse = store._ellipses[index]
+        shape.ellipse = None if np.isnan(ellipse[0]) else tuple(ellipse.tolist())
+        shape._center = None
+        shape._bounds = None
+        shape._transformed_center = None
+        shape._dirty = False
+        shape._recompute_counts = {'matrix': 0, 'points': 0, 'bbox': 0, 'center': 0}
+        dx, dy, angle, sx, sy = store._params[index].tolist()
+        shape._drag_offset = _TrackedVector([dx, dy], shape)
+        shape._rotation_angle = angle
+        shape._scale_factor = _TrackedVector([sx, sy], shape)
+        return shape
+
+    def transform_params(self):
+        return (self.drag_offset[0], self.drag_offset[1], self.rotation_angle,
+                self.scale_factor[0], self.scale_factor[1])
+
+    def compute_transform(self):
+        """Compose scale -> rotate -> translate into one 3x3 matrix"""
+        self._recompute_counts['matrix'] += 1
         transform = np.identity(3)
         
         # 1. Scaling
@@ -53,29 +337,57 @@ class Shape:
             [0, 1, self.drag_offset[1]],
             [0, 0, 1]
         ])
-        transform = np.dot(translation_mat, transform)
-        
-        # Apply final transformation
-        self.transform_matrix = transform
-        self.apply_transform()
+        return np.dot(translation_mat, transform)
+    
+    def retessellate(self):
+        """Rebuild an ellipse outline if its on-screen size changed enough"""
+        if self.ellipse is None:
+            return False
+        cx, cy, rx, ry = self.ellipse
+        # On-screen size: own scale times the view zoom the store is drawn at
+        zoom = self.store.zoom if self.store is not None else 1.0
+        scale = max(abs(self.scale_factor[0]), abs(self.scale_factor[1])) * zoom
+        wanted = ellipse_segments(rx, ry, scale)
+        if not needs_retessellation(wanted, len(self.original_points)):
+            return False
+        points = tessellate_ellipse(cx, cy, rx, ry, wanted)
+        if self.store is not None:
+            self.store.replace_points(self.index, points)
+        else:
+            self._original_points = points.copy()
+            self._transformed_points = points.copy()
+        self._center = None
+        return True
     
     def apply_transform(self):
         """Apply current transformation matrix to points"""
-        for i in range(len(self.original_points)):
-            point = np.append(self.original_points[i], 1)  # Convert to homogeneous
-            transformed = np.dot(self.transform_matrix, point)
-            self.transformed_points[i] = transformed[:2]
+        if self.store is not None:
+            self.store.flush()
+            return
+        if self._dirty:
+            self.retessellate()
+            self._transform_matrix = self.compute_transform()
+            self._dirty = False
+        m = self._transform_matrix
+        self._transformed_points[:] = self._original_points @ m[:2, :2].T + m[:2, 2]
+        self._recompute_counts['points'] += 1
+        self._bounds = None
+        self._transformed_center = None
     
     def get_center(self):
         """Get center of original points"""
-        return np.mean(self.original_points, axis=0)
+        if self._center is None:
+            self._center = np.mean(self.original_points, axis=0)
+        return self._center
     
-    def draw(self):
-        glColor3f(*self.color)
-        glLineWidth(self.thickness)
+    def draw(self, state=None):
+        if state is None:
+            state = GLStateCache()
+        state.color3f(*self.color)
+        state.line_width(self.thickness)
         
         if self.type == 'point':
-            glPointSize(self.thickness * 2)
+            state.point_size(self.thickness * 2)
             glBegin(GL_POINTS)
             for point in self.transformed_points:
                 glVertex2f(point[0], point[1])
@@ -90,15 +402,22 @@ class Shape:
             for point in self.transformed_points:
                 glVertex2f(point[0], point[1])
             glEnd()
+        elif self.type == 'polyline':
+            glBegin(GL_LINE_STRIP)
+            for point in self.transformed_points:
+                glVertex2f(point[0], point[1])
+            glEnd()
         
         # Draw selection handles
         if self.selected:
-            self.draw_selection_handles()
+            self.draw_selection_handles(state)
     
-    def draw_selection_handles(self):
+    def draw_selection_handles(self, state=None):
         """Draw transformation handles when selected"""
-        glColor3f(1.0, 1.0, 0.0)  # Yellow
-        glPointSize(8)
+        if state is None:
+            state = GLStateCache()
+        state.color3f(1.0, 1.0, 0.0)  # Yellow
+        state.point_size(8)
         glBegin(GL_POINTS)
         
         # Draw center point
@@ -114,25 +433,1562 @@ class Shape:
     
     def get_transformed_center(self):
         """Get center after transformations"""
-        return np.mean(self.transformed_points, axis=0)
+        self._ensure_clean()
+        if self.store is not None:
+            return self.store.centers[self.index]
+        if self._transformed_center is None:
+            self._recompute_counts['center'] += 1
+            self._transformed_center = np.mean(self._transformed_points, axis=0)
+        return self._transformed_center
     
     def get_bounding_box(self):
         """Get bounding box of transformed shape (min_x, min_y, max_x, max_y)"""
-        if len(self.transformed_points) == 0:
+        self._ensure_clean()
+        if self.store is not None:
+            return tuple(self.store.bounds[self.index])
+        if len(self._transformed_points) == 0:
             return (0, 0, 0, 0)
-        min_x = min(p[0] for p in self.transformed_points)
-        min_y = min(p[1] for p in self.transformed_points)
-        max_x = max(p[0] for p in self.transformed_points)
-        max_y = max(p[1] for p in self.transformed_points)
-        return (min_x, min_y, max_x, max_y)
+        if self._bounds is None:
+            self._recompute_counts['bbox'] += 1
+            lo = self._transformed_points.min(axis=0)
+            hi = self._transformed_points.max(axis=0)
+            self._bounds = (lo[0], lo[1], hi[0], hi[1])
+        return self._bounds
     
-    def is_point_inside(self, point):
-        """Check if point is inside shape (simple bounding box check)"""
-        bounds = self.get_bounding_box()
-        return bounds[0] <= point[0] <= bounds[2] and bounds[1] <= point[1] <= bounds[3]
+    def is_point_inside(self, point, tolerance=3.0):
+        """Check if point hits the shape (exact, with a pick tolerance)"""
+        points = self.transformed_points
+        return bool(hit_test([SHAPE_KINDS[self.type]], [self.thickness], points,
+                             [len(points)], point, tolerance)[0])
+    
+    @property
+    def group(self):
+        """Group directly containing this shape, or None"""
+        if self.store is None:
+            return None
+        return self.store.group_of(self.index)
+
+class Group:
+    """Node that transforms a set of shapes and nested groups as one.
+
+    drag_offset, rotation_angle and scale_factor build the group's local
+    matrix like a shape's (rotation about the group's pivot), applied on
+    top of the children's own transforms: world = parent world @ local.
+    Editing them only marks the group dirty; the store's next flush
+    recomputes the world matrices of the dirty subtree and re-transforms
+    every shape below it in one batch.
+    """
+    type = 'group'
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self._load_params()
+
+    def _load_params(self):
+        dx, dy, angle, sx, sy = self.store._group_params[self.index].tolist()
+        self._drag_offset = _TrackedVector([dx, dy], self)
+        self._rotation_angle = angle
+        self._scale_factor = _TrackedVector([sx, sy], self)
+
+    @property
+    def drag_offset(self):
+        return self._drag_offset
+
+    @drag_offset.setter
+    def drag_offset(self, value):
+        self._drag_offset = _TrackedVector(value, self)
+        self.invalidate()
+
+    @property
+    def rotation_angle(self):
+        return self._rotation_angle
+
+    @rotation_angle.setter
+    def rotation_angle(self, value):
+        self._rotation_angle = value
+        self.invalidate()
+
+    @property
+    def scale_factor(self):
+        return self._scale_factor
+
+    @scale_factor.setter
+    def scale_factor(self, value):
+        self._scale_factor = _TrackedVector(value, self)
+        self.invalidate()
+
+    def invalidate(self):
+        if self.store is not None:
+            self.store.mark_group_dirty(self.index)
+
+    def update_transform(self):
+        self.invalidate()
+
+    def transform_params(self):
+        return (self.drag_offset[0], self.drag_offset[1], self.rotation_angle,
+                self.scale_factor[0], self.scale_factor[1])
+
+    @property
+    def parent(self):
+        parent = self.store._group_parent[self.index]
+        return self.store.groups[parent] if parent >= 0 else None
+
+    @property
+    def pivot(self):
+        return self.store._group_pivots[self.index].copy()
+
+    @property
+    def world_matrix(self):
+        self.store.flush()
+        return self.store._group_world[self.index]
+
+    def shape_ids(self):
+        """Store indices of every shape in this group and its subgroups"""
+        return self.store.subtree_shape_ids(self.index)
+
+    def get_bounding_box(self):
+        """Union of the transformed AABBs of all shapes below the group"""
+        b = self.store.bounds[self.shape_ids()]
+        if len(b) == 0:
+            return (0, 0, 0, 0)
+        return (b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max())
+
+    def get_transformed_center(self):
+        x0, y0, x1, y1 = self.get_bounding_box()
+        return np.array([(x0 + x1) / 2, (y0 + y1) / 2], dtype=np.float32)
+
+class SpatialGrid:
+    """Uniform grid over shape AABBs for broad-phase hit testing.
+
+    The bulk of the grid is a sorted (cell key, shape id) table that is
+    rebuilt with NumPy in one pass. Shapes that move afterwards are flagged
+    stale in that table and re-inserted into a small dict overlay, which
+    is folded back into the table once it grows too big. Shapes spanning
+    more than MAX_CELLS cells live in a separate list that every query
+    tests directly.
+    """
+    MAX_CELLS = 64
+
+    def __init__(self, cell_size=64.0):
+        self.cell_size = float(cell_size)
+        self.query_count = 0
+        self.candidate_count = 0
+        self.rebuild_count = 0
+        self.clear()
+
+    def clear(self):
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._table_size = 0            # shapes covered by the sorted table
+        self._stale = np.zeros(0, dtype=bool)
+        self._overlay = {}              # cell key -> set of shape ids
+        self._overlay_cells = {}        # shape id -> cell keys in overlay
+        self._large = set()
+
+    @staticmethod
+    def _key(cx, cy):
+        return (np.asarray(cx, dtype=np.int64) << 32) + (np.asarray(cy, dtype=np.int64) & 0xffffffff)
+
+    def _cell_ranges(self, bounds):
+        cells = np.floor(np.asarray(bounds, dtype=np.float64) / self.cell_size).astype(np.int64)
+        return cells[:, 0], cells[:, 1], cells[:, 2], cells[:, 3]
+
+    def rebuild(self, bounds):
+        """Re-index every shape from an (N, 4) array of AABBs"""
+        n = len(bounds)
+        self.clear()
+        self.rebuild_count += 1
+        if n == 0:
+            return
+        # Size cells after the typical shape so most shapes touch few cells
+        extent = np.median(np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]))
+        self.cell_size = float(min(max(extent * 2, 16.0), 1024.0))
+
+        x0, y0, x1, y1 = self._cell_ranges(bounds)
+        w = x1 - x0 + 1
+        counts = w * (y1 - y0 + 1)
+        large = counts > self.MAX_CELLS
+        self._large = set(np.nonzero(large)[0].tolist())
+        counts[large] = 0
+
+        ids = np.repeat(np.arange(n), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = x0[ids] + local % w[ids]
+        cy = y0[ids] + local // w[ids]
+        keys = self._key(cx, cy)
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._ids = ids[order]
+        self._table_size = n
+        self._stale = np.zeros(n, dtype=bool)
+
+    def _discard(self, shape_id):
+        self._large.discard(shape_id)
+        for key in self._overlay_cells.pop(shape_id, ()):
+            bucket = self._overlay[key]
+            bucket.discard(shape_id)
+            if not bucket:
+                del self._overlay[key]
+        if shape_id < self._table_size:
+            self._stale[shape_id] = True
+
+    def update(self, ids, bounds):
+        """Re-insert shapes whose AABB changed (or that were just added)"""
+        if len(ids) == 0:
+            return
+        x0, y0, x1, y1 = self._cell_ranges(bounds)
+        for i, shape_id in enumerate(np.asarray(ids).tolist()):
+            self._discard(shape_id)
+            if (x1[i] - x0[i] + 1) * (y1[i] - y0[i] + 1) > self.MAX_CELLS:
+                self._large.add(shape_id)
+                continue
+            keys = [int(k) for k in self._key(*np.meshgrid(np.arange(x0[i], x1[i] + 1),
+                                                            np.arange(y0[i], y1[i] + 1))).ravel()]
+            for key in keys:
+                self._overlay.setdefault(key, set()).add(shape_id)
+            self._overlay_cells[shape_id] = keys
+
+    def needs_rebuild(self, n, incoming=0):
+        return len(self._overlay_cells) + incoming > max(1024, n // 8)
+
+    def remove(self, shape_id):
+        """Forget a shape and shift the ids of the shapes above it down"""
+        self._discard(shape_id)
+        keep = self._ids != shape_id
+        self._keys = self._keys[keep]
+        self._ids = self._ids[keep]
+        self._ids[self._ids > shape_id] -= 1
+        if shape_id < self._table_size:
+            self._stale = np.delete(self._stale, shape_id)
+            self._table_size -= 1
+
+        def shift(i):
+            return i - 1 if i > shape_id else i
+        self._large = {shift(i) for i in self._large}
+        self._overlay = {key: {shift(i) for i in bucket} for key, bucket in self._overlay.items()}
+        self._overlay_cells = {shift(i): keys for i, keys in self._overlay_cells.items()}
+
+    def _query_cells(self, x0, y0, x1, y1, n):
+        """Candidate ids for a block of cells, or None when a scan of all n is cheaper.
+
+        Keys sort by column, then row (negative rows after the others), so
+        each column of the block is one or two slices of the sorted table.
+        """
+        columns = np.arange(x0, x1 + 1)
+        if len(columns) > n:
+            return None
+        rows = [(y0, y1)] if y0 >= 0 or y1 < 0 else [(y0, -1), (0, y1)]
+        lo = np.concatenate([np.searchsorted(self._keys, self._key(columns, a)) for a, _ in rows])
+        hi = np.concatenate([np.searchsorted(self._keys, self._key(columns, b), side='right')
+                             for _, b in rows])
+        counts = hi - lo
+        total = int(counts.sum())
+        if total > n:
+            return None
+        found = self._ids[np.arange(total) + np.repeat(lo - (np.cumsum(counts) - counts), counts)]
+        found = found[~self._stale[found]]
+        extra = set(self._large)
+        if len(columns) * (y1 - y0 + 1) <= len(self._overlay):
+            cx, cy = np.meshgrid(columns, np.arange(y0, y1 + 1))
+            for key in self._key(cx, cy).ravel().tolist():
+                extra.update(self._overlay.get(key, ()))
+        else:
+            # Fewer moved shapes than cells: let the AABB test sort them out
+            extra.update(self._overlay_cells)
+        if extra:
+            found = np.concatenate([found, np.fromiter(extra, dtype=np.int64, count=len(extra))])
+        return np.unique(found)
+
+    def query_rect(self, rect, bounds):
+        """Ids of shapes whose AABB overlaps rect, topmost (highest id) first"""
+        self.query_count += 1
+        x0, y0, x1, y1 = (int(v) for v in np.floor(np.asarray(rect, dtype=np.float64) / self.cell_size))
+        candidates = self._query_cells(x0, y0, x1, y1, len(bounds))
+        # Region covering most of the scene: a vectorized scan is cheaper
+        b = bounds if candidates is None else bounds[candidates]
+        self.candidate_count += len(b)
+        hit = (b[:, 0] <= rect[2]) & (b[:, 2] >= rect[0]) & (b[:, 1] <= rect[3]) & (b[:, 3] >= rect[1])
+        return np.flatnonzero(hit)[::-1] if candidates is None else candidates[hit][::-1]
+
+    def query_point(self, point, bounds):
+        """Ids of shapes whose AABB contains point, topmost first"""
+        x, y = point
+        return self.query_rect((x, y, x, y), bounds)
+
+class ShapeStore:
+    """List of shapes whose vertices live in one contiguous float32 buffer.
+
+    Every shape owns the range offsets[i]:offsets[i]+counts[i] of the
+    original/transformed vertex buffers and one 3x3 matrix, so any subset
+    of shapes can be re-transformed with a single batched matmul.
+    Shapes whose transform changed are only marked dirty; the next read
+    flushes all of them together and refreshes their cached AABB/center.
+
+    Shapes can be nested in Groups. A shape's matrix is then its parent
+    group's cached world matrix times its own local matrix; group world
+    matrices are only recomputed along dirty subtrees.
+    """
+    _PER_SHAPE = ('_offsets', '_counts', '_matrices', '_locals', '_parents', '_bounds', '_centers',
+                  '_rebuilds', '_kinds', '_thickness', '_colors', '_params', '_ellipses')
+    _PER_GROUP = ('_group_parent', '_group_depth', '_group_params', '_group_pivots', '_group_base',
+                  '_group_local', '_group_world', '_group_rebuilds')
+
+    def __init__(self, vertex_capacity=1024, shape_capacity=256):
+        self._original = np.zeros((vertex_capacity, 2), dtype=np.float32)
+        self._transformed = np.zeros((vertex_capacity, 2), dtype=np.float32)
+        self._offsets = np.zeros(shape_capacity, dtype=np.int64)
+        self._counts = np.zeros(shape_capacity, dtype=np.int64)
+        self._matrices = np.zeros((shape_capacity, 3, 3), dtype=np.float64)
+        self._locals = np.zeros((shape_capacity, 3, 3), dtype=np.float64)
+        self._parents = np.full(shape_capacity, -1, dtype=np.int64)  # group id, -1 at the top level
+        self._bounds = np.zeros((shape_capacity, 4), dtype=np.float32)
+        self._centers = np.zeros((shape_capacity, 2), dtype=np.float32)
+        self._rebuilds = np.zeros(shape_capacity, dtype=np.int64)
+        self._kinds = np.zeros(shape_capacity, dtype=np.uint8)
+        self._thickness = np.zeros(shape_capacity, dtype=np.float32)
+        self._colors = np.zeros((shape_capacity, 3), dtype=np.float32)
+        # drag_offset x/y, rotation_angle, scale_factor x/y as of the last flush
+        self._params = np.zeros((shape_capacity, 5), dtype=np.float64)
+        self._ellipses = np.full((shape_capacity, 4), np.nan, dtype=np.float32)
+        self.max_thickness = 0.0
+        # View zoom ellipses are tessellated for (see update_tessellation)
+        self.zoom = 1.0
+        self._tessellated_view = None
+        self._shapes = []
+        self._dirty = set()
+        self.vertex_count = 0
+        self.garbage = 0    # vertices orphaned by shapes that were relocated
+        self.flush_count = 0
+        self.grid = SpatialGrid()
+        self._init_groups()
+        # Renderer bookkeeping: bumped on any change to draw order/state,
+        # plus the shapes whose transformed vertices changed since last taken
+        self.structure_version = 0
+        self._changed = []
+
+    def _init_groups(self, capacity=16):
+        self._group_parent = np.full(capacity, -1, dtype=np.int64)
+        self._group_depth = np.zeros(capacity, dtype=np.int64)
+        self._group_params = np.zeros((capacity, 5), dtype=np.float64)
+        self._group_pivots = np.zeros((capacity, 2), dtype=np.float64)
+        self._group_base = np.zeros((capacity, 3, 3), dtype=np.float64)
+        self._group_local = np.zeros((capacity, 3, 3), dtype=np.float64)
+        self._group_world = np.zeros((capacity, 3, 3), dtype=np.float64)
+        self._group_rebuilds = np.zeros(capacity, dtype=np.int64)
+        self._groups = []
+        self._dirty_groups = set()
+        self._members = None    # cached (order, starts) of shapes by parent group
+
+    # Views trimmed to the live part of the buffers
+    @property
+    def original(self):
+        return self._original[:self.vertex_count]
+
+    @property
+    def transformed(self):
+        self.flush()
+        return self._transformed[:self.vertex_count]
+
+    @property
+    def offsets(self):
+        return self._offsets[:len(self._shapes)]
+
+    @property
+    def counts(self):
+        return self._counts[:len(self._shapes)]
+
+    @property
+    def matrices(self):
+        self.flush()
+        return self._matrices[:len(self._shapes)]
+
+    @property
+    def bounds(self):
+        """(N, 4) array of transformed AABBs: min_x, min_y, max_x, max_y"""
+        self.flush()
+        return self._bounds[:len(self._shapes)]
+
+    @property
+    def centers(self):
+        self.flush()
+        return self._centers[:len(self._shapes)]
+
+    @property
+    def rebuild_counts(self):
+        """How often each shape's points/AABB/center have been rebuilt"""
+        return self._rebuilds[:len(self._shapes)]
+
+    @property
+    def groups(self):
+        return self._groups
+
+    @property
+    def parents(self):
+        return self._parents[:len(self._shapes)]
+
+    @property
+    def group_rebuild_counts(self):
+        """How often each group's world matrix has been recomputed"""
+        return self._group_rebuilds[:len(self._groups)]
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __iter__(self):
+        for i in range(len(self._shapes)):
+            yield self[i]
+
+    def __reversed__(self):
+        for i in range(len(self._shapes) - 1, -1, -1):
+            yield self[i]
+
+    def __getitem__(self, index):
+        shape = self._shapes[index]
+        if shape is None:
+            # Loaded from a scene file and not touched from Python yet
+            index = range(len(self._shapes))[index]
+            shape = self._shapes[index] = Shape.from_store(self, index)
+        return shape
+
+    @property
+    def materialized_count(self):
+        return sum(shape is not None for shape in self._shapes)
+
+    def __bool__(self):
+        return bool(self._shapes)
+
+    def original_points(self, index):
+        start = self._offsets[index]
+        return self._original[start:start + self._counts[index]]
+
+    def transformed_points(self, index):
+        start = self._offsets[index]
+        return self._transformed[start:start + self._counts[index]]
+
+    def _reserve(self, extra_vertices, extra_shapes=1):
+        needed = self.vertex_count + extra_vertices
+        if needed > len(self._original):
+            capacity = max(needed, 2 * len(self._original))
+            for name in ('_original', '_transformed'):
+                old = getattr(self, name)
+                grown = np.zeros((capacity, 2), dtype=np.float32)
+                grown[:self.vertex_count] = old[:self.vertex_count]
+                setattr(self, name, grown)
+
+        needed = len(self._shapes) + extra_shapes
+        if needed > len(self._offsets):
+            capacity = max(needed, 2 * len(self._offsets))
+            n = len(self._shapes)
+            for name in self._PER_SHAPE:
+                old = getattr(self, name)
+                grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:n] = old[:n]
+                setattr(self, name, grown)
+
+    def _reserve_groups(self, extra=1):
+        needed = len(self._groups) + extra
+        if needed > len(self._group_parent):
+            capacity = max(needed, 2 * len(self._group_parent))
+            n = len(self._groups)
+            for name in self._PER_GROUP:
+                old = getattr(self, name)
+                grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:n] = old[:n]
+                setattr(self, name, grown)
+
+    def append(self, shape):
+        """Move a shape's vertices into the store and take ownership of it"""
+        if shape.store is not None:
+            raise ValueError("shape already belongs to a ShapeStore")
+        points = shape.original_points
+        count = len(points)
+        self._reserve(count)
+
+        index = len(self._shapes)
+        start = self.vertex_count
+        self._original[start:start + count] = points
+        self._offsets[index] = start
+        self._counts[index] = count
+        self._rebuilds[index] = 0
+        self._kinds[index] = SHAPE_KINDS[shape.type]
+        self._thickness[index] = shape.thickness
+        self._colors[index] = shape.color
+        self._params[index] = shape.transform_params()
+        self._parents[index] = -1
+        self._ellipses[index] = shape.ellipse if shape.ellipse is not None else np.nan
+        self.max_thickness = max(self.max_thickness, shape.thickness)
+        self.vertex_count += count
+        self._shapes.append(shape)
+        self.structure_version += 1
+
+        shape.store = self
+        shape.index = index
+        shape._original_points = shape._transformed_points = None
+        shape._dirty = True
+        self._dirty.add(index)
+        return shape
+
+    def extend(self, shapes):
+        for shape in shapes:
+            self.append(shape)
+
+    def _detach(self, shape):
+        """Hand a shape its own copy of the geometry again"""
+        index = shape.index
+        shape._original_points = self.original_points(index).copy()
+        shape._transformed_points = self.transformed_points(index).copy()
+        shape._transform_matrix = self._matrices[index].copy()
+        shape._bounds = None
+        shape._transformed_center = None
+        shape._recompute_counts = shape.recompute_counts
+        shape.store = None
+        shape.index = -1
+
+    def remove(self, shape):
+        """Remove a shape and compact the vertex buffers"""
+        self.flush()
+        index = shape.index
+        parent = self._parents[index]
+        if parent >= 0:
+            # The detached shape keeps its on-screen geometry
+            self._bake_shapes(np.array([index]), self._group_world[parent])
+            self._parents[index] = -1
+            self._compose(np.array([index]))
+        start = self._offsets[index]
+        count = self._counts[index]
+        end = self.vertex_count
+        n = len(self._shapes)
+        self._detach(shape)
+
+        for buf in (self._original, self._transformed):
+            buf[start:end - count] = buf[start + count:end]
+        for name in self._PER_SHAPE:
+            arr = getattr(self, name)
+            arr[index:n - 1] = arr[index + 1:n]
+        offsets = self._offsets[:n - 1]
+        offsets[offsets > start] -= count
+        self.vertex_count -= count
+        self.grid.remove(index)
+        self.structure_version += 1
+        self._changed = []
+        del self._shapes[index]
+        self._members = None
+        for i in range(index, n - 1):
+            if self._shapes[i] is not None:
+                self._shapes[i].index = i
+
+    def clear(self):
+        self.flush()
+        for shape in self._shapes:
+            if shape is not None:
+                self._detach(shape)
+        self._shapes = []
+        self.vertex_count = 0
+        self.garbage = 0
+        self.max_thickness = 0.0
+        self.grid.clear()
+        self._init_groups()
+        self.structure_version += 1
+        self._changed = []
+
+    @classmethod
+    def from_arrays(cls, original, offsets, counts, kinds, colors, thickness, params, ellipses,
+                    parents=None, groups=None):
+        """Adopt whole-scene arrays without creating any Shape objects.
+
+        original is used as-is (it may be a memory map); Shape objects are
+        only created when an index is first accessed from Python. parents
+        and groups (a SCENE_GROUP table) restore the group hierarchy.
+        """
+        n = len(offsets)
+        store = cls(vertex_capacity=0, shape_capacity=n)
+        store._original = original
+        store._transformed = np.empty((len(original), 2), dtype=np.float32)
+        store.vertex_count = len(original)
+        store._offsets[:] = offsets
+        store._counts[:] = counts
+        store._kinds[:] = kinds
+        store._colors[:] = colors
+        store._thickness[:] = thickness
+        store._params[:] = params
+        store._ellipses[:] = ellipses
+        store._shapes = [None] * n
+        store.max_thickness = float(store._thickness.max()) if n else 0.0
+        if parents is not None:
+            store._parents[:] = parents
+        if groups is not None and len(groups):
+            store._reserve_groups(len(groups))
+            count = len(groups)
+            store._group_parent[:count] = groups['parent']
+            store._group_params[:count] = groups['params']
+            store._group_pivots[:count] = groups['pivot']
+            store._group_base[:count, :2] = groups['base']
+            store._group_base[:count, 2, 2] = 1.0
+            store._groups = [Group(store, i) for i in range(count)]
+            store._update_depths()
+            store._dirty_groups = set(range(count))
+            store._refresh_groups()
+        if n:
+            # Centers of the original points, then all matrices in one go
+            verts, _ = store._vertex_indices(np.arange(n))
+            starts = np.cumsum(store._counts) - store._counts
+            centers = np.add.reduceat(original[verts], starts, axis=0) / store._counts[:, None]
+            store._locals[:] = compose_transforms(store._params, centers)
+            store._compose(np.arange(n))
+            store.transform()
+        return store
+
+    def set_style(self, index, color=None, thickness=None):
+        if color is not None:
+            self._colors[index] = color
+        if thickness is not None:
+            self._thickness[index] = thickness
+            self.max_thickness = max(self.max_thickness, thickness)
+        self.structure_version += 1
+
+    def take_changed(self):
+        """Indices of shapes re-transformed since the last call"""
+        self.flush()
+        changed = np.unique(np.concatenate(self._changed)) if self._changed else np.zeros(0, dtype=np.int64)
+        self._changed = []
+        return changed
+
+    @property
+    def kinds(self):
+        return self._kinds[:len(self._shapes)]
+
+    @property
+    def colors(self):
+        return self._colors[:len(self._shapes)]
+
+    @property
+    def thickness(self):
+        return self._thickness[:len(self._shapes)]
+
+    def mark_dirty(self, index):
+        self._dirty.add(index)
+
+    def update_tessellation(self, zoom, rect=None):
+        """Set the view zoom and re-tessellate the ellipses in rect that need it.
+
+        Only outlines whose wanted segment count left the hysteresis band
+        are marked dirty; the next flush rebuilds them. Ellipses outside
+        rect (default: everywhere) keep their outline until they are
+        edited or come into view.
+        """
+        self.zoom = zoom
+        if (zoom, rect) == self._tessellated_view:
+            return
+        self._tessellated_view = (zoom, rect)
+        ids = np.arange(len(self._shapes)) if rect is None else self.query_rect(*rect)
+        ids = ids[~np.isnan(self._ellipses[ids, 0])]
+        if len(ids) == 0:
+            return
+        radius = np.abs(self._ellipses[ids, 2:4]).max(axis=1) * np.abs(self._params[ids, 3:5]).max(axis=1)
+        wanted = ellipse_segment_counts(radius * zoom)
+        for i in ids[needs_retessellation(wanted, self._counts[ids])].tolist():
+            self.mark_dirty(i)
+
+    def mark_group_dirty(self, index):
+        self._dirty_groups.add(index)
+
+    def flush(self):
+        """Rebuild matrices, points, AABBs and centers of all dirty shapes and groups"""
+        if not self._dirty and not self._dirty_groups:
+            return
+        ids = np.fromiter(self._dirty, dtype=np.int64, count=len(self._dirty))
+        self._dirty = set()
+        for i in ids:
+            shape = self._shapes[i]
+            shape.retessellate()
+            self._locals[i] = shape.compute_transform()
+            self._params[i] = shape.transform_params()
+            shape._dirty = False
+        if self._dirty_groups:
+            below = self._refresh_groups()
+            ids = np.union1d(ids, below) if len(ids) else below
+        self._compose(ids)
+        self.transform(ids)
+        self.flush_count += 1
+
+    def _compose(self, ids):
+        """World matrices of shapes: parent group's world @ the shape's local matrix"""
+        m = self._locals[ids]
+        parents = self._parents[ids]
+        inner = parents >= 0
+        if inner.any():
+            m[inner] = self._group_world[parents[inner]] @ m[inner]
+        self._matrices[ids] = m
+
+    def _subtree_mask(self, mask):
+        """Extend a boolean mask over groups to all their descendants"""
+        ng = len(self._groups)
+        mask = np.append(mask, False)   # slot ng stands for "no parent"
+        parent = np.where(self._group_parent[:ng] >= 0, self._group_parent[:ng], ng)
+        depth = self._group_depth[:ng]
+        for level in range(1, int(depth.max()) + 1 if ng else 0):
+            at = np.flatnonzero(depth == level)
+            mask[at] |= mask[parent[at]]
+        return mask[:ng]
+
+    def _shapes_in(self, groups):
+        """Ids of the shapes directly inside the given groups"""
+        order, starts = self._membership()
+        parts = [order[starts[g]:starts[g + 1]] for g in groups.tolist()]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def _membership(self):
+        """Shapes sorted by parent group: members of g are order[starts[g]:starts[g + 1]]"""
+        if self._members is None:
+            parents = self.parents
+            grouped = np.flatnonzero(parents >= 0)
+            order = grouped[np.argsort(parents[grouped], kind='stable')]
+            sizes = np.bincount(parents[grouped], minlength=len(self._groups))
+            self._members = (order, np.r_[0, np.cumsum(sizes)])
+        return self._members
+
+    def _refresh_groups(self):
+        """Recompute world matrices of dirty groups and their subtrees.
+
+        Groups are visited one depth level at a time, so a level costs one
+        batched matmul. Returns the ids of the shapes whose parent's world
+        matrix changed.
+        """
+        ng = len(self._groups)
+        changed = np.fromiter(self._dirty_groups, dtype=np.int64, count=len(self._dirty_groups))
+        self._dirty_groups = set()
+        for g in changed.tolist():
+            self._group_params[g] = self._groups[g].transform_params()
+        self._group_local[changed] = (compose_transforms(self._group_params[changed],
+                                                         self._group_pivots[changed])
+                                      @ self._group_base[changed])
+
+        mask = np.zeros(ng, dtype=bool)
+        mask[changed] = True
+        mask = self._subtree_mask(mask)
+        depth = self._group_depth[:ng]
+        for level in range(int(depth[mask].max()) + 1 if mask.any() else 0):
+            at = np.flatnonzero(mask & (depth == level))
+            if len(at) == 0:
+                continue
+            world = self._group_local[at]
+            parents = self._group_parent[at]
+            inner = parents >= 0
+            world[inner] = self._group_world[parents[inner]] @ world[inner]
+            self._group_world[at] = world
+            self._group_rebuilds[at] += 1
+        return self._shapes_in(np.flatnonzero(mask))
+
+    def _update_depths(self):
+        ng = len(self._groups)
+        parent = self._group_parent[:ng]
+        depth = np.zeros(ng, dtype=np.int64)
+        up = parent.copy()
+        while (up >= 0).any():
+            inner = up >= 0
+            depth[inner] += 1
+            up[inner] = parent[up[inner]]
+        self._group_depth[:ng] = depth
+
+    def group_of(self, index):
+        parent = self._parents[index]
+        return self._groups[parent] if parent >= 0 else None
+
+    def children(self, group):
+        """Direct child shapes and groups of a group"""
+        shapes = [self._shapes[i] for i in np.flatnonzero(self.parents == group.index).tolist()]
+        groups = [g for g in self._groups if g is not group and self._group_parent[g.index] == group.index]
+        return shapes, groups
+
+    def subtree_shape_ids(self, group_index):
+        """Ids of every shape below a group, nested groups included"""
+        mask = np.zeros(len(self._groups), dtype=bool)
+        mask[group_index] = True
+        return self._shapes_in(np.flatnonzero(self._subtree_mask(mask)))
+
+    def top_level_nodes(self, shapes):
+        """Outermost group of each shape (or the shape itself if ungrouped), without duplicates"""
+        shapes = [shape for shape in shapes if shape.store is self]
+        ids = np.fromiter((shape.index for shape in shapes), dtype=np.int64, count=len(shapes))
+        roots = self._parents[ids]
+        while True:
+            inner = roots >= 0
+            up = np.where(inner, self._group_parent[np.maximum(roots, 0)], -1)
+            climb = inner & (up >= 0)
+            if not climb.any():
+                break
+            roots[climb] = up[climb]
+        nodes = [shape for shape, root in zip(shapes, roots.tolist()) if root < 0]
+        return nodes + [self._groups[g] for g in np.unique(roots[roots >= 0]).tolist()]
+
+    def group(self, shapes=(), groups=(), handle=None, pivot=None):
+        """Put shapes and/or groups that share one parent into a new group; returns it.
+
+        The new group starts with an identity transform, so nothing moves.
+        Its pivot is the center of its members' combined bounds unless given
+        (in the parent's space). A Group handle dissolved earlier may be
+        passed to bring it back (undo/redo).
+        """
+        self.flush()
+        shape_ids = np.fromiter((shape.index for shape in shapes), dtype=np.int64)
+        group_ids = np.fromiter((group.index for group in groups), dtype=np.int64)
+        if len(shape_ids) + len(group_ids) == 0:
+            raise ValueError("nothing to group")
+        parents = np.unique(np.concatenate([self._parents[shape_ids], self._group_parent[group_ids]]))
+        if len(parents) != 1:
+            raise ValueError("grouped shapes and groups must share the same parent")
+        parent = int(parents[0])
+
+        ids = np.concatenate([shape_ids] + [self.subtree_shape_ids(g) for g in group_ids.tolist()])
+        b = self._bounds[ids]
+        center = np.array([0.0, 0.0, 1.0])
+        if len(b):
+            center[:2] = (b[:, :2].min(axis=0) + b[:, 2:].max(axis=0)) / 2
+        outer = self._group_world[parent] if parent >= 0 else np.identity(3)
+
+        self._reserve_groups(1)
+        index = len(self._groups)
+        self._group_parent[index] = parent
+        self._group_params[index] = (0.0, 0.0, 0.0, 1.0, 1.0)
+        self._group_pivots[index] = (np.linalg.inv(outer) @ center)[:2] if pivot is None else pivot
+        self._group_base[index] = np.identity(3)
+        self._group_local[index] = np.identity(3)
+        self._group_world[index] = outer
+        self._group_rebuilds[index] = 0
+        if handle is None:
+            group = Group(self, index)
+        else:
+            group = handle
+            group.store, group.index = self, index
+            group._load_params()
+        self._groups.append(group)
+        self._parents[shape_ids] = index
+        self._group_parent[group_ids] = index
+        self._update_depths()
+        self._members = None
+        return group
+
+    def ungroup(self, group):
+        """Dissolve a group, handing its children to its parent without moving them.
+
+        A transformed group's matrix is baked in: child shapes get it
+        applied to their vertices (their own transform resets, and ellipses
+        become plain polygons), child groups fold it into their base matrix.
+        Returns whether baking was needed.
+        """
+        self.flush()
+        index = group.index
+        parent = self._group_parent[index]
+        local = self._group_local[index].copy()
+        baked = not np.array_equal(local, np.identity(3))
+        shape_ids = self._shapes_in(np.array([index]))
+        if baked:
+            self._bake_shapes(shape_ids, local)
+        self._parents[shape_ids] = parent
+
+        ng = len(self._groups)
+        children = np.flatnonzero(self._group_parent[:ng] == index)
+        for child in children.tolist() if baked else ():
+            inner = compose_transforms(self._group_params[child:child + 1], self._group_pivots[child:child + 1])[0]
+            pivot = local @ inner @ np.append(self._group_pivots[child], 1.0)
+            self._group_base[child] = local @ self._group_local[child]
+            self._group_local[child] = self._group_base[child]
+            self._group_pivots[child] = pivot[:2]
+            self._group_params[child] = (0.0, 0.0, 0.0, 1.0, 1.0)
+            self._groups[child]._load_params()
+        self._group_parent[children] = parent
+
+        for name in self._PER_GROUP:
+            arr = getattr(self, name)
+            arr[index:ng - 1] = arr[index + 1:ng]
+        del self._groups[index]
+        for g in self._groups[index:]:
+            g.index -= 1
+        for arr in (self._group_parent[:ng - 1], self.parents):
+            arr[arr > index] -= 1
+        group.store = None
+        self._update_depths()
+        self._members = None
+        self._compose(shape_ids)
+        self.transform(shape_ids)
+        return baked
+
+    def _bake_shapes(self, ids, matrix):
+        """Apply matrix @ local transform to the shapes' vertices and reset their transforms"""
+        if len(ids) == 0:
+            return
+        verts, counts = self._vertex_indices(ids)
+        m = np.repeat(matrix @ self._locals[ids], counts, axis=0)
+        self._original[verts] = np.einsum('vij,vj->vi', m[:, :2, :2], self._original[verts]) + m[:, :2, 2]
+        self._locals[ids] = np.identity(3)
+        self._params[ids] = (0.0, 0.0, 0.0, 1.0, 1.0)
+        self._ellipses[ids] = np.nan
+        for i in ids.tolist():
+            shape = self._shapes[i]
+            if shape is not None:
+                shape._drag_offset = _TrackedVector([0, 0], shape)
+                shape._rotation_angle = 0
+                shape._scale_factor = _TrackedVector([1.0, 1.0], shape)
+                shape.ellipse = None
+                shape._center = None
+
+    def replace_points(self, index, points):
+        """Swap a shape's original vertices, relocating it if it grows.
+
+        The caller is responsible for re-transforming the shape. Ranges
+        left behind are counted as garbage and reclaimed by compact().
+        """
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        count = len(points)
+        old = int(self._counts[index])
+        if count > old:
+            self._reserve(count, 0)
+            self._offsets[index] = self.vertex_count
+            self.vertex_count += count
+            self.garbage += old
+        else:
+            self.garbage += old - count
+        start = self._offsets[index]
+        self._original[start:start + count] = points
+        self._counts[index] = count
+        if count != old:
+            self.structure_version += 1
+        if self.garbage > max(1024, self.vertex_count // 2):
+            self.compact()
+
+    def compact(self):
+        """Pack all live vertex ranges back together in shape order"""
+        n = len(self._shapes)
+        verts, counts = self._vertex_indices(np.arange(n))
+        for buf in (self._original, self._transformed):
+            buf[:len(verts)] = buf[verts]
+        self._offsets[:n] = np.cumsum(counts) - counts
+        self.vertex_count = len(verts)
+        self.garbage = 0
+        self.structure_version += 1
+
+    def _vertex_indices(self, ids):
+        """Flat vertex indices covering the ranges of the given shapes"""
+        counts = self._counts[ids]
+        starts = np.cumsum(counts) - counts
+        return np.arange(counts.sum()) - np.repeat(starts - self._offsets[ids], counts), counts
+
+    def transform(self, ids=None):
+        """Re-transform one shape, a selection or (ids=None) every shape"""
+        n = len(self._shapes)
+        if n == 0:
+            return
+        ids = np.arange(n) if ids is None else np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if len(ids) == 0:
+            return
+        verts, counts = self._vertex_indices(ids)
+
+        # x' = M[:2, :2] @ x + M[:2, 2] for every vertex, in one einsum
+        m = self._matrices[np.repeat(ids, counts)]
+        points = np.einsum('vij,vj->vi', m[:, :2, :2], self._original[verts]) + m[:, :2, 2]
+        self._transformed[verts] = points
+
+        # Per-shape AABB and center over the same gathered, contiguous block
+        starts = np.cumsum(counts) - counts
+        self._bounds[ids, :2] = np.minimum.reduceat(points, starts, axis=0)
+        self._bounds[ids, 2:] = np.maximum.reduceat(points, starts, axis=0)
+        self._centers[ids] = np.add.reduceat(points, starts, axis=0) / counts[:, None]
+        self._rebuilds[ids] += 1
+        if len(ids) == n:
+            self._changed = [ids]
+        else:
+            self._changed.append(ids)
+            if len(self._changed) > 256:
+                self._changed = [np.unique(np.concatenate(self._changed))]
+
+        # Keep the spatial index in step with the new AABBs
+        if len(ids) == n or self.grid.needs_rebuild(n, len(ids)):
+            self.grid.rebuild(self._bounds[:n])
+        else:
+            self.grid.update(ids, self._bounds[ids])
+
+    def query_point(self, x, y):
+        """Indices of shapes whose AABB contains (x, y), topmost first"""
+        return self.grid.query_point((x, y), self.bounds)
+
+    def query_rect(self, x0, y0, x1, y1):
+        """Indices of shapes whose AABB overlaps the rectangle, topmost first"""
+        return self.grid.query_rect((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)), self.bounds)
+
+    def pick(self, x, y, tolerance=3.0):
+        """Indices of shapes exactly under (x, y), topmost first"""
+        reach = tolerance + self.max_thickness
+        ids = self.query_rect(x - reach, y - reach, x + reach, y + reach)
+        if len(ids) == 0:
+            return ids
+        verts, counts = self._vertex_indices(ids)
+        hit = hit_test(self._kinds[ids], self._thickness[ids], self._transformed[verts],
+                       counts, (x, y), tolerance)
+        return ids[hit]
+
+    def select_in_rect(self, x0, y0, x1, y1):
+        """Indices of shapes lying completely inside a rubber-band rectangle"""
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        ids = self.query_rect(x0, y0, x1, y1)
+        b = self._bounds[ids]
+        enclosed = (b[:, 0] >= x0) & (b[:, 2] <= x1) & (b[:, 1] >= y0) & (b[:, 3] <= y1)
+        return np.sort(ids[enclosed])
+
+    def select_in_lasso(self, polygon):
+        """Indices of shapes whose vertices all lie inside a lasso polygon"""
+        polygon = np.asarray(polygon, dtype=np.float64)
+        if len(polygon) < 3:
+            return np.zeros(0, dtype=np.int64)
+        lo, hi = polygon.min(axis=0), polygon.max(axis=0)
+        ids = self.query_rect(lo[0], lo[1], hi[0], hi[1])
+        b = self._bounds[ids]
+        ids = ids[(b[:, 0] >= lo[0]) & (b[:, 2] <= hi[0]) & (b[:, 1] >= lo[1]) & (b[:, 3] <= hi[1])]
+        if len(ids) == 0:
+            return ids
+        verts, counts = self._vertex_indices(ids)
+        inside = points_in_polygon(self._transformed[verts], polygon)
+        enclosed = np.logical_and.reduceat(inside, np.cumsum(counts) - counts)
+        return np.sort(ids[enclosed])
+
+# Binary scene format (.gk2d), little endian:
+#   header  | float32 vertex blob (V, 2) | record table (N x SCENE_RECORD)
+#   [ uint64 G | group table (G x SCENE_GROUP) | int64 parent group per shape (N) ]
+# The vertex blob comes first so a writer can stream vertices out while
+# shapes arrive and append the (much smaller) record table at the end.
+# The bracketed group section (v2) is only present with SCENE_HAS_GROUPS
+# set in the header flags; files without groups are still written as v1.
+SCENE_MAGIC = b'GK2DSCN\0'
+SCENE_VERSION = 2
+SCENE_HAS_GROUPS = 1
+SCENE_HEADER = struct.Struct('<8sII4Q')  # magic, version, flags, n_shapes, n_vertices, vertex_pos, record_pos
+SCENE_RECORD = np.dtype([
+    ('vertex_offset', '<u8'),
+    ('vertex_count', '<u4'),
+    ('kind', 'u1'),
+    ('reserved', 'u1', (3,)),
+    ('color', '<f4', (3,)),
+    ('thickness', '<f4'),
+    ('params', '<f8', (5,)),    # drag_offset x/y, rotation_angle, scale_factor x/y
+    ('ellipse', '<f4', (4,)),   # cx, cy, rx, ry; NaN for other shapes
+])
+SCENE_GROUP = np.dtype([
+    ('parent', '<i8'),          # -1 at the top level
+    ('params', '<f8', (5,)),
+    ('pivot', '<f8', (2,)),
+    ('base', '<f8', (2, 3)),    # top two rows of the base matrix
+])
+
+class SceneWriter:
+    """Streams shapes into a .gk2d file chunk by chunk.
+
+    Vertices go straight to disk; only the per-shape records are kept
+    until close(), which appends them and patches the header.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(b'\0' * SCENE_HEADER.size)
+        self._records = []
+        self._parents = []
+        self._groups = None
+        self.shape_count = 0
+        self.vertex_count = 0
+
+    def write_chunk(self, points, counts, kinds, colors, thickness, params, ellipses, parents=None):
+        """Append shapes whose original vertices are concatenated in points"""
+        counts = np.asarray(counts, dtype=np.int64)
+        records = np.zeros(len(counts), dtype=SCENE_RECORD)
+        records['vertex_offset'] = self.vertex_count + np.cumsum(counts) - counts
+        records['vertex_count'] = counts
+        records['kind'] = kinds
+        records['color'] = colors
+        records['thickness'] = thickness
+        records['params'] = params
+        records['ellipse'] = ellipses
+        np.ascontiguousarray(points, dtype='<f4').tofile(self._file)
+        self._records.append(records)
+        self._parents.append(np.full(len(counts), -1, dtype='<i8') if parents is None
+                             else np.asarray(parents, dtype='<i8'))
+        self.shape_count += len(counts)
+        self.vertex_count += int(counts.sum())
+
+    def write_groups(self, groups):
+        """Store the group table (a SCENE_GROUP array); shapes refer to it by row"""
+        self._groups = np.asarray(groups, dtype=SCENE_GROUP)
+
+    def close(self):
+        record_pos = self._file.tell()
+        for records in self._records:
+            records.tofile(self._file)
+        version, flags = 1, 0
+        if self._groups is not None and len(self._groups):
+            version, flags = SCENE_VERSION, SCENE_HAS_GROUPS
+            np.array([len(self._groups)], dtype='<u8').tofile(self._file)
+            self._groups.tofile(self._file)
+            for parents in self._parents:
+                parents.tofile(self._file)
+        self._file.seek(0)
+        self._file.write(SCENE_HEADER.pack(SCENE_MAGIC, version, flags, self.shape_count,
+                                           self.vertex_count, SCENE_HEADER.size, record_pos))
+        self._file.close()
+        self._records = []
+        self._parents = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def save_scene(store, path, chunk_shapes=65536):
+    """Write a ShapeStore to path without building a second full copy"""
+    store.flush()
+    n = len(store)
+    with SceneWriter(path) as writer:
+        for start in range(0, n, chunk_shapes):
+            ids = np.arange(start, min(start + chunk_shapes, n))
+            verts, counts = store._vertex_indices(ids)
+            writer.write_chunk(store._original[verts], counts, store._kinds[ids], store._colors[ids],
+                               store._thickness[ids], store._params[ids], store._ellipses[ids],
+                               store._parents[ids])
+        ng = len(store.groups)
+        if ng:
+            groups = np.zeros(ng, dtype=SCENE_GROUP)
+            groups['parent'] = store._group_parent[:ng]
+            groups['params'] = store._group_params[:ng]
+            groups['pivot'] = store._group_pivots[:ng]
+            groups['base'] = store._group_base[:ng, :2]
+            writer.write_groups(groups)
+
+def unused_path(path):
+    """path, or path with -2, -3, ... before the extension if that exists"""
+    stem, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = f"{stem}-{n}{ext}"
+    return path
+
+def load_scene(path):
+    """Open a .gk2d file as a ShapeStore.
+
+    The vertex blob is memory-mapped copy-on-write rather than read, and
+    Shape objects are only created for shapes touched from Python, so a
+    huge drawing can be rendered and picked right after loading.
+    """
+    with open(path, 'rb') as f:
+        magic, version, flags, n_shapes, n_vertices, vertex_pos, record_pos = \
+            SCENE_HEADER.unpack(f.read(SCENE_HEADER.size))
+        if magic != SCENE_MAGIC:
+            raise ValueError(f"{path} is not a GRAFKOM2D scene file")
+        if version > SCENE_VERSION:
+            raise ValueError(f"{path} uses scene format v{version}; this editor reads up to v{SCENE_VERSION}")
+        parents = groups = None
+        if flags & SCENE_HAS_GROUPS:
+            f.seek(record_pos + n_shapes * SCENE_RECORD.itemsize)
+            n_groups = int(np.fromfile(f, dtype='<u8', count=1)[0])
+            groups = np.fromfile(f, dtype=SCENE_GROUP, count=n_groups)
+            parents = np.fromfile(f, dtype='<i8', count=n_shapes)
+
+    if n_vertices:
+        vertices = np.memmap(path, dtype='<f4', mode='c', offset=vertex_pos, shape=(n_vertices, 2))
+    else:
+        vertices = np.zeros((0, 2), dtype=np.float32)
+    if n_shapes:
+        records = np.memmap(path, dtype=SCENE_RECORD, mode='r', offset=record_pos, shape=(n_shapes,))
+    else:
+        records = np.zeros(0, dtype=SCENE_RECORD)
+    return ShapeStore.from_arrays(vertices, records['vertex_offset'], records['vertex_count'],
+                                  records['kind'], records['color'], records['thickness'],
+                                  records['params'], records['ellipse'], parents, groups)
+
+class Viewport2D:
+    """Pan/zoom camera mapping world coordinates onto the window.
+
+    center is the world point shown in the middle of the window and zoom
+    the number of window pixels per world unit. Screen coordinates here
+    are GL window pixels (origin bottom-left). The default view shows
+    world (0, 0)-(width, height) at 1:1, i.e. the editor's old fixed canvas.
+    """
+    MIN_ZOOM = 1e-3
+    MAX_ZOOM = 1e3
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.reset()
+
+    def reset(self):
+        self.center = [self.width / 2, self.height / 2]
+        self.zoom = 1.0
+
+    def screen_to_world(self, x, y):
+        return (self.center[0] + (x - self.width / 2) / self.zoom,
+                self.center[1] + (y - self.height / 2) / self.zoom)
+
+    def world_to_screen(self, x, y):
+        return ((x - self.center[0]) * self.zoom + self.width / 2,
+                (y - self.center[1]) * self.zoom + self.height / 2)
+
+    def visible_rect(self, pad=0.0):
+        """World-space (x0, y0, x1, y1) covered by the window, grown by pad world units"""
+        half_w = self.width / 2 / self.zoom + pad
+        half_h = self.height / 2 / self.zoom + pad
+        return (self.center[0] - half_w, self.center[1] - half_h,
+                self.center[0] + half_w, self.center[1] + half_h)
+
+    def pan(self, dx, dy):
+        """Move the view by a screen-pixel drag (the content follows the mouse)"""
+        self.center[0] -= dx / self.zoom
+        self.center[1] -= dy / self.zoom
+
+    def zoom_at(self, x, y, factor):
+        """Zoom by factor keeping the world point under screen (x, y) in place"""
+        wx, wy = self.screen_to_world(x, y)
+        self.zoom = min(max(self.zoom * factor, self.MIN_ZOOM), self.MAX_ZOOM)
+        self.center[0] = wx - (x - self.width / 2) / self.zoom
+        self.center[1] = wy - (y - self.height / 2) / self.zoom
+
+    def fit(self, bounds, margin=0.05):
+        """Frame an (x0, y0, x1, y1) world box"""
+        x0, y0, x1, y1 = bounds
+        self.center = [(x0 + x1) / 2, (y0 + y1) / 2]
+        w, h = max(x1 - x0, 1e-6), max(y1 - y0, 1e-6)
+        zoom = min(self.width / w, self.height / h) * (1 - 2 * margin)
+        self.zoom = min(max(zoom, self.MIN_ZOOM), self.MAX_ZOOM)
+
+    def apply(self):
+        """Load the world projection"""
+        x0, y0, x1, y1 = self.visible_rect()
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        gluOrtho2D(x0, x1, y0, y1)
+        glMatrixMode(GL_MODELVIEW)
+
+    def apply_screen(self):
+        """Load a window-pixel projection for overlays"""
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        gluOrtho2D(0, self.width, 0, self.height)
+        glMatrixMode(GL_MODELVIEW)
+
+class ShapeRenderer:
+    """Draws a whole ShapeStore with a handful of batched GL calls.
+
+    The store's transformed vertex buffer is mirrored into one VBO. Only
+    the vertex ranges of shapes that changed are re-uploaded each frame,
+    and consecutive shapes sharing primitive, color and thickness are
+    submitted with a single glMultiDrawArrays, so z-order is preserved.
+
+    Given a Viewport2D, draw() only submits shapes whose AABB meets the
+    view (found through the store's spatial grid), and outlines smaller
+    than LOD_PIXELS on screen are drawn as one point each in their color.
+    The visible set is only recomputed when the view or the shapes change.
+
+    With sort_by_state=True shapes are additionally moved into an earlier
+    batch of the same state whenever nothing drawn in between overlaps
+    them, which cuts state changes on mixed scenes. That plan depends on
+    shape positions, so it is rebuilt after every edit; it pays off on
+    mostly static drawings.
+    """
+    PRIMITIVES = (GL_POINTS, GL_LINES, GL_LINE_LOOP, GL_LINE_LOOP, GL_LINE_STRIP)  # indexed by kind
+    MAX_UPLOAD_RANGES = 32
+    LOD_PIXELS = 2.0
+    SORT_GRID = 64  # occupancy cells per axis used to prove batches don't overlap
+
+    def __init__(self, store, state=None, sort_by_state=False):
+        self.store = store
+        self.state = state if state is not None else GLStateCache()
+        self.sort_by_state = sort_by_state
+        self.vbo = None
+        self.vbo_capacity = 0
+        self._version = None
+        self._batches = []
+        self._batch_of = np.zeros(0, dtype=np.int64)  # shape id -> batch index
+        self._moved = False
+        self._view_key = None
+        self._visible = None
+        self.stats = {'draw_calls': 0, 'vertices': 0, 'uploads': 0, 'uploaded_bytes': 0,
+                      'culled': 0, 'lod': 0}
+
+    def _upload(self):
+        store = self.store
+        changed = store.take_changed()
+        points = store.transformed
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        self._moved = len(changed) > 0
+
+        if len(points) > self.vbo_capacity or self._version != store.structure_version:
+            # Layout changed (or first frame): re-upload the whole buffer
+            capacity = max(len(points), self.vbo_capacity)
+            if capacity > self.vbo_capacity:
+                glBufferData(GL_ARRAY_BUFFER, capacity * 8, None, GL_DYNAMIC_DRAW)
+                self.vbo_capacity = capacity
+            if len(points):
+                glBufferSubData(GL_ARRAY_BUFFER, 0, points.nbytes, points)
+                self.stats['uploads'] += 1
+                self.stats['uploaded_bytes'] += points.nbytes
+            return True
+
+        if len(changed) == 0:
+            return False
+        # Merge the changed shapes' vertex ranges into a few contiguous spans
+        starts = store.offsets[changed]
+        ends = starts + store.counts[changed]
+        order = np.argsort(starts)
+        starts, ends = starts[order], np.maximum.accumulate(ends[order])
+        breaks = np.nonzero(starts[1:] > ends[:-1])[0] + 1
+        span_starts = starts[np.r_[0, breaks]]
+        span_ends = ends[np.r_[breaks - 1, len(ends) - 1]]
+        if len(span_starts) > self.MAX_UPLOAD_RANGES:
+            span_starts, span_ends = span_starts[:1], span_ends[-1:]
+        for start, end in zip(span_starts.tolist(), span_ends.tolist()):
+            block = points[start:end]
+            glBufferSubData(GL_ARRAY_BUFFER, start * 8, block.nbytes, block)
+            self.stats['uploads'] += 1
+            self.stats['uploaded_bytes'] += block.nbytes
+        return False
+
+    def _build_batches(self):
+        """Split the shape list into runs of identical draw state"""
+        store = self.store
+        n = len(store)
+        self._batches = []
+        self._batch_of = np.zeros(n, dtype=np.int64)
+        if n == 0:
+            return
+        prim = np.asarray(self.PRIMITIVES, dtype=np.int64)[store.kinds]
+        state = np.column_stack([prim, store.colors, store.thickness])
+        firsts = store.offsets.astype(np.int32)
+        counts = store.counts.astype(np.int32)
+        kinds = store.kinds
+        if self.sort_by_state:
+            groups = self._sorted_groups(state)
+        else:
+            breaks = np.nonzero(np.any(state[1:] != state[:-1], axis=1))[0] + 1
+            bounds = np.r_[0, breaks, n]
+            groups = [np.arange(a, b) for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+        for batch, ids in enumerate(groups):
+            self._batch_of[ids] = batch
+            first = ids[0]
+            self._batches.append((self.PRIMITIVES[kinds[first]],
+                                  tuple(store.colors[first].tolist()),
+                                  float(store.thickness[first]),
+                                  firsts[ids], counts[ids]))
+
+    def _sorted_groups(self, state):
+        """Greedy state grouping that never reorders overlapping shapes.
+
+        A shape may join the last batch of its state only if no shape in a
+        later batch touches the same occupancy cells; cell_last records the
+        newest batch drawn into each cell of a coarse grid over the scene.
+        """
+        # Pad by the widest stroke: outlines and points rasterize past the AABB
+        pad = self.store.max_thickness + 1.0
+        bounds = self.store.bounds + np.array([-pad, -pad, pad, pad], dtype=np.float32)
+        lo = bounds[:, :2].min(axis=0)
+        size = np.maximum(bounds[:, 2:].max(axis=0) - lo, 1e-6)
+        g = self.SORT_GRID
+        cells = np.floor((bounds - np.tile(lo, 2)) / np.tile(size, 2) * (g - 1)).astype(np.int64)
+        cells = np.clip(cells, 0, g - 1).tolist()
+        _, keys = np.unique(state, axis=0, return_inverse=True)
+
+        cell_last = np.full((g, g), -1, dtype=np.int64)
+        last_batch_of = {}
+        members = []
+        for i, key in enumerate(keys.ravel().tolist()):
+            x0, y0, x1, y1 = cells[i]
+            region = cell_last[y0:y1 + 1, x0:x1 + 1]
+            batch = last_batch_of.get(key, -1)
+            if batch < 0 or region.max() > batch:
+                batch = len(members)
+                members.append([])
+                last_batch_of[key] = batch
+            members[batch].append(i)
+            np.maximum(region, batch, out=region)
+        return [np.array(ids) for ids in members]
+
+    def set_store(self, store):
+        """Draw a different store; forces a full upload on the next frame"""
+        self.store = store
+        self._version = None
+        self._view_key = None
+
+    def _cull(self, viewport, changed):
+        """Per-batch draw lists of the shapes in view, plus the LOD points"""
+        store = self.store
+        key = (viewport.visible_rect(), viewport.zoom)
+        if not changed and key == self._view_key:
+            return self._visible
+        # Strokes and points rasterize past the AABB by up to the widest line
+        pad = (store.max_thickness + 1.0) / viewport.zoom
+        ids = store.query_rect(*viewport.visible_rect(pad))[::-1]  # back to front
+        # Whole scene in view (zoomed out): skip the gathers
+        everything = len(ids) == len(store)
+        b = store.bounds if everything else store.bounds[ids]
+        kinds = store.kinds if everything else store.kinds[ids]
+        extent = np.maximum(b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]) * viewport.zoom
+        small = (extent < self.LOD_PIXELS) & (kinds != SHAPE_KINDS['point'])
+        if everything and small.all():
+            points = (store.centers, store.colors)
+        else:
+            points = (store.centers[ids[small]], store.colors[ids[small]])
+        lod_count = int(small.sum())
+        ids = ids[~small]
+        batches = self._batch_of[ids]
+        if self.sort_by_state:
+            order = np.argsort(batches, kind='stable')  # z-order kept inside each batch
+            ids, batches = ids[order], batches[order]
+        starts = np.r_[0, np.flatnonzero(batches[1:] != batches[:-1]) + 1]
+        ends = np.r_[starts[1:], len(ids)]
+        draws = []
+        for a, z in zip(starts.tolist(), ends.tolist()):
+            if z > a:
+                mode, color, thickness, _, _ = self._batches[batches[a]]
+                part = ids[a:z]
+                draws.append((mode, color, thickness, store.offsets[part].astype(np.int32),
+                              store.counts[part].astype(np.int32)))
+        self._visible = (draws, points, len(store) - len(ids) - lod_count)
+        self._view_key = key
+        return self._visible
+
+    def draw(self, viewport=None):
+        """Submit every shape (or those in the viewport); returns the per-frame stats"""
+        for key in self.stats:
+            self.stats[key] = 0
+        store = self.store
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+        relayout = self._upload()
+        rebuilt = (relayout or self._version != store.structure_version
+                   or (self.sort_by_state and self._moved))
+        if rebuilt:
+            self._build_batches()
+            self._version = store.structure_version
+
+        draws, lod_points = self._batches, None
+        if viewport is not None:
+            draws, lod_points, culled = self._cull(viewport, rebuilt or self._moved)
+            self.stats['culled'] = culled
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, None)
+        for mode, color, thickness, firsts, counts in draws:
+            self.state.color3f(*color)
+            self.state.line_width(thickness)
+            if mode == GL_POINTS:
+                self.state.point_size(thickness * 2)
+            glMultiDrawArrays(mode, firsts, counts, len(firsts))
+            self.stats['draw_calls'] += 1
+            self.stats['vertices'] += int(counts.sum())
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        if lod_points is not None and len(lod_points[0]):
+            # Sub-pixel outlines: one colored point each, in a single call
+            centers, colors = lod_points
+            self.state.point_size(1)
+            glEnableClientState(GL_COLOR_ARRAY)
+            glVertexPointer(2, GL_FLOAT, 0, centers)
+            glColorPointer(3, GL_FLOAT, 0, colors)
+            glDrawArrays(GL_POINTS, 0, len(centers))
+            glDisableClientState(GL_COLOR_ARRAY)
+            self.state.invalidate('color')
+            self.stats['draw_calls'] += 1
+            self.stats['vertices'] += len(centers)
+            self.stats['lod'] = len(centers)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        return self.stats
+
+    def draw_handles(self, shapes):
+        """Selection handles (center + two AABB corners) for many shapes at once"""
+        ids = np.fromiter((shape.index for shape in shapes if shape.store is self.store), dtype=np.int64)
+        if len(ids) == 0:
+            return
+        b = self.store.bounds[ids]
+        handles = np.concatenate([self.store.centers[ids], b[:, :2], b[:, 2:]]).astype(np.float32)
+        self.state.color3f(1.0, 1.0, 0.0)  # Yellow
+        self.state.point_size(8)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, handles)
+        glDrawArrays(GL_POINTS, 0, len(handles))
+        glDisableClientState(GL_VERTEX_ARRAY)
+        self.stats['draw_calls'] += 1
+        self.stats['vertices'] += len(handles)
+
+class TextCache:
+    """LRU cache of rendered text labels kept as GL textures.
+
+    Labels are keyed by (text, font, color). A hit costs one textured quad
+    and no CPU rasterization; textures are evicted least recently used
+    first once their total size exceeds budget_bytes.
+    """
+    def __init__(self, budget_bytes=4 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.bytes_used = 0
+        self._entries = OrderedDict()  # key -> (texture, width, height, nbytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, text, font, color):
+        """Texture for a label as (texture, width, height, nbytes)"""
+        key = (text, font, tuple(color))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        surface = font.render(text, True, color)
+        width, height = surface.get_size()
+        data = pygame.image.tostring(surface, "RGBA", True)
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        entry = (texture, width, height, width * height * 4)
+        self._entries[key] = entry
+        self.bytes_used += entry[3]
+        self._evict()
+        return entry
+
+    def _evict(self):
+        # The newest label always stays, even if it alone exceeds the budget
+        while self.bytes_used > self.budget_bytes and len(self._entries) > 1:
+            _, (texture, _, _, nbytes) = self._entries.popitem(last=False)
+            glDeleteTextures([texture])
+            self.bytes_used -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        if self._entries:
+            glDeleteTextures([entry[0] for entry in self._entries.values()])
+        self._entries.clear()
+        self.bytes_used = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'bytes': self.bytes_used,
+                'hit_rate': self.hits / total if total else 0.0}
 
 class Graphics2DEditor:
-    def _init_(self):
+    FREEHAND_TOLERANCE = 1.5  # screen pixels a simplified stroke may deviate
+    TRANSFORM_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN,
+                      pygame.K_q, pygame.K_w, pygame.K_a, pygame.K_z)
+
+    DEFAULT_SCENE = 'drawing.gk2d'
+
+    def __init__(self, scene_path=None, on_demand=True):
         pygame.init()
         self.screen_width = 1200
         self.screen_height = 800
@@ -140,16 +1996,27 @@ class Graphics2DEditor:
         pygame.display.set_caption("2D Editor with Transformations")
         
         glClearColor(0.1, 0.1, 0.15, 1.0)
-        gluOrtho2D(0, self.screen_width, 0, self.screen_height)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         
-        self.shapes = []
+        self.shapes = ShapeStore()
+        self.gl_state = GLStateCache()
+        self.renderer = ShapeRenderer(self.shapes, self.gl_state)
+        self.viewport = Viewport2D(self.screen_width, self.screen_height)
+        # F5/F9 file; without one from the command line F5 saves to a new file
+        self.scene_path = scene_path
         self.current_tool = 'select'
         self.current_color = (1.0, 1.0, 1.0)
         self.line_thickness = 1.0
         self.temp_points = []
         self.selected_shape = None
+        self.selected_shapes = []
+        self.selection_targets = []  # top-level shapes/groups that transforms apply to
         self.drag_start = None
         self.transform_mode = None  # 'move', 'rotate', 'scale'
+        self.region_start = None    # rubber-band corner while region selecting
+        self.region_end = None
+        self.lasso_points = None    # lasso path when Shift is held
+        self.stroke = None          # StrokeSimplifier while drawing freehand
         
         self.color_palette = [
             (1.0, 1.0, 1.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0),
@@ -157,12 +2024,26 @@ class Graphics2DEditor:
         ]
         
         self.font = pygame.font.SysFont('Arial', 16)
+        self.text_cache = TextCache()
+        self.profiler = Profiler()
+        self.profile_lines = []
+        self.history = History()
+        self.drag_serial = 0  # merge key: one undo entry per mouse drag
+        # Render on demand: only redraw after input changed something, and
+        # sleep on the event queue while idle
+        self.on_demand = on_demand
+        self.damaged = True
+        # Last, since loading resets the selection and the history
+        if scene_path and os.path.exists(scene_path):
+            self.load_scene(scene_path)
         self.print_instructions()
     
     def print_instructions(self):
         print("=== INSTRUCTIONS ===")
-        print("DRAWING: P(Point) L(Line) R(Rectangle) E(Ellipse)")
+        print("DRAWING: P(Point) L(Line) R(Rectangle) E(Ellipse) D(Freehand)")
         print("SELECT: S | CLEAR: C")
+        print(f"FILE: F5 Save | F9 Load ({self.scene_path or 'new file'})")
+        print("  - Drag on empty canvas: Rubber-band select (Shift: lasso)")
         print("COLORS: 1-8 | THICKNESS: +/-")
         print("MOUSE DRAG:")
         print("  - Drag center: Move")
@@ -170,63 +2051,129 @@ class Graphics2DEditor:
         print("  - Drag outside: Rotate")
         print("KEYBOARD:")
         print("  Arrows: Move | Q/W: Rotate | A/Z: Scale")
+        print("  G: Group selection | U: Ungroup")
+        print("UNDO: Ctrl+Z | REDO: Ctrl+Y / Ctrl+Shift+Z")
+        print("VIEW: Right/middle drag Pan | Wheel Zoom | F Fit all | Home Reset")
+        print("PROFILER: F3 On/Off + graph | F4 Export trace.json")
 
+    def to_world(self, pos):
+        """World coordinates of a window position (pygame pixels, y down)"""
+        return self.viewport.screen_to_world(pos[0], self.screen_height - pos[1])
+    
     def handle_mouse_down(self, x, y):
-        gl_y = self.screen_height - y
+        x, gl_y = self.to_world((x, y))
         self.drag_start = (x, gl_y)
+        self.drag_serial += 1
         
         if self.current_tool == 'select' and self.selected_shape:
             center = self.selected_shape.get_transformed_center()
             bounds = self.selected_shape.get_bounding_box()
+            reach = 10 / self.viewport.zoom  # handles are 10 screen pixels wide
             
             # Check what part of shape is being dragged
-            if math.dist((x, gl_y), center) < 10:
+            if math.dist((x, gl_y), center) < reach:
                 self.transform_mode = 'move'
-            elif math.dist((x, gl_y), (bounds[0], bounds[1])) < 10 or math.dist((x, gl_y), (bounds[2], bounds[3])) < 10:
+            elif math.dist((x, gl_y), (bounds[0], bounds[1])) < reach or math.dist((x, gl_y), (bounds[2], bounds[3])) < reach:
                 self.transform_mode = 'scale'
             else:
                 self.transform_mode = 'rotate'
         else:
             self.transform_mode = None
+            if self.current_tool == 'select':
+                # Empty canvas: start a rubber-band (or, with Shift, lasso) selection
+                self.region_start = self.region_end = (x, gl_y)
+                if pygame.key.get_mods() & KMOD_SHIFT:
+                    self.lasso_points = [(x, gl_y)]
     
     def handle_mouse_up(self):
+        if self.region_start is not None:
+            self.finish_region_select()
+        if self.stroke is not None:
+            self.finish_stroke()
         self.drag_start = None
         self.transform_mode = None
     
     def handle_mouse_drag(self, x, y):
+        x, gl_y = self.to_world((x, y))
+        if self.stroke is not None:
+            self.stroke.add(x, gl_y)
+            return
+        if self.region_start is not None:
+            self.region_end = (x, gl_y)
+            if self.lasso_points is not None:
+                self.lasso_points.append((x, gl_y))
+            return
         if not self.drag_start or not self.selected_shape:
             return
             
-        gl_y = self.screen_height - y
+        with self.history.transforming(self.selection_targets, ('drag', self.drag_serial)):
+            self.drag_transform(x, gl_y)
+        self.drag_start = (x, gl_y)
+    
+    def drag_transform(self, x, gl_y):
         dx = x - self.drag_start[0]
         dy = gl_y - self.drag_start[1]
         
         if self.transform_mode == 'move':
-            self.selected_shape.drag_offset[0] += dx
-            self.selected_shape.drag_offset[1] += dy
-            self.selected_shape.update_transform()
+            for node in self.selection_targets:
+                node.drag_offset[0] += dx
+                node.drag_offset[1] += dy
         
         elif self.transform_mode == 'rotate':
             center = self.selected_shape.get_transformed_center()
             angle = math.degrees(math.atan2(gl_y - center[1], x - center[0]) - 
                                  math.atan2(self.drag_start[1] - center[1], 
                                  self.drag_start[0] - center[0]))
-            self.selected_shape.rotation_angle += angle
-            self.selected_shape.update_transform()
+            for node in self.selection_targets:
+                node.rotation_angle += angle
         
         elif self.transform_mode == 'scale':
-            scale_factor = 1 + dx * 0.01  # Adjust scaling sensitivity
-            self.selected_shape.scale_factor[0] *= scale_factor
-            self.selected_shape.scale_factor[1] *= scale_factor
-            self.selected_shape.update_transform()
-        
-        self.drag_start = (x, gl_y)
+            scale_factor = 1 + dx * self.viewport.zoom * 0.01  # 1% per screen pixel
+            for node in self.selection_targets:
+                node.scale_factor[0] *= scale_factor
+                node.scale_factor[1] *= scale_factor
+    
+    def key_transform(self, key):
+        """Arrow keys move, Q/W rotate, A/Z scale the whole selection"""
+        for node in self.selection_targets:
+            if key == pygame.K_LEFT:
+                node.drag_offset[0] -= 10
+            elif key == pygame.K_RIGHT:
+                node.drag_offset[0] += 10
+            elif key == pygame.K_UP:
+                node.drag_offset[1] += 10
+            elif key == pygame.K_DOWN:
+                node.drag_offset[1] -= 10
+            elif key == pygame.K_q:
+                node.rotation_angle += 15
+            elif key == pygame.K_w:
+                node.rotation_angle -= 15
+            elif key == pygame.K_a:
+                node.scale_factor[0] *= 1.1
+                node.scale_factor[1] *= 1.1
+            elif key == pygame.K_z:
+                node.scale_factor[0] *= 0.9
+                node.scale_factor[1] *= 0.9
+    
+    def finish_stroke(self):
+        """Turn the freehand stroke into a polyline shape"""
+        stroke, self.stroke = self.stroke, None
+        points = stroke.finish()
+        if len(points) < 2:
+            return None
+        print(f"Freehand: {stroke.samples} samples -> {len(points)} vertices ({stroke.ratio:.1f}x)")
+        return self.add_shape(self.create_shape('polyline', points))
+    
+    def add_shape(self, shape):
+        self.shapes.append(shape)
+        self.history.record(CreateCommand(shape))
+        return shape
     
     def create_shape(self, shape_type, points):
         if shape_type == 'point':
             return Shape('point', points, self.current_color, self.line_thickness)
-        elif shape_type == 'line':
-            return Shape('line', points, self.current_color, self.line_thickness)
+        elif shape_type in ('line', 'polyline'):
+            return Shape(shape_type, points, self.current_color, self.line_thickness)
         elif shape_type == 'rectangle':
             x1, y1 = points[0]
             x2, y2 = points[1]
@@ -238,151 +2185,368 @@ class Graphics2DEditor:
             rx = abs(points[1][0] - points[0][0]) / 2
             ry = abs(points[1][1] - points[0][1]) / 2
             
-            ellipse_points = []
-            for i in range(32):
-                angle = 2 * math.pi * i / 32
-                ellipse_points.append([cx + rx * math.cos(angle), cy + ry * math.sin(angle)])
+            segments = ellipse_segments(rx, ry, self.viewport.zoom)
+            ellipse_points = tessellate_ellipse(cx, cy, rx, ry, segments)
             
-            return Shape('ellipse', ellipse_points, self.current_color, self.line_thickness)
+            shape = Shape('ellipse', ellipse_points, self.current_color, self.line_thickness)
+            shape.ellipse = (cx, cy, rx, ry)
+            return shape
+    
+    def save_scene(self):
+        if self.scene_path is None:
+            self.scene_path = unused_path(self.DEFAULT_SCENE)
+        save_scene(self.shapes, self.scene_path)
+        print(f"Saved {len(self.shapes)} shapes to {self.scene_path}")
+    
+    def set_store(self, store):
+        """Swap in another ShapeStore and drop the selection"""
+        for shape in self.selected_shapes:
+            shape.selected = False
+        self.shapes = store
+        self.renderer.set_store(store)
+        self.selected_shapes = []
+        self.selection_targets = []
+        self.selected_shape = None
+    
+    def load_scene(self, path):
+        self.set_store(load_scene(path))
+        self.history.clear()
+        print(f"Loaded {len(self.shapes)} shapes from {path}")
+    
+    def set_selection(self, shapes, primary=None):
+        """Replace the current selection; primary gets the drag handles.
+        
+        A grouped shape brings its whole top-level group along, and the
+        group, not its shapes, becomes the target of transforms.
+        """
+        for shape in self.selected_shapes:
+            shape.selected = False
+        shapes = list(shapes)
+        self.selection_targets = self.shapes.top_level_nodes(shapes)
+        groups = [node for node in self.selection_targets if isinstance(node, Group)]
+        if groups:
+            shapes = [node for node in self.selection_targets if not isinstance(node, Group)]
+            shapes += [self.shapes[i] for group in groups for i in group.shape_ids().tolist()]
+        self.selected_shapes = shapes
+        for shape in self.selected_shapes:
+            shape.selected = True
+        if primary is None and self.selected_shapes:
+            primary = self.selected_shapes[-1]
+        self.selected_shape = primary
+    
+    def undo(self):
+        command = self.history.undo(self)
+        self.refresh_selection()
+        return command
+    
+    def redo(self):
+        command = self.history.redo(self)
+        self.refresh_selection()
+        return command
+    
+    def refresh_selection(self):
+        """Drop selected shapes that undo/redo removed; regroup the rest"""
+        shapes = [shape for shape in self.selected_shapes if shape.store is self.shapes]
+        primary = self.selected_shape if self.selected_shape in shapes else None
+        self.set_selection(shapes, primary)
     
     def select_shape_at(self, x, y):
-        for shape in reversed(self.shapes):  # Select top-most shape first
-            if shape.is_point_inside((x, y)):
-                if self.selected_shape:
-                    self.selected_shape.selected = False
+        hits = self.shapes.pick(x, y, 3.0 / self.viewport.zoom)  # Top-most shape first
+        if len(hits):
+            shape = self.shapes[hits[0]]
+            if shape in self.selected_shapes:
+                # Keep a multi-selection so it can be dragged as a whole
                 self.selected_shape = shape
-                shape.selected = True
-                return True
+            else:
+                self.set_selection([shape], shape)
+            return True
+        self.set_selection([])
         return False
     
+    def finish_region_select(self):
+        """Select everything inside the rubber-band rectangle or lasso"""
+        if self.lasso_points is not None:
+            ids = self.shapes.select_in_lasso(self.lasso_points)
+        else:
+            (x0, y0), (x1, y1) = self.region_start, self.region_end
+            ids = self.shapes.select_in_rect(x0, y0, x1, y1)
+        self.set_selection([self.shapes[i] for i in ids.tolist()])
+        self.region_start = self.region_end = None
+        self.lasso_points = None
+    
     def render(self):
+        profiler = self.profiler
+        self.gl_state.begin_frame()
         glClear(GL_COLOR_BUFFER_BIT)
+        self.viewport.apply()
         
-        # Draw all shapes
-        for shape in self.shapes:
-            shape.draw()
+        # Recompute transforms of edited shapes (and outlines of ellipses
+        # whose on-screen size changed) before anything reads them
+        with profiler.scope('transform'):
+            self.shapes.update_tessellation(self.viewport.zoom, self.viewport.visible_rect())
+            self.shapes.flush()
         
-        # Draw temporary points (during creation)
-        if self.temp_points:
-            glColor3f(1.0, 0.0, 0.0)
-            glPointSize(5)
-            glBegin(GL_POINTS)
-            for point in self.temp_points:
-                glVertex2f(point[0], point[1])
-            glEnd()
+        # Draw the shapes in view (batched), then the handles of the selection
+        with profiler.scope('shapes'):
+            stats = self.renderer.draw(self.viewport)
+        with profiler.scope('handles'):
+            self.renderer.draw_handles(self.selected_shapes)
+        
+        with profiler.scope('overlay'):
+            # Draw temporary points (during creation)
+            if self.temp_points:
+                self.gl_state.color3f(1.0, 0.0, 0.0)
+                self.gl_state.point_size(5)
+                glBegin(GL_POINTS)
+                for point in self.temp_points:
+                    glVertex2f(point[0], point[1])
+                glEnd()
+            
+            # Draw the freehand stroke in progress (already simplified)
+            if self.stroke is not None:
+                self.gl_state.color3f(*self.current_color)
+                self.gl_state.line_width(self.line_thickness)
+                glBegin(GL_LINE_STRIP)
+                for point in self.stroke.points():
+                    glVertex2f(point[0], point[1])
+                glEnd()
+            
+            # Draw rubber band / lasso while region selecting
+            if self.region_start is not None:
+                self.gl_state.color3f(0.5, 0.8, 1.0)
+                self.gl_state.line_width(1)
+                glBegin(GL_LINE_LOOP)
+                if self.lasso_points is not None:
+                    for point in self.lasso_points:
+                        glVertex2f(point[0], point[1])
+                else:
+                    (x0, y0), (x1, y1) = self.region_start, self.region_end
+                    for point in ((x0, y0), (x1, y0), (x1, y1), (x0, y1)):
+                        glVertex2f(point[0], point[1])
+                glEnd()
         
         # Draw instructions on screen
-        self.draw_text("Tools: P(Point) L(Line) R(Rect) E(Ellipse) S(Select)", 10, 10)
-        self.draw_text("Transform: Drag center(move) corner(scale) edge(rotate)", 10, 30)
-        self.draw_text(f"Selected: {self.selected_shape.type if self.selected_shape else 'None'}", 10, 50)
+        self.viewport.apply_screen()
+        with profiler.scope('text'):
+            self.draw_text("Tools: P(Point) L(Line) R(Rect) E(Ellipse) D(Freehand) S(Select)", 10, 10)
+            self.draw_text("Transform: Drag center(move) corner(scale) edge(rotate)", 10, 30)
+            if len(self.selected_shapes) > 1:
+                self.draw_text(f"Selected: {len(self.selected_shapes)} shapes", 10, 50)
+            else:
+                self.draw_text(f"Selected: {self.selected_shape.type if self.selected_shape else 'None'}", 10, 50)
+            self.draw_text(f"Zoom: {self.viewport.zoom:.0%} | Drawn: {len(self.shapes) - stats['culled']}"
+                           f"/{len(self.shapes)}", 10, 70)
         
-        pygame.display.flip()
+        # Frame-time graph and percentiles (refreshed every 30 frames)
+        if profiler.enabled:
+            with profiler.scope('profiler'):
+                if profiler.frame_count % 30 == 0:
+                    self.profile_lines = profiler.format_summary()[:4]
+                profiler.draw_graph(self.screen_width, self.screen_height)
+                for i, line in enumerate(self.profile_lines):
+                    self.draw_text(line, self.screen_width - 420, 100 + 20 * i)
+        
+        with profiler.scope('swap'):
+            pygame.display.flip()
     
-    def draw_text(self, text, x, y):
-        """Draw text on screen using pygame"""
-        text_surface = self.font.render(text, True, (255, 255, 255))
-        text_data = pygame.image.tostring(text_surface, "RGBA", True)
-        glWindowPos2d(x, self.screen_height - y - 20)
-        glDrawPixels(text_surface.get_width(), text_surface.get_height(), 
-                    GL_RGBA, GL_UNSIGNED_BYTE, text_data)
+    def draw_text(self, text, x, y, color=(255, 255, 255)):
+        """Draw text on screen from the cached label texture"""
+        texture, width, height, _ = self.text_cache.get(text, self.font, color)
+        if width == 0:
+            return
+        x0, y0 = x, self.screen_height - y - 20
+        x1, y1 = x0 + width, y0 + height
+        
+        self.gl_state.enable(GL_TEXTURE_2D)
+        self.gl_state.enable(GL_BLEND)
+        self.gl_state.color3f(1.0, 1.0, 1.0)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glBegin(GL_QUADS)
+        glTexCoord2f(0, 0); glVertex2f(x0, y0)
+        glTexCoord2f(1, 0); glVertex2f(x1, y0)
+        glTexCoord2f(1, 1); glVertex2f(x1, y1)
+        glTexCoord2f(0, 1); glVertex2f(x0, y1)
+        glEnd()
+        glBindTexture(GL_TEXTURE_2D, 0)
+        self.gl_state.disable(GL_TEXTURE_2D)
+        self.gl_state.disable(GL_BLEND)
     
     def run(self):
         clock = pygame.time.Clock()
         running = True
         
         while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
+            # The profiler graph is live, so it keeps the loop continuous
+            continuous = not self.on_demand or self.profiler.enabled
+            if continuous or self.damaged:
+                events = pygame.event.get()
+            else:
+                events = [pygame.event.wait()] + pygame.event.get()
+            
+            self.profiler.begin_frame()
+            with self.profiler.scope('events'):
+                running = self.handle_events(events)
+            if continuous or self.damaged:
+                self.render()
+                self.damaged = False
+            self.profiler.end_frame()
+            clock.tick(60)
+        
+        pygame.quit()
+    
+    def handle_events(self, events=None):
+        """Process input; returns False once the editor should quit.
+        
+        Drag motion is coalesced: only the last MOUSEMOTION position before
+        the next other event (or the end of the batch) is applied, so one
+        frame costs at most one transform update. Lasso paths keep every
+        sample.
+        """
+        running = True
+        pending_drag = None
+        for event in pygame.event.get() if events is None else events:
+            if event.type == pygame.MOUSEMOTION:
+                if event.buttons[1] or event.buttons[2]:  # Middle/right drag pans
+                    self.viewport.pan(event.rel[0], -event.rel[1])
+                    self.damaged = True
+                elif event.buttons[0]:  # Left mouse button held
+                    if self.lasso_points is not None or self.stroke is not None:
+                        self.handle_mouse_drag(event.pos[0], event.pos[1])
+                    else:
+                        pending_drag = event.pos
+                    self.damaged = True
+                continue
+            if pending_drag is not None:
+                self.handle_mouse_drag(pending_drag[0], pending_drag[1])
+                pending_drag = None
+            self.damaged = True
+            
+            if event.type == pygame.QUIT:
+                running = False
+            
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
                     running = False
                 
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        running = False
-                    
-                    # Tool selection
-                    elif event.key == pygame.K_p:
-                        self.current_tool = 'point'
-                    elif event.key == pygame.K_l:
-                        self.current_tool = 'line'
-                    elif event.key == pygame.K_r:
-                        self.current_tool = 'rectangle'
-                    elif event.key == pygame.K_e:
-                        self.current_tool = 'ellipse'
-                    elif event.key == pygame.K_s:
-                        self.current_tool = 'select'
-                    
-                    # Color selection
-                    elif pygame.K_1 <= event.key <= pygame.K_8:
-                        self.current_color = self.color_palette[event.key - pygame.K_1]
-                    
-                    # Thickness
-                    elif event.key in (pygame.K_PLUS, pygame.K_EQUALS):
-                        self.line_thickness = min(10.0, self.line_thickness + 1)
-                    elif event.key == pygame.K_MINUS:
-                        self.line_thickness = max(1.0, self.line_thickness - 1)
-                    
-                    # Keyboard transformations
-                    elif event.key == pygame.K_LEFT and self.selected_shape:
-                        self.selected_shape.drag_offset[0] -= 10
-                        self.selected_shape.update_transform()
-                    elif event.key == pygame.K_RIGHT and self.selected_shape:
-                        self.selected_shape.drag_offset[0] += 10
-                        self.selected_shape.update_transform()
-                    elif event.key == pygame.K_UP and self.selected_shape:
-                        self.selected_shape.drag_offset[1] += 10
-                        self.selected_shape.update_transform()
-                    elif event.key == pygame.K_DOWN and self.selected_shape:
-                        self.selected_shape.drag_offset[1] -= 10
-                        self.selected_shape.update_transform()
-                    elif event.key == pygame.K_q and self.selected_shape:
-                        self.selected_shape.rotation_angle += 15
-                        self.selected_shape.update_transform()
-                    elif event.key == pygame.K_w and self.selected_shape:
-                        self.selected_shape.rotation_angle -= 15
-                        self.selected_shape.update_transform()
-                    elif event.key == pygame.K_a and self.selected_shape:
-                        self.selected_shape.scale_factor[0] *= 1.1
-                        self.selected_shape.scale_factor[1] *= 1.1
-                        self.selected_shape.update_transform()
-                    elif event.key == pygame.K_z and self.selected_shape:
-                        self.selected_shape.scale_factor[0] *= 0.9
-                        self.selected_shape.scale_factor[1] *= 0.9
-                        self.selected_shape.update_transform()
-                    
-                    # Clear
-                    elif event.key == pygame.K_c:
-                        self.shapes = []
-                        self.selected_shape = None
+                # Undo / redo
+                elif event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                    if event.mod & pygame.KMOD_SHIFT:
+                        self.redo()
+                    else:
+                        self.undo()
+                elif event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                    self.redo()
+                
+                # Tool selection
+                elif event.key == pygame.K_p:
+                    self.current_tool = 'point'
+                elif event.key == pygame.K_l:
+                    self.current_tool = 'line'
+                elif event.key == pygame.K_r:
+                    self.current_tool = 'rectangle'
+                elif event.key == pygame.K_e:
+                    self.current_tool = 'ellipse'
+                elif event.key == pygame.K_d:
+                    self.current_tool = 'freehand'
+                elif event.key == pygame.K_s:
+                    self.current_tool = 'select'
+                
+                # Color selection
+                elif pygame.K_1 <= event.key <= pygame.K_8:
+                    self.current_color = self.color_palette[event.key - pygame.K_1]
+                
+                # Thickness
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS):
+                    self.line_thickness = min(10.0, self.line_thickness + 1)
+                elif event.key == pygame.K_MINUS:
+                    self.line_thickness = max(1.0, self.line_thickness - 1)
+                
+                # Keyboard transformations (applied to the whole selection)
+                elif event.key in self.TRANSFORM_KEYS and self.selected_shape:
+                    with self.history.transforming(self.selection_targets):
+                        self.key_transform(event.key)
                 
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    gl_y = self.screen_height - event.pos[1]
-                    
-                    if event.button == 1:  # Left click
-                        if self.current_tool == 'select':
-                            if not self.select_shape_at(event.pos[0], gl_y):
-                                self.selected_shape = None
-                            self.handle_mouse_down(event.pos[0], event.pos[1])
+                # Clear
+                elif event.key == pygame.K_c:
+                    # A fresh store, so undo can bring back the old one as it was
+                    empty = ShapeStore()
+                    self.history.record(ClearCommand(self.shapes, empty))
+                    self.set_store(empty)
+                
+                # Group / ungroup the selection
+                elif event.key == pygame.K_g and len(self.selection_targets) > 1:
+                    nodes = self.selection_targets
+                    group = self.shapes.group([n for n in nodes if not isinstance(n, Group)],
+                                              [n for n in nodes if isinstance(n, Group)])
+                    self.history.record(GroupCommand(group, *self.shapes.children(group)))
+                    self.set_selection(self.selected_shapes, self.selected_shape)
+                    print(f"Grouped {len(group.shape_ids())} shapes")
+                elif event.key == pygame.K_u:
+                    groups = [n for n in self.selection_targets if isinstance(n, Group)]
+                    for group in groups:
+                        command = UngroupCommand(group, *self.shapes.children(group))
+                        if self.shapes.ungroup(group):
+                            # Baked vertices can't be replayed by older commands
+                            self.history.clear()
+                            print("Transformed group baked into its shapes; undo history cleared")
                         else:
-                            self.temp_points.append([event.pos[0], gl_y])
-                            if (self.current_tool == 'point' or 
-                                (self.current_tool in ['line', 'rectangle', 'ellipse'] and len(self.temp_points) == 2)):
-                                new_shape = self.create_shape(self.current_tool, self.temp_points)
-                                self.shapes.append(new_shape)
-                                self.temp_points = []
+                            self.history.record(command)
+                    if groups:
+                        self.set_selection(self.selected_shapes, self.selected_shape)
+                        print(f"Ungrouped {len(groups)} group(s)")
                 
-                elif event.type == pygame.MOUSEBUTTONUP:
-                    if event.button == 1:
-                        self.handle_mouse_up()
+                # Save / load
+                elif event.key == pygame.K_F5:
+                    self.save_scene()
+                elif event.key == pygame.K_F9 and self.scene_path and os.path.exists(self.scene_path):
+                    self.load_scene(self.scene_path)
                 
-                elif event.type == pygame.MOUSEMOTION:
-                    if event.buttons[0]:  # Left mouse button held
-                        self.handle_mouse_drag(event.pos[0], event.pos[1])
+                # View
+                elif event.key == pygame.K_f and len(self.shapes):
+                    self.shapes.flush()
+                    b = self.shapes.bounds
+                    self.viewport.fit((b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max()))
+                elif event.key == pygame.K_HOME:
+                    self.viewport.reset()
+                
+                # Profiler
+                elif event.key == pygame.K_F3:
+                    print(f"Profiler {'on' if self.profiler.toggle() else 'off'}")
+                elif event.key == pygame.K_F4:
+                    count = self.profiler.export_chrome_trace('trace.json')
+                    print(f"Exported {count} trace events to trace.json")
+                    print("\n".join(self.profiler.format_summary()))
             
-            self.render()
-            clock.tick(60)
-        
-        pygame.quit()
+            elif event.type == pygame.MOUSEWHEEL:
+                # Zoom about the cursor
+                x, y = pygame.mouse.get_pos()
+                self.viewport.zoom_at(x, self.screen_height - y, 1.2 ** event.y)
+            
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                wx, wy = self.to_world(event.pos)
+                
+                if event.button == 1:  # Left click
+                    if self.current_tool == 'select':
+                        self.select_shape_at(wx, wy)
+                        self.handle_mouse_down(event.pos[0], event.pos[1])
+                    elif self.current_tool == 'freehand':
+                        # Tolerance is in screen pixels, whatever the zoom
+                        self.stroke = StrokeSimplifier(self.FREEHAND_TOLERANCE / self.viewport.zoom)
+                        self.stroke.add(wx, wy)
+                    else:
+                        self.temp_points.append([wx, wy])
+                        if (self.current_tool == 'point' or 
+                            (self.current_tool in ['line', 'rectangle', 'ellipse'] and len(self.temp_points) == 2)):
+                            self.add_shape(self.create_shape(self.current_tool, self.temp_points))
+                            self.temp_points = []
+            
+            elif event.type == pygame.MOUSEBUTTONUP:
+                if event.button == 1:
+                    self.handle_mouse_up()
+        if pending_drag is not None:
+            self.handle_mouse_drag(pending_drag[0], pending_drag[1])
+        return running
 
-if _name_ == "_main_":
-    editor = Graphics2DEditor()
+if __name__ == "__main__":
+    editor = Graphics2DEditor(*sys.argv[1:2])
     editor.run()
\ No newline at end of file
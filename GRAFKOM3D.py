@@ -5,8 +5,140 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.arrays import vbo
 import sys
+import argparse
 
-class Cube3D:
+from glstate import GLStateCache
+from profiler import Profiler
+# Load OBJ file function (bonus feature)
+from objloader import load_obj_file, MeshData
+from meshprep import smooth_normals
+from softrender import SoftwareRenderer, save_frame
+
+class Mesh:
+    """Indexed triangle mesh kept in a vertex buffer and an index buffer.
+
+    vertices is a (V, 6) float32 array of position + normal, indices a
+    flat uint32 array. Both are uploaded once on the first draw and
+    drawn with a single glDrawElements call.
+    """
+    def __init__(self, vertices, indices):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.indices = np.ascontiguousarray(indices, dtype=np.uint32).ravel()
+        self.stride = self.vertices.shape[1] * 4
+        self.vertex_buffer = None
+        self.index_buffer = None
+        
+    @classmethod
+    def from_mesh_data(cls, data):
+        """Mesh from load_obj_file output; missing normals are generated"""
+        normals = data.normals
+        if normals is None:
+            normals = smooth_normals(data.positions, data.indices)
+        return cls(np.hstack([data.positions, normals]), data.indices)
+        
+    @property
+    def triangle_count(self):
+        return len(self.indices) // 3
+        
+    def bounds(self):
+        positions = self.vertices[:, :3]
+        return positions.min(axis=0), positions.max(axis=0)
+        
+    def upload(self):
+        self.vertex_buffer = vbo.VBO(self.vertices)
+        self.index_buffer = vbo.VBO(self.indices, target=GL_ELEMENT_ARRAY_BUFFER)
+        
+    def bind(self):
+        """Bind buffers and vertex arrays; draw_elements may then be called repeatedly"""
+        if self.vertex_buffer is None:
+            self.upload()
+        self.vertex_buffer.bind()
+        self.index_buffer.bind()
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glVertexPointer(3, GL_FLOAT, self.stride, self.vertex_buffer)
+        glNormalPointer(GL_FLOAT, self.stride, self.vertex_buffer + 12)
+        
+    def draw_elements(self):
+        glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, self.index_buffer)
+        
+    def unbind(self):
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        self.index_buffer.unbind()
+        self.vertex_buffer.unbind()
+        
+    def draw(self):
+        self.bind()
+        self.draw_elements()
+        self.unbind()
+        
+    def delete(self):
+        for buffer in (self.vertex_buffer, self.index_buffer):
+            if buffer is not None:
+                buffer.delete()
+        self.vertex_buffer = None
+        self.index_buffer = None
+
+class Object3D:
+    """A mesh placed in the scene with its own translation and rotation"""
+    def __init__(self, mesh, scale=1.0, offset=(0.0, 0.0, 0.0), lods=None):
+        self.mesh = mesh
+        # Coarser versions of mesh, used when the object is drawn in a Scene3D
+        self.lods = lods or []
+        # Normalization applied before the user transform (e.g. to fit a loaded model)
+        self.scale = scale
+        self.offset = offset
+        self.reset_transform()
+        
+    def reset_transform(self):
+        self.rotation_x = 0.0
+        self.rotation_y = 0.0
+        self.rotation_z = 0.0
+        self.translation_x = 0.0
+        self.translation_y = 0.0
+        self.translation_z = -5.0
+        
+    def matrix(self, include_base=True):
+        """4x4 matrix equal to the transforms applied in draw"""
+        m = compose_world_matrices([[self.translation_x, self.translation_y, self.translation_z]],
+                                   [[self.rotation_x, self.rotation_y, self.rotation_z]], [1.0])[0]
+        return m @ self.base_matrix() if include_base else m
+        
+    def base_matrix(self):
+        """The fitting scale and offset as a 4x4 matrix"""
+        base = np.diag([self.scale, self.scale, self.scale, 1.0])
+        base[:3, 3] = np.multiply(self.scale, self.offset)
+        return base
+        
+    @classmethod
+    def fitted(cls, mesh, size=2.0, lods=None):
+        """Object whose mesh is centered and scaled to fit a cube of the given size"""
+        low, high = mesh.bounds()
+        extent = float((high - low).max()) or 1.0
+        return cls(mesh, size / extent, tuple(-(low + high) / 2), lods)
+        
+    def draw(self, state=None):
+        if state is None:
+            state = GLStateCache()
+        glPushMatrix()
+        
+        # Apply transformations
+        glTranslatef(self.translation_x, self.translation_y, self.translation_z)
+        glRotatef(self.rotation_x, 1, 0, 0)
+        glRotatef(self.rotation_y, 0, 1, 0)
+        glRotatef(self.rotation_z, 0, 0, 1)
+        if self.scale != 1.0:
+            glScalef(self.scale, self.scale, self.scale)
+            # Scaled normals would dim the lighting
+            state.enable(GL_NORMALIZE)
+        glTranslatef(*self.offset)
+        
+        self.mesh.draw()
+        
+        glPopMatrix()
+
+class Cube3D(Object3D):
     def __init__(self):
         # Vertices kubus (x, y, z, nx, ny, nz) - posisi dan normal
         self.vertices = np.array([
@@ -63,37 +195,420 @@ class Cube3D:
             20, 21, 22, 20, 22, 23,
         ], dtype=np.uint32)
         
-        # Transform properties
-        self.rotation_x = 0.0
-        self.rotation_y = 0.0
-        self.rotation_z = 0.0
-        self.translation_x = 0.0
-        self.translation_y = 0.0
-        self.translation_z = -5.0
-        
-    def draw(self):
+        super().__init__(Mesh(self.vertices, self.indices))
+
+def compose_world_matrices(positions, rotations, scales, base=None):
+    """Batched Object3D transform: translate @ rotX @ rotY @ rotZ @ scale @ base.
+
+    rotations are degrees about x, y and z applied like the glRotatef
+    calls in Object3D.draw; returns an (N, 4, 4) array.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    ax, ay, az = np.radians(np.asarray(rotations, dtype=np.float64)).T
+    cx, sx, cy, sy, cz, sz = np.cos(ax), np.sin(ax), np.cos(ay), np.sin(ay), np.cos(az), np.sin(az)
+    scales = np.asarray(scales, dtype=np.float64)
+    m = np.zeros((len(positions), 4, 4))
+    # Rx @ Ry @ Rz written out
+    m[:, 0, 0] = cy * cz
+    m[:, 0, 1] = -cy * sz
+    m[:, 0, 2] = sy
+    m[:, 1, 0] = sx * sy * cz + cx * sz
+    m[:, 1, 1] = -sx * sy * sz + cx * cz
+    m[:, 1, 2] = -sx * cy
+    m[:, 2, 0] = -cx * sy * cz + sx * sz
+    m[:, 2, 1] = cx * sy * sz + sx * cz
+    m[:, 2, 2] = cx * cy
+    m[:, :3, :3] *= scales[:, None, None]
+    m[:, :3, 3] = positions
+    m[:, 3, 3] = 1.0
+    if base is not None:
+        m = m @ base
+    return m
+
+def transform_aabbs(matrices, low, high):
+    """World AABBs (N, 2, 3) of a local box [low, high] under N affine matrices"""
+    center = (np.asarray(low) + np.asarray(high)) / 2
+    extent = (np.asarray(high) - np.asarray(low)) / 2
+    world_center = matrices[:, :3, :3] @ center + matrices[:, :3, 3]
+    world_extent = np.abs(matrices[:, :3, :3]) @ extent
+    return np.stack([world_center - world_extent, world_center + world_extent], axis=1)
+
+def merge_instances(mesh, matrices):
+    """One Mesh holding a copy of mesh per 4x4 matrix, positions and normals pre-transformed"""
+    linear = matrices[:, :3, :3]
+    positions = mesh.vertices[:, :3] @ linear.transpose(0, 2, 1) + matrices[:, None, :3, 3]
+    # Normals go through the inverse transpose, as GL does
+    normals = mesh.vertices[:, 3:6] @ np.linalg.inv(linear)
+    vertices = np.concatenate([positions, normals], axis=2).reshape(-1, 6)
+    offsets = np.arange(len(matrices), dtype=np.uint32)[:, None] * np.uint32(len(mesh.vertices))
+    return Mesh(vertices, mesh.indices[None, :] + offsets)
+
+def boxes_vs_planes(boxes, planes):
+    """Classify AABBs against inward-facing planes (n . p + d >= 0 inside).
+
+    Returns (outside, inside) boolean arrays; a box that is neither
+    straddles at least one plane.
+    """
+    center = (boxes[:, 0] + boxes[:, 1]) / 2
+    extent = (boxes[:, 1] - boxes[:, 0]) / 2
+    dist = center @ planes[:, :3].T + planes[:, 3]
+    radius = extent @ np.abs(planes[:, :3]).T
+    return (dist + radius < 0).any(axis=1), (dist - radius >= 0).all(axis=1)
+
+class BVH:
+    """Bounding volume hierarchy over object AABBs, stored as flat arrays.
+
+    Every node covers the contiguous run order[start:start + count] of
+    object ids. Children always have larger node ids than their parent,
+    so refitting can walk the dirty nodes level by level from the
+    deepest up. The tree is rebuilt when refits have inflated the leaf
+    boxes to REBUILD_GROWTH times their surface area at build time.
+    """
+    LEAF_SIZE = 8
+    REBUILD_GROWTH = 2.0
+
+    def __init__(self):
+        self.build_count = 0
+        self.refit_count = 0
+        self.build(np.zeros((0, 2, 3)))
+
+    def build(self, bounds):
+        n = len(bounds)
+        centers = (bounds[:, 0] + bounds[:, 1]) / 2
+        self.order = np.arange(n)
+        start, count, left, parent, depth = [0], [n], [-1], [-1], [0]
+        stack = [0] if n > self.LEAF_SIZE else []
+        while stack:
+            node = stack.pop()
+            lo, cnt = start[node], count[node]
+            ids = self.order[lo:lo + cnt]
+            spread = centers[ids].max(axis=0) - centers[ids].min(axis=0)
+            axis = int(np.argmax(spread))
+            half = cnt // 2
+            # Median split on the widest axis
+            self.order[lo:lo + cnt] = ids[np.argpartition(centers[ids, axis], half)]
+            left[node] = len(start)
+            for child_start, child_count in ((lo, half), (lo + half, cnt - half)):
+                child = len(start)
+                start.append(child_start)
+                count.append(child_count)
+                left.append(-1)
+                parent.append(node)
+                depth.append(depth[node] + 1)
+                if child_count > self.LEAF_SIZE:
+                    stack.append(child)
+        self.start = np.array(start)
+        self.count = np.array(count)
+        self.left = np.array(left)
+        self.parent = np.array(parent)
+        self.depth = np.array(depth)
+        self.leaf_of = np.zeros(n, dtype=np.int64)
+        leaves = np.flatnonzero(self.left < 0)
+        leaves = leaves[np.argsort(self.start[leaves], kind='stable')]
+        self.leaf_of[self.order] = np.repeat(leaves, self.count[leaves])
+        self.bounds = np.zeros((len(start), 2, 3))
+        self.object_count = n
+        self.refit(bounds)
+        self.build_area = self.leaf_area()
+        self.build_count += 1
+
+    def leaf_area(self):
+        leaves = self.bounds[self.left < 0]
+        size = leaves[:, 1] - leaves[:, 0]
+        return float((size[:, 0] * size[:, 1] + size[:, 1] * size[:, 2] + size[:, 0] * size[:, 2]).sum())
+
+    def refit(self, bounds, ids=None):
+        """Update node boxes after the objects `ids` (default: all) moved"""
+        if ids is None:
+            nodes = np.arange(len(self.start))
+        else:
+            level = np.unique(self.leaf_of[ids])
+            levels = [level]
+            while len(level):
+                level = np.unique(self.parent[level])
+                level = level[level >= 0]
+                levels.append(level)
+            nodes = np.unique(np.concatenate(levels))
+        if len(nodes) == 0:
+            return
+        leaves = nodes[(self.left[nodes] < 0) & (self.count[nodes] > 0)]
+        if len(leaves):
+            # Leaf boxes straight from their objects with one reduceat each way
+            members, firsts = self.members(leaves)
+            boxes = bounds[members]
+            self.bounds[leaves, 0] = np.minimum.reduceat(boxes[:, 0], firsts)
+            self.bounds[leaves, 1] = np.maximum.reduceat(boxes[:, 1], firsts)
+        inner = nodes[self.left[nodes] >= 0]
+        for d in np.unique(self.depth[inner])[::-1]:
+            level = inner[self.depth[inner] == d]
+            a, b = self.bounds[self.left[level]], self.bounds[self.left[level] + 1]
+            self.bounds[level, 0] = np.minimum(a[:, 0], b[:, 0])
+            self.bounds[level, 1] = np.maximum(a[:, 1], b[:, 1])
+        if ids is not None:
+            self.refit_count += 1
+
+    def members(self, nodes):
+        """Object ids under the given nodes, concatenated, and where each node's run starts"""
+        counts = self.count[nodes]
+        firsts = np.cumsum(counts) - counts
+        index = np.arange(counts.sum()) - np.repeat(firsts - self.start[nodes], counts)
+        return self.order[index], firsts
+
+    def needs_rebuild(self):
+        return self.leaf_area() > self.REBUILD_GROWTH * max(self.build_area, 1e-12)
+
+    def clusters(self, max_count):
+        """Nodes covering every object once: the biggest subtrees of at most max_count objects"""
+        small = (self.count <= max_count) | (self.left < 0)
+        parent_small = np.where(self.parent >= 0, small[np.maximum(self.parent, 0)], False)
+        return np.flatnonzero(small & ~parent_small & (self.count > 0))
+
+    def cull(self, planes, object_bounds):
+        """Ids of objects whose AABB is not outside the planes, plus nodes visited"""
+        if self.object_count == 0:
+            return np.zeros(0, dtype=np.int64), 0
+        visible = []
+        visited = 0
+        frontier = np.zeros(1, dtype=np.int64)
+        while len(frontier):
+            visited += len(frontier)
+            outside, inside = boxes_vs_planes(self.bounds[frontier], planes)
+            # Nodes fully inside accept their whole run without further tests
+            visible.append(self.members(frontier[inside])[0])
+            partial = frontier[~outside & ~inside]
+            ids = self.members(partial[self.left[partial] < 0])[0]
+            out, _ = boxes_vs_planes(object_bounds[ids], planes)
+            visible.append(ids[~out])
+            inner = partial[self.left[partial] >= 0]
+            frontier = np.concatenate([self.left[inner], self.left[inner] + 1])
+        return np.concatenate(visible), visited
+
+class Scene3D:
+    """Many placed copies of one mesh with BVH frustum culling.
+
+    Per-object position, rotation (degrees) and uniform scale live in
+    NumPy arrays; world matrices and world AABBs of moved objects are
+    recomputed in one batch by update(), which also refits the BVH.
+    draw() culls against the camera frustum and batches the visible
+    objects that share a mesh and LOD level. Objects are grouped into
+    fixed clusters, BVH subtrees of at most CLUSTER_OBJECTS objects that
+    only change when the tree is rebuilt. Each cluster's copies of a level
+    are merged into vertex buffers already transformed to scene space, so
+    a cluster costs one glDrawElements per MERGE_VERTICES vertices instead
+    of one per object, and every cluster with a visible object is drawn
+    whole. A merged chunk is only rebuilt when one of its objects moves or
+    changes level, so neither camera motion nor objects crossing the
+    frustum re-merge the rest of the scene. Meshes too big to merge at
+    least two copies of fall back to one matrix load and draw call per
+    visible object.
+
+    With coarser lods given, every visible object also picks a level from
+    its projected size on screen: level k is used below LOD_PIXELS / 2**(k-1)
+    pixels. A level only changes once the size is LOD_HYSTERESIS past the
+    threshold, so objects near a boundary do not flicker.
+    """
+    LOD_PIXELS = 160.0
+    LOD_HYSTERESIS = 0.15
+    MERGE_VERTICES = 1 << 18
+    CLUSTER_OBJECTS = 256
+
+    def __init__(self, mesh, base=None, lods=None):
+        self.mesh = mesh
+        self.meshes = [mesh] + list(lods or [])
+        self.use_lod = True
+        # Local matrix applied to the mesh before each object's transform
+        self.base = np.eye(4) if base is None else np.asarray(base, dtype=np.float64)
+        self.positions = np.zeros((0, 3))
+        self.rotations = np.zeros((0, 3))
+        self.scales = np.zeros(0)
+        self.world = np.zeros((0, 4, 4))
+        self.bounds = np.zeros((0, 2, 3))
+        self.levels = np.zeros(0, dtype=np.int64)
+        self.bvh = BVH()
+        self._dirty = np.zeros(0, dtype=bool)
+        self._structure_changed = False
+        self._clusters = None   # (BVH build, members of each cluster)
+        self._cluster_of = np.zeros(0, dtype=np.int64)
+        self._cluster_version = np.zeros(0, dtype=np.int64)
+        self._merged = {}       # (cluster, level) -> (key, merged Meshes)
+        self.merge_count = 0    # object copies merged so far
+        self.stats = {'visited_nodes': 0, 'culled': 0, 'submitted': 0, 'triangles': 0, 'draw_calls': 0}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, positions, rotations=None, scales=None):
+        """Append objects; returns their ids"""
+        positions = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+        n = len(positions)
+        rotations = np.zeros((n, 3)) if rotations is None else np.broadcast_to(rotations, (n, 3))
+        scales = np.ones(n) if scales is None else np.broadcast_to(scales, (n,))
+        first = len(self)
+        self.positions = np.concatenate([self.positions, positions])
+        self.rotations = np.concatenate([self.rotations, rotations])
+        self.scales = np.concatenate([self.scales, scales])
+        self.world = np.concatenate([self.world, np.zeros((n, 4, 4))])
+        self.bounds = np.concatenate([self.bounds, np.zeros((n, 2, 3))])
+        self.levels = np.concatenate([self.levels, np.zeros(n, dtype=np.int64)])
+        self._dirty = np.concatenate([self._dirty, np.ones(n, dtype=bool)])
+        self._structure_changed = True
+        return np.arange(first, first + n)
+
+    def move(self, ids, positions=None, rotations=None, scales=None):
+        if positions is not None:
+            self.positions[ids] = positions
+        if rotations is not None:
+            self.rotations[ids] = rotations
+        if scales is not None:
+            self.scales[ids] = scales
+        self._dirty[ids] = True
+
+    def update(self):
+        ids = np.flatnonzero(self._dirty)
+        if len(ids) == 0:
+            return
+        self._dirty[ids] = False
+        self.world[ids] = compose_world_matrices(self.positions[ids], self.rotations[ids],
+                                                 self.scales[ids], self.base)
+        self.bounds[ids] = transform_aabbs(self.world[ids], *self.mesh.bounds())
+        if self._structure_changed:
+            self._structure_changed = False
+            self.bvh.build(self.bounds)
+        else:
+            self.bvh.refit(self.bounds, ids)
+            if self.bvh.needs_rebuild():
+                self.bvh.build(self.bounds)
+        if self._clusters is not None and self._clusters[0] == self._cluster_key():
+            # Still the same clusters: only the moved objects' chunks go stale
+            self._cluster_version[np.unique(self._cluster_of[ids])] += 1
+
+    def cull(self, planes):
+        """Visible object ids for world-space frustum planes; fills stats"""
+        self.update()
+        ids, visited = self.bvh.cull(planes, self.bounds)
+        self.stats = {'visited_nodes': visited, 'culled': len(self) - len(ids), 'submitted': len(ids),
+                      'triangles': len(ids) * self.mesh.triangle_count}
+        return ids
+
+    def screen_size(self, ids, camera, viewport_height, root=None):
+        """Projected diameter in pixels of the objects' bounding spheres"""
+        boxes = self.bounds[ids]
+        center = (boxes[:, 0] + boxes[:, 1]) / 2
+        if root is not None:
+            center = center @ root[:3, :3].T + root[:3, 3]
+        radius = np.linalg.norm(boxes[:, 1] - boxes[:, 0], axis=1) / 2
+        distance = np.maximum(np.linalg.norm(center - np.asarray(camera.position), axis=1), camera.near)
+        return radius / (distance * np.tan(np.radians(camera.fov) / 2)) * viewport_height
+
+    def select_lods(self, ids, sizes):
+        """Update self.levels for the given objects from their screen sizes"""
+        if len(self.meshes) == 1 or not self.use_lod:
+            self.levels[ids] = 0
+            return self.levels[ids]
+        thresholds = self.LOD_PIXELS / 2.0 ** np.arange(len(self.meshes) - 1)
+        coarser = (sizes[:, None] < thresholds * (1 - self.LOD_HYSTERESIS)).sum(axis=1)
+        finer = (sizes[:, None] < thresholds * (1 + self.LOD_HYSTERESIS)).sum(axis=1)
+        current = self.levels[ids]
+        # Only move once the size is clearly past a threshold
+        self.levels[ids] = np.where(coarser > current, coarser, np.minimum(current, finer))
+        return self.levels[ids]
+
+    def _cluster_key(self):
+        return self.bvh.build_count, self.CLUSTER_OBJECTS
+
+    def clusters(self):
+        """Cluster of every object, recomputed (dropping merged chunks) after a BVH build"""
+        if self._clusters is None or self._clusters[0] != self._cluster_key():
+            self.delete()
+            nodes = self.bvh.clusters(self.CLUSTER_OBJECTS)
+            members, firsts = self.bvh.members(nodes)
+            self._cluster_of = np.zeros(len(self), dtype=np.int64)
+            self._cluster_of[members] = np.repeat(np.arange(len(nodes)), self.bvh.count[nodes])
+            self._cluster_version = np.zeros(len(nodes), dtype=np.int64)
+            self._clusters = (self._cluster_key(), np.split(members, firsts[1:]))
+        return self._cluster_of
+
+    def merged_batches(self, cluster, level):
+        """Merged scene-space Meshes holding one cluster's objects at one LOD level.
+
+        Rebuilt only when an object of the cluster moved or changed level;
+        None when the mesh is too big for merging to pay off.
+        """
+        mesh = self.meshes[level]
+        per_batch = self.MERGE_VERTICES // max(len(mesh.vertices), 1)
+        if per_batch < 2:
+            return None
+        members = self._clusters[1][cluster]
+        ids = members[self.levels[members] == level]
+        key = (self._cluster_version[cluster], per_batch, ids.tobytes())
+        cached = self._merged.get((cluster, level))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        if cached is not None:
+            for batch in cached[1]:
+                batch.delete()
+        merged = [merge_instances(mesh, self.world[ids[start:start + per_batch]])
+                  for start in range(0, len(ids), per_batch)]
+        self.merge_count += len(ids)
+        self._merged[cluster, level] = (key, merged)
+        return merged
+
+    def delete(self):
+        """Free the GL buffers of merged batches"""
+        for _, merged in self._merged.values():
+            for batch in merged:
+                batch.delete()
+        self._merged = {}
+
+    def draw(self, camera, aspect, root=None, viewport_height=None, state=None):
+        """Draw visible objects; root is an optional scene-to-world matrix.
+
+        viewport_height (pixels) enables per-object LOD selection.
+        """
+        if state is None:
+            state = GLStateCache()
+        root = np.eye(4) if root is None else root
+        # Planes in world space become scene-space planes through the root matrix
+        ids = np.sort(self.cull(camera.frustum_planes(aspect) @ root))
+        levels = np.zeros(len(ids), dtype=np.int64)
+        if viewport_height is not None:
+            levels = self.select_lods(ids, self.screen_size(ids, camera, viewport_height, root))
+        view = camera.view_matrix() @ root
         glPushMatrix()
-        
-        # Apply transformations
-        glTranslatef(self.translation_x, self.translation_y, self.translation_z)
-        glRotatef(self.rotation_x, 1, 0, 0)
-        glRotatef(self.rotation_y, 0, 1, 0)
-        glRotatef(self.rotation_z, 0, 0, 1)
-        
-        # Draw cube using vertices and indices
-        glBegin(GL_TRIANGLES)
-        for i in range(0, len(self.indices), 3):
-            for j in range(3):
-                vertex_index = self.indices[i + j]
-                vertex = self.vertices[vertex_index]
-                
-                # Set normal for lighting
-                glNormal3f(vertex[3], vertex[4], vertex[5])
-                # Set vertex position
-                glVertex3f(vertex[0], vertex[1], vertex[2])
-        glEnd()
-        
+        # Object scales and the base matrix change normal lengths
+        state.enable(GL_NORMALIZE)
+        cluster_of = self.clusters()
+        triangles = draw_calls = drawn = 0
+        for level, mesh in enumerate(self.meshes):
+            at = ids[levels == level]
+            if len(at) == 0:
+                continue
+            # Whole clusters, including members just outside the frustum
+            merged = [self.merged_batches(cluster, level) for cluster in np.unique(cluster_of[at])]
+            if merged[0] is not None:
+                # GL wants column-major matrices
+                glLoadMatrixf(np.ascontiguousarray(view.T, dtype=np.float32))
+                for batch in (batch for batches in merged for batch in batches):
+                    batch.draw()
+                    draw_calls += 1
+                    drawn += batch.triangle_count // mesh.triangle_count
+                    triangles += batch.triangle_count
+                continue
+            modelview = np.ascontiguousarray((view @ self.world[at]).transpose(0, 2, 1), dtype=np.float32)
+            mesh.bind()
+            for matrix in modelview:
+                glLoadMatrixf(matrix)
+                mesh.draw_elements()
+            mesh.unbind()
+            triangles += len(at) * mesh.triangle_count
+            draw_calls += len(at)
+            drawn += len(at)
         glPopMatrix()
+        self.stats['draw_calls'] = draw_calls
+        self.stats['drawn'] = drawn
+        self.stats['triangles'] = triangles
+        self.stats['levels'] = np.bincount(levels, minlength=len(self.meshes)).tolist()
+        return self.stats
 
 class Camera:
     def __init__(self):
@@ -109,6 +624,42 @@ class Camera:
         glLoadIdentity()
         gluPerspective(self.fov, width/height, self.near, self.far)
         
+    def view_matrix(self):
+        """The gluLookAt matrix of setup_view as a NumPy array"""
+        eye, target, up = (np.asarray(v, dtype=np.float64) for v in (self.position, self.target, self.up))
+        f = target - eye
+        f /= np.linalg.norm(f)
+        s = np.cross(f, up)
+        s /= np.linalg.norm(s)
+        u = np.cross(s, f)
+        m = np.eye(4)
+        m[0, :3], m[1, :3], m[2, :3] = s, u, -f
+        m[:3, 3] = -m[:3, :3] @ eye
+        return m
+        
+    def projection_matrix(self, aspect):
+        """The gluPerspective matrix of setup_projection as a NumPy array"""
+        f = 1.0 / np.tan(np.radians(self.fov) / 2)
+        m = np.zeros((4, 4))
+        m[0, 0] = f / aspect
+        m[1, 1] = f
+        m[2, 2] = (self.far + self.near) / (self.near - self.far)
+        m[2, 3] = 2 * self.far * self.near / (self.near - self.far)
+        m[3, 2] = -1.0
+        return m
+        
+    def frustum_planes(self, aspect):
+        """(6, 4) world-space planes (a, b, c, d), inside where a*x + b*y + c*z + d >= 0"""
+        clip = self.projection_matrix(aspect) @ self.view_matrix()
+        planes = np.array([clip[3] + clip[0], clip[3] - clip[0],    # left, right
+                           clip[3] + clip[1], clip[3] - clip[1],    # bottom, top
+                           clip[3] + clip[2], clip[3] - clip[2]])   # near, far
+        return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+        
+    def view_key(self):
+        """Hashable summary of the view matrix set by setup_view"""
+        return tuple(self.position) + tuple(self.target) + tuple(self.up)
+        
     def setup_view(self):
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
@@ -159,7 +710,7 @@ class PhongLighting:
         glShadeModel(GL_SMOOTH)
 
 class Viewer3D:
-    def __init__(self):
+    def __init__(self, model_path=None, instances=0, on_demand=True):
         pygame.init()
         self.width = 1024
         self.height = 768
@@ -167,9 +718,19 @@ class Viewer3D:
         pygame.display.set_caption("3D Object Visualization - Phong Lighting")
         
         # Initialize components
-        self.cube = Cube3D()
+        self.model = self.load_model(model_path) if model_path else None
+        if self.model is None:
+            self.model = Cube3D()
+        # With instances > 0 the model is scattered as a Scene3D and moved as a whole
+        self.scene = self.make_scene(instances) if instances else None
+        self.frame_count = 0
         self.camera = Camera()
         self.lighting = PhongLighting()
+        self.gl_state = GLStateCache()
+        self.profiler = Profiler()
+        # Render on demand: redraw only after input changed the view
+        self.on_demand = on_demand
+        self.damaged = True
         
         # Mouse control
         self.mouse_dragging = False
@@ -178,6 +739,33 @@ class Viewer3D:
         # Setup OpenGL
         self.setup_opengl()
         
+    def load_model(self, path):
+        """Object3D for an .obj file, or None when it cannot be loaded"""
+        data = load_obj_file(path, preprocess=True, lod_levels=3)
+        if data is None or data.triangle_count == 0:
+            return None
+        return Object3D.fitted(Mesh.from_mesh_data(data),
+                               lods=[Mesh.from_mesh_data(lod) for lod in data.lods])
+        
+    def make_scene(self, count, seed=0):
+        """Scene3D with count randomly placed and rotated copies of the model"""
+        rng = np.random.default_rng(seed)
+        half = 2.5 * count ** (1 / 3)
+        scene = Scene3D(self.model.mesh, self.model.base_matrix(), self.model.lods)
+        scene.add(rng.uniform(-half, half, (count, 3)), rng.uniform(0, 360, (count, 3)),
+                  rng.uniform(0.3, 1.0, count))
+        return scene
+        
+    def save_snapshot(self, path="snapshot.png"):
+        """Render the current view headlessly with SoftwareRenderer and save it"""
+        renderer = SoftwareRenderer(self.width, self.height, self.camera, self.lighting)
+        if self.scene is not None:
+            image = renderer.render_scene(self.scene, self.model.matrix(include_base=False))
+        else:
+            image = renderer.render([(self.model.mesh, self.model.matrix())])
+        save_frame(path, image)
+        print(f"Snapshot disimpan ke {path}")
+        
     def setup_opengl(self):
         # Clear color
         glClearColor(0.1, 0.1, 0.1, 1.0)
@@ -188,48 +776,70 @@ class Viewer3D:
         # Setup lighting
         self.lighting.setup()
         
-    def handle_events(self):
-        for event in pygame.event.get():
+    def handle_events(self, events=None):
+        """Process input; returns False to quit. Drag motion is summed into one rotation per call"""
+        drag = None
+        for event in pygame.event.get() if events is None else events:
+            if event.type == pygame.MOUSEMOTION:
+                if self.mouse_dragging:
+                    drag = event.pos
+                continue
+            if drag is not None:
+                self.drag_to(drag)
+                drag = None
+            self.damaged = True
+            
             if event.type == pygame.QUIT:
                 return False
                 
             elif event.type == pygame.KEYDOWN:
                 # Keyboard transformations
                 if event.key == pygame.K_w:
-                    self.cube.translation_z += 0.5
+                    self.model.translation_z += 0.5
                 elif event.key == pygame.K_s:
-                    self.cube.translation_z -= 0.5
+                    self.model.translation_z -= 0.5
                 elif event.key == pygame.K_a:
-                    self.cube.translation_x -= 0.5
+                    self.model.translation_x -= 0.5
                 elif event.key == pygame.K_d:
-                    self.cube.translation_x += 0.5
+                    self.model.translation_x += 0.5
                 elif event.key == pygame.K_q:
-                    self.cube.translation_y += 0.5
+                    self.model.translation_y += 0.5
                 elif event.key == pygame.K_e:
-                    self.cube.translation_y -= 0.5
+                    self.model.translation_y -= 0.5
                     
                 # Rotation with arrow keys
                 elif event.key == pygame.K_UP:
-                    self.cube.rotation_x += 5
+                    self.model.rotation_x += 5
                 elif event.key == pygame.K_DOWN:
-                    self.cube.rotation_x -= 5
+                    self.model.rotation_x -= 5
                 elif event.key == pygame.K_LEFT:
-                    self.cube.rotation_y -= 5
+                    self.model.rotation_y -= 5
                 elif event.key == pygame.K_RIGHT:
-                    self.cube.rotation_y += 5
+                    self.model.rotation_y += 5
                 elif event.key == pygame.K_z:
-                    self.cube.rotation_z += 5
+                    self.model.rotation_z += 5
                 elif event.key == pygame.K_x:
-                    self.cube.rotation_z -= 5
+                    self.model.rotation_z -= 5
                     
                 # Reset transformations
                 elif event.key == pygame.K_r:
-                    self.cube.rotation_x = 0
-                    self.cube.rotation_y = 0
-                    self.cube.rotation_z = 0
-                    self.cube.translation_x = 0
-                    self.cube.translation_y = 0
-                    self.cube.translation_z = -5
+                    self.model.reset_transform()
+                    
+                # Toggle level of detail in scene mode
+                elif event.key == pygame.K_l and self.scene is not None:
+                    self.scene.use_lod = not self.scene.use_lod
+                    
+                # Save the current view through the software renderer
+                elif event.key == pygame.K_p:
+                    self.save_snapshot()
+                    
+                # Profiler: F3 on/off (with graph), F4 export Chrome trace
+                elif event.key == pygame.K_F3:
+                    print(f"Profiler {'aktif' if self.profiler.toggle() else 'nonaktif'}")
+                elif event.key == pygame.K_F4:
+                    count = self.profiler.export_chrome_trace('trace.json')
+                    print(f"{count} event trace disimpan ke trace.json")
+                    print("\n".join(self.profiler.format_summary()))
                     
                 # Change lighting position
                 elif event.key == pygame.K_1:
@@ -248,41 +858,73 @@ class Viewer3D:
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # Left mouse button
                     self.mouse_dragging = True
-                    self.last_mouse_pos = pygame.mouse.get_pos()
+                    self.last_mouse_pos = event.pos
                     
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:
                     self.mouse_dragging = False
-                    
-            elif event.type == pygame.MOUSEMOTION:
-                if self.mouse_dragging:
-                    mouse_pos = pygame.mouse.get_pos()
-                    dx = mouse_pos[0] - self.last_mouse_pos[0]
-                    dy = mouse_pos[1] - self.last_mouse_pos[1]
-                    
-                    # Rotate based on mouse movement
-                    self.cube.rotation_y += dx * 0.5
-                    self.cube.rotation_x += dy * 0.5
-                    
-                    self.last_mouse_pos = mouse_pos
+        if drag is not None:
+            self.drag_to(drag)
                     
         return True
     
+    def drag_to(self, mouse_pos):
+        """Rotate the model by the mouse movement since the last drag position"""
+        dx = mouse_pos[0] - self.last_mouse_pos[0]
+        dy = mouse_pos[1] - self.last_mouse_pos[1]
+        
+        # Rotate based on mouse movement
+        self.model.rotation_y += dx * 0.5
+        self.model.rotation_x += dy * 0.5
+        
+        self.last_mouse_pos = mouse_pos
+        self.damaged = True
+    
     def render(self):
+        profiler = self.profiler
+        self.gl_state.begin_frame()
+        
         # Clear buffers
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         
         # Setup camera view
-        self.camera.setup_view()
+        with profiler.scope('camera'):
+            self.camera.setup_view()
+            
+            # Update lighting position (only re-sent when the light or camera moved)
+            self.gl_state.light_position(GL_LIGHT0, self.lighting.diffuse_position,
+                                         self.camera.view_key())
         
-        # Update lighting position
-        glLightfv(GL_LIGHT0, GL_POSITION, self.lighting.diffuse_position)
+        # Draw model
+        self.frame_count += 1
+        caption = None
+        if self.scene is not None:
+            with profiler.scope('scene'):
+                stats = self.scene.draw(self.camera, self.width / self.height,
+                                        self.model.matrix(include_base=False), self.height,
+                                        self.gl_state)
+            if self.frame_count % 30 == 0:
+                caption = ("3D Scene - {submitted} visible, {drawn} drawn in {draw_calls} calls, {culled} culled, "
+                           "{visited_nodes} BVH nodes, {triangles} triangles, "
+                           "LOD {levels}".format(**stats))
+        else:
+            with profiler.scope('model'):
+                self.model.draw(self.gl_state)
         
-        # Draw cube
-        self.cube.draw()
+        # Frame-time graph; percentiles go to the caption
+        if profiler.enabled:
+            with profiler.scope('profiler'):
+                profiler.draw_graph(self.width, self.height)
+                if self.frame_count % 30 == 0 and profiler.frame_count:
+                    frame = profiler.summary()['frame']
+                    caption = (caption or "3D Object Visualization") + (
+                        " | frame p50 {p50:.1f} p95 {p95:.1f} p99 {p99:.1f} ms".format(**frame))
+        if caption:
+            pygame.display.set_caption(caption)
         
         # Swap buffers
-        pygame.display.flip()
+        with profiler.scope('swap'):
+            pygame.display.flip()
     
     def print_controls(self):
         print ("\n=== 3D OBJECT VISUALIZATION CONTROLS ===")
@@ -300,6 +942,10 @@ class Viewer3D:
         print("  5/6     - Gerak cahaya Z+/-")
         print("\nLAINNYA:")
         print("  R       - Reset semua transformasi")
+        print("  L       - LOD on/off (mode scene)")
+        print("  P       - Simpan snapshot (software renderer)")
+        print("  F3      - Profiler on/off (grafik waktu frame)")
+        print("  F4      - Ekspor trace.json (Chrome trace)")
         print("  ESC     - Keluar")
         print("=========================================\n")
     
@@ -309,52 +955,25 @@ class Viewer3D:
         running = True
         
         while running:
-            running = self.handle_events()
-            self.render()
+            # Idle: sleep on the event queue instead of redrawing an unchanged frame
+            continuous = not self.on_demand or self.profiler.enabled
+            if continuous or self.damaged:
+                events = pygame.event.get()
+            else:
+                events = [pygame.event.wait()] + pygame.event.get()
+            
+            self.profiler.begin_frame()
+            with self.profiler.scope('events'):
+                running = self.handle_events(events)
+            if continuous or self.damaged:
+                self.render()
+                self.damaged = False
+            self.profiler.end_frame()
             clock.tick(60)  # 60 FPS
             
         pygame.quit()
         sys.exit()
 
-# Load OBJ file function (bonus feature)
-def load_obj_file(filename):
-    """
-    Load vertices dan faces dari file .obj
-    Return: vertices array, faces array
-    """
-    vertices = []
-    faces = []
-    normals = []
-    
-    try:
-        with open(filename, 'r') as file:
-            for line in file:
-                line = line.strip()
-                if line.startswith('v '):  # Vertex
-                    parts = line.split()
-                    vertex = [float(parts[1]), float(parts[2]), float(parts[3])]
-                    vertices.append(vertex)
-                elif line.startswith('vn '):  # Normal
-                    parts = line.split()
-                    normal = [float(parts[1]), float(parts[2]), float(parts[3])]
-                    normals.append(normal)
-                elif line.startswith('f '):  # Face
-                    parts = line.split()[1:]  # Skip 'f'
-                    face_indices = []
-                    for part in parts:
-                        # Handle format: vertex/texture/normal or vertex//normal
-                        indices = part.split('/')
-                        vertex_idx = int(indices[0]) - 1  # OBJ indices start from 1
-                        face_indices.append(vertex_idx)
-                    faces.append(face_indices)
-                    
-        print(f"Loaded {len(vertices)} vertices and {len(faces)} faces from {filename}")
-        return vertices, faces, normals
-        
-    except FileNotFoundError:
-        print(f"File {filename} tidak ditemukan. Menggunakan kubus default.")
-        return None, None, None
-
 if __name__ == "__main__":
     print("Starting 3D Object Visualization...")
     print("Implementasi fitur:")
@@ -364,8 +983,16 @@ if __name__ == "__main__":
     print("[OK] Kamera dengan proyeksi perspektif (gluPerspective, gluLookAt)")
     print("[OK] Bonus: Fungsi load file .obj")
     
-    # Uncomment baris berikut untuk load file .obj
-    # vertices, faces, normals = load_obj_file("model.obj")
+    # Jalankan dengan path file .obj untuk menampilkan model tersebut:
+    #   python GRAFKOM3D.py model.obj
+    # atau banyak salinan model dengan frustum culling:
+    #   python GRAFKOM3D.py model.obj --instances 100000
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model', nargs='?')
+    parser.add_argument('--instances', type=int, default=0)
+    parser.add_argument('--continuous', action='store_true',
+                        help="gambar ulang tiap frame walau tidak ada perubahan")
+    args = parser.parse_args()
     
-    viewer = Viewer3D()
+    viewer = Viewer3D(args.model, args.instances, on_demand=not args.continuous)
     viewer.run()
\ No newline at end of file
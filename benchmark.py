@@ -0,0 +1,574 @@
+"""Headless performance benchmarks for the 2D editor and 3D viewer cores.
+
+Run: python benchmark.py [case ...] [--max-shapes N]
+                         [--save FILE] [--compare FILE] [--threshold 0.25]
+
+Every case prints a table and records its timings under stable names.
+--save writes them as a JSON baseline; --compare checks the run against
+a baseline and exits with status 1 when any metric is slower than the
+baseline by more than the threshold (a fraction, 0.25 = 25%). GL draw
+submission is measured against a recording stub, so no display or GL
+driver is needed.
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# The editor modules import pygame; keep it quiet and display-free
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+
+import glstate
+import GRAFKOM2D
+import GRAFKOM3D
+from GRAFKOM2D import (Graphics2DEditor, Shape, ShapeRenderer, ShapeStore, Viewport2D, load_scene, save_scene,
+                       tessellate_ellipse)
+from GRAFKOM3D import Camera, Cube3D, Mesh, Scene3D
+from export2d import ShapeRasterizer, write_svg
+from freehand import StrokeSimplifier, polyline_deviation
+from meshprep import build_lods, weld
+from objloader import MeshData, load_obj_file
+from softrender import write_png
+
+
+def make_rect_store(n, size=20.0, density=1.0 / 900.0, seed=0):
+    """Store with n small rectangles scattered at constant density"""
+    rng = np.random.default_rng(seed)
+    side = math.sqrt(n / density)
+    corners = rng.uniform(0, side, size=(n, 2))
+    store = ShapeStore(vertex_capacity=4 * n, shape_capacity=n)
+    for x, y in corners.tolist():
+        store.append(Shape('rectangle', [[x, y], [x + size, y], [x + size, y + size], [x, y + size]],
+                           (1.0, 1.0, 1.0)))
+    store.flush()
+    return store, side
+
+
+def timed(fn, repeat, rounds=1):
+    """Mean seconds per call; with rounds > 1 the best of several means"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def headless_editor(store=None):
+    """Graphics2DEditor without a window: enough state for create_shape and picking"""
+    editor = Graphics2DEditor.__new__(Graphics2DEditor)
+    editor.shapes = store if store is not None else ShapeStore()
+    editor.current_color = (1.0, 1.0, 1.0)
+    editor.line_thickness = 1.0
+    editor.selected_shape = None
+    editor.selected_shapes = []
+    editor.viewport = Viewport2D(1200, 800)
+    return editor
+
+
+class _RecordingBuffer:
+    """Stand-in for OpenGL.arrays.vbo.VBO"""
+    def __init__(self, calls, data, target=None):
+        self.calls = calls
+        self.data = data
+
+    def __add__(self, offset):
+        return self
+
+    def bind(self):
+        self.calls['VBO.bind'] += 1
+
+    def unbind(self):
+        self.calls['VBO.unbind'] += 1
+
+    def delete(self):
+        pass
+
+
+@contextlib.contextmanager
+def recording_gl(*modules):
+    """Replace the gl* functions (and vbo) of modules with call counters.
+
+    Yields the Counter of calls by name; the real functions are restored
+    on exit. This measures the Python side of draw submission only.
+    """
+    calls = Counter()
+    saved = []
+    for module in modules:
+        for name, value in list(vars(module).items()):
+            if name.startswith('gl') and callable(value):
+                saved.append((module, name, value))
+                setattr(module, name, lambda *args, _name=name: calls.update((_name,)))
+        if hasattr(module, 'vbo'):
+            saved.append((module, 'vbo', module.vbo))
+            module.vbo = type('vbo', (), {'VBO': staticmethod(
+                lambda data, target=None: _RecordingBuffer(calls, data, target))})
+    try:
+        yield calls
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+
+def bench_select(max_shapes, results):
+    """Click latency of the grid-backed hit test against a linear scan"""
+    print("select_shape_at: click latency vs scene size")
+    rng = np.random.default_rng(1)
+    n = 1000
+    while n <= max_shapes:
+        store, side = make_rect_store(n)
+        clicks = rng.uniform(0, side, size=(200, 2)).tolist()
+        it = iter(clicks * 1000)
+        grid_us = timed(lambda: store.query_point(*next(it)), len(clicks), 5) * 1e6
+        editor = headless_editor(store)
+        select_us = timed(lambda: editor.select_shape_at(*next(it)), len(clicks), 5) * 1e6
+        results[f'select.query_point.{n}_us'] = grid_us
+        results[f'select.select_shape_at.{n}_us'] = select_us
+
+        line = ''
+        if n <= 10000:
+            x, y = clicks[0]
+            linear_us = timed(lambda: [s for s in reversed(store) if s.is_point_inside((x, y))][:1], 3) * 1e6
+            line = f"  linear scan {linear_us:12.1f} us"
+        print(f"  {n:>8} shapes  grid {grid_us:8.1f} us/click  select_shape_at {select_us:8.1f} us{line}")
+        n *= 10
+
+
+def bench_transform(max_shapes, results):
+    """Shape.update_transform + apply_transform by vertex count, and store flushes by shape count"""
+    print("update_transform/apply_transform: standalone shape vs vertex count")
+    for vertices in (4, 64, 1024, 16384):
+        shape = Shape('ellipse', tessellate_ellipse(0.0, 0.0, 100.0, 50.0, vertices), (1.0, 1.0, 1.0))
+
+        def step():
+            shape.rotation_angle += 1
+            shape.update_transform()
+            shape.apply_transform()
+        step_us = timed(step, 200, 5) * 1e6
+        results[f'transform.apply_transform.{vertices}_vertices_us'] = step_us
+        print(f"  {vertices:>8} vertices  {step_us:8.1f} us/update")
+
+    print("update_transform in a ShapeStore: flush after editing 1% / all shapes")
+    rng = np.random.default_rng(4)
+    n = 1000
+    while n <= min(max_shapes, 100000):
+        store, _ = make_rect_store(n)
+        shapes = list(store)
+        few = [shapes[i] for i in rng.choice(n, max(1, n // 100), replace=False).tolist()]
+
+        def edit(selection):
+            for shape in selection:
+                shape.rotation_angle += 1
+                shape.update_transform()
+            store.flush()
+        few_ms = timed(lambda: edit(few), 20, 3) * 1e3
+        all_ms = timed(lambda: edit(shapes), 3) * 1e3
+        results[f'transform.flush_1pct.{n}_shapes_ms'] = few_ms
+        results[f'transform.flush_all.{n}_shapes_ms'] = all_ms
+        print(f"  {n:>8} shapes  1% edited {few_ms:8.2f} ms  all edited {all_ms:8.2f} ms")
+        n *= 10
+
+
+def bench_groups(max_shapes, results):
+    """Moving a group of shapes vs moving the same shapes one by one"""
+    print("groups: drag one group vs every member shape (one frame each)")
+    n = 5000
+    while n <= min(max_shapes, 100000):
+        store, _ = make_rect_store(n)
+        shapes = list(store)
+        half = store.group(shapes[:n // 2])
+        store.group(groups=[half])
+        store.flush()
+
+        def move_group():
+            half.drag_offset[0] += 1
+            store.flush()
+
+        def move_shapes():
+            for shape in shapes[:n // 2]:
+                shape.drag_offset[0] += 1
+            store.flush()
+        before = store.rebuild_counts.copy()
+        group_ms = timed(move_group, 10, 3) * 1e3
+        touched = int((store.rebuild_counts != before).sum())
+        shapes_ms = timed(move_shapes, 3) * 1e3
+        results[f'groups.move_group.{n // 2}_ms'] = group_ms
+        results[f'groups.move_shapes.{n // 2}_ms'] = shapes_ms
+        print(f"  {n // 2:>8} shapes in the group  group {group_ms:8.2f} ms  per shape {shapes_ms:8.2f} ms  "
+              f"({touched} of {n} shapes re-transformed, {store.group_rebuild_counts.tolist()} group rebuilds)")
+        n *= 10
+
+
+def bench_viewport(max_shapes, results):
+    """ShapeRenderer frame cost without a viewport, zoomed in (culled) and fit-all (LOD points)"""
+    print("viewport: 1200x800 view panned 1 px per frame; CPU time and vertices submitted")
+    n = 10000
+    while n <= min(max_shapes, 1000000):
+        store, side = make_rect_store(n)
+        views = {'all': None, 'zoom_1x': Viewport2D(1200, 800), 'fit': Viewport2D(1200, 800)}
+        views['zoom_1x'].center = [side / 2, side / 2]
+        views['fit'].fit((0, 0, side, side))
+        line = []
+        with recording_gl(GRAFKOM2D, glstate):
+            renderer = ShapeRenderer(store)
+            for name, view in views.items():
+                def frame():
+                    if view is not None:
+                        view.pan(1, 0)
+                    return renderer.draw(view)
+                stats = dict(frame())
+                frame_ms = timed(frame, 10, 3) * 1e3
+                results[f'viewport.{name}.{n}_ms'] = frame_ms
+                line.append(f"{name} {frame_ms:6.2f} ms {stats['vertices']:>8} verts "
+                            f"({stats['lod']} LOD)")
+        print(f"  {n:>8} shapes  " + "  ".join(line))
+        n *= 10
+
+
+def bench_create(max_shapes, results):
+    """create_shape for every tool, plus appending the result to the store"""
+    print("create_shape: per tool (two clicks a few hundred pixels apart)")
+    editor = headless_editor()
+    rng = np.random.default_rng(5)
+    clicks = rng.uniform(0, 800, size=(256, 2, 2)).tolist()
+    for tool in ('point', 'line', 'rectangle', 'ellipse'):
+        it = iter(clicks * 100)
+        create_us = timed(lambda: editor.create_shape(tool, next(it)), len(clicks), 5) * 1e6
+        store = ShapeStore()
+        append_us = timed(lambda: store.append(editor.create_shape(tool, next(it))), len(clicks), 5) * 1e6
+        results[f'create.{tool}_us'] = create_us
+        results[f'create.{tool}_append_us'] = append_us
+        print(f"  {tool:>10}  create {create_us:7.1f} us  create + append {append_us:7.1f} us")
+
+
+def bench_draw(max_shapes, results):
+    """Python-side draw submission of Shape.draw and Cube3D.draw (recording GL stub)"""
+    print("draw submission: time and GL calls per draw")
+    state = glstate.GLStateCache()
+    shapes = {
+        'point': Shape('point', [[10, 10]], (1.0, 0.0, 0.0), 2),
+        'line': Shape('line', [[10, 10], [200, 120]], (0.0, 1.0, 0.0)),
+        'rectangle': Shape('rectangle', [[10, 10], [90, 10], [90, 60], [10, 60]], (0.0, 0.0, 1.0)),
+        'ellipse': Shape('ellipse', tessellate_ellipse(100.0, 100.0, 80.0, 40.0, 64), (1.0, 1.0, 0.0)),
+    }
+    shapes['selected'] = Shape('rectangle', [[10, 10], [90, 10], [90, 60], [10, 60]], (1.0, 1.0, 1.0))
+    shapes['selected'].selected = True
+    with recording_gl(GRAFKOM2D, GRAFKOM3D, glstate) as calls:
+        for name, shape in shapes.items():
+            shape.draw(state)
+            calls.clear()
+            draw_us = timed(lambda: shape.draw(state), 500, 5) * 1e6
+            per_draw = sum(calls.values()) / 2500
+            results[f'draw.shape_{name}_us'] = draw_us
+            results[f'draw.shape_{name}_calls'] = per_draw
+            print(f"  Shape {name:>10}  {draw_us:7.1f} us  {per_draw:5.1f} GL calls")
+
+        cube = Cube3D()
+        cube.draw()
+        calls.clear()
+        draw_us = timed(cube.draw, 500, 5) * 1e6
+        per_draw = sum(calls.values()) / 2500
+        results['draw.cube3d_us'] = draw_us
+        results['draw.cube3d_calls'] = per_draw
+        print(f"  Cube3D            {draw_us:7.1f} us  {per_draw:5.1f} GL calls")
+
+
+def record_strokes(count=24, seed=6):
+    """Synthetic mouse recordings: smooth random curves sampled like MOUSEMOTION.
+
+    Positions are whole pixels a few pixels apart with hand jitter and no
+    repeated samples, as pygame reports them; one straight stroke and one
+    slow, dense circle are included as extremes.
+    """
+    rng = np.random.default_rng(seed)
+    strokes = []
+    for i in range(count):
+        t = np.linspace(0, 1, int(rng.integers(300, 3000)))
+        if i == 0:
+            xy = np.column_stack([100 + 800 * t, 100 + 300 * t])
+        elif i == 1:
+            xy = 400 + 150 * np.column_stack([np.cos(2 * np.pi * t), np.sin(2 * np.pi * t)])
+        else:
+            freq = rng.uniform(0.5, 4.0, size=(2, 3))
+            amp = rng.uniform(20, 200, size=(2, 3))
+            phase = rng.uniform(0, 2 * np.pi, size=(2, 3))
+            xy = 400 + np.stack([(amp[k] * np.sin(2 * np.pi * freq[k] * t[:, None] + phase[k])).sum(axis=1)
+                                 for k in range(2)], axis=1)
+        xy = np.round(xy + rng.normal(0, 0.3, xy.shape))
+        keep = np.r_[True, np.any(xy[1:] != xy[:-1], axis=1)]
+        strokes.append(xy[keep])
+    return strokes
+
+
+def bench_freehand(max_shapes, results):
+    """StrokeSimplifier on recorded strokes: compression, deviation and cost per sample"""
+    strokes = record_strokes()
+    samples = sum(len(stroke) for stroke in strokes)
+    print(f"freehand: {len(strokes)} recorded strokes, {samples} samples")
+    for tolerance in (0.5, 1.5, 3.0):
+        def simplify():
+            out = []
+            for stroke in strokes:
+                simplifier = StrokeSimplifier(tolerance)
+                for x, y in stroke.tolist():
+                    simplifier.add(x, y)
+                out.append(simplifier.finish())
+            return out
+        simplified = simplify()
+        add_us = timed(simplify, 1, 3) / samples * 1e6
+        vertices = sum(len(points) for points in simplified)
+        deviation = max(polyline_deviation(stroke, points) for stroke, points in zip(strokes, simplified))
+        results[f'freehand.vertices_per_100_samples.tol_{tolerance}'] = 100 * vertices / samples
+        results[f'freehand.add.tol_{tolerance}_us'] = add_us
+        print(f"  tolerance {tolerance:3.1f} px  {vertices:>6} vertices  {samples / vertices:5.1f}x smaller  "
+              f"max deviation {deviation:4.2f} px  {add_us:5.1f} us/sample")
+
+
+def bench_export(max_shapes, results):
+    """Headless PNG/SVG export of saved scenes: thumbnails and a large tiled canvas"""
+    print(f"export2d: saved scene -> PNG/SVG ({os.cpu_count()} CPUs)")
+    with tempfile.TemporaryDirectory() as tmp:
+        n = 1000
+        while n <= min(max_shapes, 100000):
+            path = os.path.join(tmp, f'rects{n}.gk2d')
+            save_scene(make_rect_store(n)[0], path)
+            store = load_scene(path)
+            store.flush()
+            row = []
+            for width in (512, 2048):
+                rasterizer = ShapeRasterizer(width, width)
+                png_s = timed(lambda: write_png(os.path.join(tmp, 'out.png'), rasterizer.render(store)), 1, 3)
+                results[f'export.png_{width}.{n}_ms'] = png_s * 1e3
+                row.append(f"PNG {width}px {png_s * 1e3:8.1f} ms ({n / png_s:7.0f} shapes/s, "
+                           f"{rasterizer.stats['tiles']:>3} tiles)")
+            svg_s = timed(lambda: write_svg(os.path.join(tmp, 'out.svg'), store, 512, 512), 1, 3)
+            results[f'export.svg.{n}_ms'] = svg_s * 1e3
+            row.append(f"SVG {svg_s * 1e3:7.1f} ms ({n / svg_s:7.0f} shapes/s)")
+            print(f"  {n:>7} shapes  " + "  ".join(row))
+            n *= 10
+
+
+def write_grid_obj(path, triangles, seed=0):
+    """Synthetic OBJ: a noisy height-field grid with v/vt/vn quad faces"""
+    side = max(2, int(math.sqrt(triangles / 2)) + 1)
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:side, 0:side].reshape(2, -1)
+    v = np.column_stack([x, rng.normal(0, 0.1, x.size), y]).astype(np.float32)
+    i = (y * side + x).reshape(side, side)[:-1, :-1].ravel() + 1
+    quads = np.column_stack([i, i + 1, i + side + 1, i + side])
+    corner = np.repeat(quads, 3, axis=1).astype(np.int64)
+    with open(path, 'w') as f:
+        f.write(''.join(f"v {a:.5f} {b:.5f} {c:.5f}\n" for a, b, c in v.tolist()))
+        f.write(''.join(f"vt {a / side:.5f} {b / side:.5f}\n" for a, b in zip(x.tolist(), y.tolist())))
+        f.write("vn 0 1 0\n")
+        corner[:, 2::3] = 1
+        f.write(''.join("f %d/%d/%d %d/%d/%d %d/%d/%d %d/%d/%d\n" % tuple(row) for row in corner.tolist()))
+    return 2 * len(quads)
+
+
+def bench_load(max_shapes, results):
+    """load_obj_file on generated OBJ files of increasing size (cold parse and cache hit)"""
+    print("load_obj_file: time vs file size")
+    with tempfile.TemporaryDirectory() as tmp:
+        target = 1000
+        while target <= min(max_shapes, 1000000):
+            path = os.path.join(tmp, f'grid{target}.obj')
+            triangles = write_grid_obj(path, target)
+            size_mb = os.path.getsize(path) / 2 ** 20
+            with contextlib.redirect_stdout(None):
+                parse_ms = timed(lambda: load_obj_file(path, use_cache=False), 1, 3) * 1e3
+                load_obj_file(path)
+                cached_ms = timed(lambda: load_obj_file(path), 1, 3) * 1e3
+            results[f'load.parse.{target}_tris_ms'] = parse_ms
+            results[f'load.cached.{target}_tris_ms'] = cached_ms
+            print(f"  {triangles:>8} tris {size_mb:7.2f} MB  parse {parse_ms:9.2f} ms  "
+                  f"cache hit {cached_ms:7.2f} ms  ({triangles / parse_ms / 1e3:.2f} M tris/s)")
+            target *= 10
+
+
+def bench_obj(max_shapes, results):
+    """OBJ parse time against the number of worker processes"""
+    triangles = min(max_shapes, 2000000)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'grid.obj')
+        triangles = write_grid_obj(path, triangles)
+        size_mb = os.path.getsize(path) / 2 ** 20
+        print(f"load_obj_file: {triangles} triangles, {size_mb:.1f} MB, {os.cpu_count()} CPUs")
+        workers = 1
+        base = None
+        while workers <= max(4, os.cpu_count() or 1):
+            seconds = timed(lambda: load_obj_file(path, use_cache=False, workers=workers,
+                                                  chunk_bytes=8 * 2 ** 20), 1)
+            base = base or seconds
+            results[f'obj.{workers}_workers_s'] = seconds
+            print(f"  {workers:>3} workers  {seconds:8.3f} s  speedup {base / seconds:5.2f}x")
+            workers *= 2
+
+
+def bench_scene(max_shapes, results):
+    """BVH build, incremental refit and frustum cull for a Scene3D"""
+    print("Scene3D: BVH frustum culling vs object count")
+    rng = np.random.default_rng(2)
+    camera = Camera()
+    planes = camera.frustum_planes(4 / 3)
+    n = 1000
+    while n <= min(max_shapes, 1000000):
+        scene = Scene3D(Cube3D().mesh)
+        half = 2.5 * n ** (1 / 3)
+        scene.add(rng.uniform(-half, half, (n, 3)), rng.uniform(0, 360, (n, 3)))
+        build_ms = timed(scene.update, 1) * 1e3
+        moved = rng.choice(n, max(1, n // 100), replace=False)
+
+        def refit():
+            scene.move(moved, positions=scene.positions[moved] + rng.normal(0, 0.1, (len(moved), 3)))
+            scene.update()
+        refit_ms = timed(refit, 5) * 1e3
+        cull_ms = timed(lambda: scene.cull(planes), 5) * 1e3
+        stats = scene.stats
+        results[f'scene.build.{n}_ms'] = build_ms
+        results[f'scene.refit_1pct.{n}_ms'] = refit_ms
+        results[f'scene.cull.{n}_ms'] = cull_ms
+        print(f"  {n:>8} objects  build {build_ms:8.1f} ms  refit 1% {refit_ms:7.2f} ms  "
+              f"cull {cull_ms:7.2f} ms  ({stats['submitted']} drawn, {stats['visited_nodes']} nodes)")
+        n *= 10
+
+
+def make_sphere(rings, segments):
+    """Welded UV sphere of radius 1 as MeshData"""
+    theta, phi = np.meshgrid(np.linspace(0, np.pi, rings + 1),
+                             np.linspace(0, 2 * np.pi, segments, endpoint=False), indexing='ij')
+    positions = np.stack([np.sin(theta) * np.cos(phi), np.cos(theta), np.sin(theta) * np.sin(phi)], -1)
+    row = np.arange(rings)[:, None] * segments
+    col = np.arange(segments)[None, :]
+    a, b = (row + col).ravel(), (row + (col + 1) % segments).ravel()
+    c, d = b + segments, a + segments
+    indices = np.concatenate([np.stack([a, b, c], 1), np.stack([a, c, d], 1)]).ravel()
+    positions, indices, _, _ = weld(positions.reshape(-1, 3).astype(np.float32), indices)
+    return MeshData(positions, indices)
+
+
+def bench_lod(max_shapes, results):
+    """Triangles submitted per frame with and without LOD along a camera flight"""
+    sphere = make_sphere(200, 400)
+    start = time.perf_counter()
+    lods = build_lods(sphere, 4)
+    build_s = time.perf_counter() - start
+    print(f"LOD: {sphere.triangle_count} triangle sphere -> "
+          f"{', '.join(str(lod.triangle_count) for lod in lods)} in {build_s:.2f} s")
+    meshes = [Mesh(np.hstack([m.positions, m.positions]), m.indices) for m in [sphere] + lods]
+    n = min(max_shapes, 10000)
+    rng = np.random.default_rng(3)
+    camera = Camera()
+    camera.far = 1000.0
+    aspect, height = 4 / 3, 768
+    positions = rng.uniform(-100, 100, (n, 3))
+    for hysteresis in (Scene3D.LOD_HYSTERESIS, 0.0):
+        scene = Scene3D(meshes[0], lods=meshes[1:])
+        scene.LOD_HYSTERESIS = hysteresis
+        scene.add(positions)
+        full = reduced = switches = 0
+        select_s = 0.0
+        frames = 200
+        for frame in range(frames):
+            # Fly forward with a small sway so objects hover around thresholds
+            z = 150 - frame + 2 * math.sin(frame / 3)
+            camera.position = [0.0, 0.0, z]
+            camera.target = [0.0, 0.0, z - 1]
+            ids = scene.cull(camera.frustum_planes(aspect))
+            before = scene.levels[ids].copy()
+            start = time.perf_counter()
+            levels = scene.select_lods(ids, scene.screen_size(ids, camera, height))
+            select_s += time.perf_counter() - start
+            switches += int((levels != before).sum())
+            full += len(ids) * sphere.triangle_count
+            reduced += int(np.array([m.triangle_count for m in meshes])[levels].sum())
+        results[f'lod.triangles_per_frame.h{hysteresis:.2f}'] = reduced / frames
+        results[f'lod.select.h{hysteresis:.2f}_ms'] = select_s / frames * 1e3
+        print(f"  {n} objects, hysteresis {hysteresis:.2f}: {full / frames / 1e6:8.2f} M tris/frame without LOD, "
+              f"{reduced / frames / 1e6:6.3f} M with ({full / max(reduced, 1):5.1f}x fewer), "
+              f"{switches / frames:6.1f} level switches/frame, select {select_s / frames * 1e3:.2f} ms")
+
+
+CASES = {
+    'transform': bench_transform,
+    'select': bench_select,
+    'groups': bench_groups,
+    'viewport': bench_viewport,
+    'create': bench_create,
+    'freehand': bench_freehand,
+    'export': bench_export,
+    'draw': bench_draw,
+    'load': bench_load,
+    'obj': bench_obj,
+    'scene': bench_scene,
+    'lod': bench_lod,
+}
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    """Print metrics against a baseline; returns the names that regressed past threshold"""
+    regressions = []
+    print(f"\nCompared with baseline ({threshold:.0%} threshold):")
+    for name in sorted(results.keys() & baseline.keys()):
+        old, new = baseline[name], results[name]
+        ratio = new / old if old > 0 else (1.0 if new == old else float('inf'))
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"  {name:<45} {old:12.4g} -> {new:12.4g}  {ratio:6.2f}x{flag}")
+    missing = sorted(baseline.keys() - results.keys())
+    if missing:
+        print(f"  ({len(missing)} baseline metrics not measured in this run)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cases', nargs='*', help=f"cases to run (default: all of {', '.join(CASES)})")
+    parser.add_argument('--max-shapes', type=int, default=1000000)
+    parser.add_argument('--save', metavar='FILE', help="write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='FILE', help="fail if slower than this baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed slowdown as a fraction (default 0.25)")
+    args = parser.parse_args()
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+    results = {}
+    for name in args.cases or CASES:
+        CASES[name](args.max_shapes, results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'max_shapes': args.max_shapes,
+                       'results': results}, f, indent=1, sort_keys=True)
+        print(f"\nSaved {len(results)} metrics to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""Headless PNG and SVG export of 2D editor scenes (.gk2d).
+
+Run: python export2d.py SCENE [--png FILE] [--svg FILE] [--size WxH | --scale S]
+                              [--tile N] [--workers N]
+
+ShapeRasterizer draws a ShapeStore without a window or GL context. Every
+shape becomes primitives in output pixels: line, outline and polyline
+edges are segments with round ends, points are squares as GL_POINTS
+draws them. Line widths and point sizes stay in pixels at any scale, as
+in the editor. Fragments are generated per segment along its major axis
+(a short run of pixels per column), so long diagonal edges cost no more
+than their length. Coverage comes from the exact distance to the
+primitive, which anti-aliases the edges. Within a shape the highest
+coverage of a pixel wins, and shapes are blended over each other in
+store (z) order. Primitives are binned into tiles, and tiles are
+rendered in a thread pool (NumPy releases the GIL in its inner loops).
+
+write_svg writes the same view as SVG elements directly.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+
+from GRAFKOM2D import SHAPE_KINDS, load_scene
+from softrender import write_png
+
+TILE_SIZE = 256
+BACKGROUND = (0.1, 0.1, 0.15)  # the editor's clear colour
+
+KIND_POINT = SHAPE_KINDS['point']
+KIND_LINE = SHAPE_KINDS['line']
+KIND_POLYLINE = SHAPE_KINDS['polyline']
+
+
+def fit_view(bounds, width, height, margin=0.05):
+    """(scale, offset_x, offset_y) mapping a world box into the image, y up"""
+    x0, y0, x1, y1 = (float(v) for v in bounds)
+    w, h = max(x1 - x0, 1e-6), max(y1 - y0, 1e-6)
+    scale = min(width / w, height / h) * (1 - 2 * margin)
+    return scale, width / 2 - (x0 + x1) / 2 * scale, height / 2 - (y0 + y1) / 2 * scale
+
+
+def scene_bounds(store):
+    b = store.bounds
+    if len(b) == 0:
+        return (0.0, 0.0, 1.0, 1.0)
+    pad = store.max_thickness
+    return (b[:, 0].min() - pad, b[:, 1].min() - pad, b[:, 2].max() + pad, b[:, 3].max() + pad)
+
+
+def segment_ends(store):
+    """Global vertex indices (start, end) of every drawn edge, and the shape each belongs to"""
+    counts = store.counts.astype(np.int64)
+    offsets = store.offsets.astype(np.int64)
+    kinds = store.kinds
+    n = int(counts.sum())
+    shape = np.repeat(np.arange(len(counts)), counts)
+    start = np.repeat(offsets, counts)
+    local = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+    last = np.repeat(counts - 1, counts)
+    kind = kinds[shape]
+    # GL_LINES pairs (0, 1), (2, 3)...; strips stop at the last vertex; loops wrap around
+    begins = np.where(kind == KIND_LINE, (local % 2 == 0) & (local < last),
+                      np.where(kind == KIND_POLYLINE, (local < last) | (last == 0), kind != KIND_POINT))
+    end = np.where(local == last, start, start + local + 1)
+    ids = np.flatnonzero(begins)
+    return start[ids] + local[ids], end[ids], shape[ids]
+
+
+class ShapeRasterizer:
+    def __init__(self, width, height, tile_size=TILE_SIZE, workers=None, background=BACKGROUND):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.workers = workers or os.cpu_count() or 1
+        self.background = np.asarray(background, dtype=np.float32)
+        self.stats = {'segments': 0, 'points': 0, 'tiles': 0, 'fragments': 0}
+
+    def render(self, store, view=None):
+        """Draw a ShapeStore; returns an (H, W, 3) float32 image, top row first.
+
+        view is (scale, offset_x, offset_y) from world to pixels with y up;
+        by default the whole scene is fitted into the image.
+        """
+        if view is None:
+            view = fit_view(scene_bounds(store), self.width, self.height)
+        scale, ox, oy = view
+        points = store.transformed.astype(np.float64) * scale + (ox, oy)
+        half_width = np.maximum(store.thickness.astype(np.float64), 1.0) / 2
+
+        a, b, seg_shape = segment_ends(store)
+        seg = {'a': points[a], 'b': points[b], 'hw': half_width[seg_shape], 'shape': seg_shape}
+        vertex_shape = np.repeat(np.arange(len(store)), store.counts)
+        point_ids = np.flatnonzero(store.kinds[vertex_shape] == KIND_POINT)
+        pt_shape = vertex_shape[point_ids]
+        pts = {'c': points[point_ids], 'half': store.thickness[pt_shape].astype(np.float64),
+               'shape': pt_shape}
+        self.stats = {'segments': len(a), 'points': len(point_ids), 'tiles': 0, 'fragments': 0}
+
+        # Boxes of everything a primitive can touch, for binning into tiles
+        r = seg['hw'] + 0.5
+        seg_boxes = np.column_stack([np.minimum(seg['a'], seg['b']) - r[:, None],
+                                     np.maximum(seg['a'], seg['b']) + r[:, None]])
+        reach = pts['half'] + 0.5
+        pt_boxes = np.column_stack([pts['c'] - reach[:, None], pts['c'] + reach[:, None]])
+        tiles = {}
+        for name, boxes in (('seg', seg_boxes), ('pts', pt_boxes)):
+            for tile, ids in self._bin(boxes):
+                tiles.setdefault(tile, {})[name] = ids
+        self.stats['tiles'] = len(tiles)
+
+        image = np.empty((self.height, self.width, 3), dtype=np.float32)
+        image[:] = self.background
+        colors = store.colors.astype(np.float32)
+        jobs = [(x0, y0, parts.get('seg'), parts.get('pts')) for (x0, y0), parts in tiles.items()]
+
+        def run(job):
+            x0, y0, seg_ids, pt_ids = job
+            return self._raster_tile(image, colors, seg, pts, x0, y0, seg_ids, pt_ids)
+        if self.workers > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                counts = list(pool.map(run, jobs))
+        else:
+            counts = [run(job) for job in jobs]
+        self.stats['fragments'] = int(sum(counts))
+        return image[::-1]
+
+    def _bin(self, boxes):
+        """((tile x0, tile y0), primitive ids) for every tile a box overlaps"""
+        size = self.tile_size
+        tiles_x = -(-self.width // size)
+        tiles_y = -(-self.height // size)
+        onscreen = ((boxes[:, 2] >= 0) & (boxes[:, 0] < self.width) &
+                    (boxes[:, 3] >= 0) & (boxes[:, 1] < self.height))
+        ids = np.flatnonzero(onscreen)
+        b = boxes[ids]
+        tx0 = np.clip(np.floor(b[:, 0] / size), 0, tiles_x - 1).astype(np.int64)
+        tx1 = np.clip(np.floor(b[:, 2] / size), 0, tiles_x - 1).astype(np.int64)
+        ty0 = np.clip(np.floor(b[:, 1] / size), 0, tiles_y - 1).astype(np.int64)
+        ty1 = np.clip(np.floor(b[:, 3] / size), 0, tiles_y - 1).astype(np.int64)
+        wx = tx1 - tx0 + 1
+        n = wx * (ty1 - ty0 + 1)
+        prim = np.repeat(np.arange(len(ids)), n)
+        k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        tile = (ty0[prim] + k // wx[prim]) * tiles_x + tx0[prim] + k % wx[prim]
+        order = np.argsort(tile, kind='stable')  # keeps primitives in z-order inside a tile
+        tile, prim = tile[order], ids[prim[order]]
+        starts = np.flatnonzero(np.r_[True, tile[1:] != tile[:-1]]) if len(tile) else np.zeros(0, int)
+        ends = np.r_[starts[1:], len(tile)]
+        return [(((tile[s] % tiles_x) * size, (tile[s] // tiles_x) * size), prim[s:e])
+                for s, e in zip(starts.tolist(), ends.tolist())]
+
+    # Rasterization
+
+    def _segment_fragments(self, seg, ids, x0, y0, w, h):
+        """(px, py, coverage, shape) of the pixels near the given segments inside one tile"""
+        a, b, hw = seg['a'][ids], seg['b'][ids], seg['hw'][ids]
+        d = b - a
+        # Walk the major axis: u is the major coordinate, v the minor one
+        x_major = np.abs(d[:, 0]) >= np.abs(d[:, 1])
+        ua = np.where(x_major, a[:, 0], a[:, 1])
+        va = np.where(x_major, a[:, 1], a[:, 0])
+        du = np.where(x_major, d[:, 0], d[:, 1])
+        dv = np.where(x_major, d[:, 1], d[:, 0])
+        r = hw + 0.5
+        length = np.sqrt(du * du + dv * dv)
+        safe = np.where(length > 0, length, 1.0)
+        eu = np.where(length > 0, du / safe, 1.0)
+        ev = dv / safe
+        slope = ev / eu
+        # Minor-axis extent of the thick segment within one column
+        reach = r / np.abs(eu)
+        umin, umax = np.minimum(ua, ua + du), np.maximum(ua, ua + du)
+        c0 = np.maximum(np.floor(umin - r), np.where(x_major, x0, y0)).astype(np.int32)
+        c1 = np.minimum(np.ceil(umax + r), np.where(x_major, x0 + w, y0 + h)).astype(np.int32)
+        span = np.floor(2 * reach).astype(np.int32) + 1
+        lo_v = np.where(x_major, y0, x0).astype(np.int32)
+        hi_v = np.where(x_major, y0 + h, x0 + w).astype(np.int32)
+        base = (va - ua * slope - reach - 0.5).astype(np.float32)
+
+        n = np.maximum(c1 - c0, 0) * span
+        s = np.repeat(np.arange(len(ids), dtype=np.int32), n)
+        k = np.arange(n.sum(), dtype=np.int32) - np.repeat((np.cumsum(n) - n).astype(np.int32), n)
+        step, rem = np.divmod(k, span[s])
+        col = c0[s] + step
+        # Rows start at the segment's minor coordinate (clamped to its ends) minus reach
+        uc = np.clip(col + np.float32(0.5), umin.astype(np.float32)[s], umax.astype(np.float32)[s])
+        row = np.ceil(base[s] + uc * slope.astype(np.float32)[s]).astype(np.int32) + rem
+        inside = (row >= lo_v[s]) & (row < hi_v[s])
+        s, col, row = s[inside], col[inside], row[inside]
+
+        # Exact distance from the pixel center to the segment, in the (u, v) frame
+        eu32, ev32 = eu.astype(np.float32)[s], ev.astype(np.float32)[s]
+        qu = col + (0.5 - ua).astype(np.float32)[s]
+        qv = row + (0.5 - va).astype(np.float32)[s]
+        along = np.clip(qu * eu32 + qv * ev32, 0, length.astype(np.float32)[s])
+        qu -= along * eu32
+        qv -= along * ev32
+        coverage = np.clip(r.astype(np.float32)[s] - np.sqrt(qu * qu + qv * qv), 0, 1)
+        keep = coverage > 0
+        s, col, row = s[keep], col[keep], row[keep]
+        xm = x_major[s]
+        return (np.where(xm, col, row), np.where(xm, row, col), coverage[keep],
+                seg['shape'][ids][s])
+
+    def _point_fragments(self, pts, ids, x0, y0, w, h):
+        """Square GL points: coverage is the pixel's overlap with the square"""
+        c, half = pts['c'][ids], pts['half'][ids]
+        lo = np.floor(c - half[:, None] - 0.5).astype(np.int64)
+        hi = np.ceil(c + half[:, None] + 0.5).astype(np.int64)
+        lo = np.maximum(lo, (x0, y0))
+        hi = np.minimum(hi, (x0 + w, y0 + h))
+        size = np.maximum(hi - lo, 0)
+        n = size[:, 0] * size[:, 1]
+        s = np.repeat(np.arange(len(ids)), n)
+        k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        px = lo[s, 0] + k % np.maximum(size[s, 0], 1)
+        py = lo[s, 1] + k // np.maximum(size[s, 0], 1)
+        cover_x = np.clip(half[s] + 0.5 - np.abs(px + 0.5 - c[s, 0]), 0.0, 1.0)
+        cover_y = np.clip(half[s] + 0.5 - np.abs(py + 0.5 - c[s, 1]), 0.0, 1.0)
+        coverage = cover_x * cover_y
+        keep = coverage > 0
+        return px[keep], py[keep], coverage[keep], pts['shape'][ids][s[keep]]
+
+    def _raster_tile(self, image, colors, seg, pts, x0, y0, seg_ids, pt_ids):
+        """Blend one tile into image (rows bottom-up); returns the fragments blended"""
+        w = min(self.tile_size, self.width - x0)
+        h = min(self.tile_size, self.height - y0)
+        parts = []
+        if seg_ids is not None:
+            parts.append(self._segment_fragments(seg, seg_ids, x0, y0, w, h))
+        if pt_ids is not None:
+            parts.append(self._point_fragments(pts, pt_ids, x0, y0, w, h))
+        px, py, coverage, shape = (np.concatenate(column) for column in zip(*parts))
+        if len(px) == 0:
+            return 0
+
+        # One fragment per (pixel, shape) with the highest coverage, ordered by pixel then z
+        pixel = (py - y0).astype(np.int64) * w + (px - x0)
+        key = pixel * (int(shape.max()) + 1) + shape
+        order = np.argsort(key)
+        key, coverage = key[order], coverage[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        alpha = np.maximum.reduceat(coverage, starts)
+        pixel, shape = pixel[order][starts], shape[order][starts]
+
+        # Layer k holds every pixel's k-th shape; blending layer by layer keeps z-order
+        first = np.flatnonzero(np.r_[True, pixel[1:] != pixel[:-1]])
+        layer = np.arange(len(pixel)) - np.repeat(first, np.diff(np.r_[first, len(pixel)]))
+        by_layer = np.argsort(layer, kind='stable')
+        bounds = np.searchsorted(layer[by_layer], np.arange(int(layer.max()) + 2))
+        tile = image[y0:y0 + h, x0:x0 + w].reshape(-1, 3)
+        for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            sel = by_layer[lo:hi]
+            p, a = pixel[sel], alpha[sel, None].astype(np.float32)
+            tile[p] = tile[p] * (1 - a) + colors[shape[sel]] * a
+        image[y0:y0 + h, x0:x0 + w] = tile.reshape(h, w, 3)
+        return len(px)
+
+
+def _hex(color):
+    r, g, b = (int(round(min(max(float(c), 0.0), 1.0) * 255)) for c in color)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def write_svg(path, store, width, height, view=None, background=BACKGROUND):
+    """Write the store as SVG elements in the same pixel space ShapeRasterizer uses"""
+    if view is None:
+        view = fit_view(scene_bounds(store), width, height)
+    scale, ox, oy = view
+    points = store.transformed.astype(np.float64) * scale + (ox, oy)
+    points[:, 1] = height - points[:, 1]  # SVG y points down
+    coords = [f"{x:.2f},{y:.2f}" for x, y in points.tolist()]
+    offsets, counts = store.offsets.tolist(), store.counts.tolist()
+    kinds, thickness = store.kinds.tolist(), store.thickness.tolist()
+    colors = [_hex(c) for c in store.colors.tolist()]
+    with open(path, 'w') as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                f'viewBox="0 0 {width} {height}">\n')
+        f.write(f'<rect width="100%" height="100%" fill="{_hex(background)}"/>\n')
+        f.write('<g fill="none" stroke-linecap="round" stroke-linejoin="round">\n')
+        for start, count, kind, width_px, color in zip(offsets, counts, kinds, thickness, colors):
+            vertices = coords[start:start + count]
+            stroke = f'stroke="{color}" stroke-width="{max(width_px, 1.0):g}"'
+            if kind == KIND_POINT:
+                size = 2 * width_px
+                for x, y in points[start:start + count].tolist():
+                    f.write(f'<rect x="{x - width_px:.2f}" y="{y - width_px:.2f}" width="{size:g}" '
+                            f'height="{size:g}" fill="{color}"/>\n')
+            elif kind == KIND_LINE:
+                path_data = ' '.join(f"M{p} L{q}" for p, q in zip(vertices[0::2], vertices[1::2]))
+                f.write(f'<path d="{path_data}" {stroke}/>\n')
+            elif kind == KIND_POLYLINE:
+                f.write(f'<polyline points="{" ".join(vertices)}" {stroke}/>\n')
+            else:
+                f.write(f'<polygon points="{" ".join(vertices)}" {stroke}/>\n')
+        f.write('</g>\n</svg>\n')
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height or width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scene', help=".gk2d file saved by the editor")
+    parser.add_argument('--png', help="PNG output (default: next to the scene)")
+    parser.add_argument('--svg', help="SVG output (default: next to the scene)")
+    parser.add_argument('--size', type=parse_size, default=(512, 512),
+                        help="WxH; the whole drawing is fitted into it")
+    parser.add_argument('--scale', type=float,
+                        help="pixels per world unit instead of fitting; the size follows the drawing")
+    parser.add_argument('--tile', type=int, default=TILE_SIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    stem = os.path.splitext(args.scene)[0]
+    png_path = args.png or stem + '.png'
+    svg_path = args.svg or stem + '.svg'
+    start = time.perf_counter()
+    store = load_scene(args.scene)
+    store.flush()
+    loaded = time.perf_counter()
+
+    bounds = scene_bounds(store)
+    if args.scale:
+        width = max(1, int(np.ceil((bounds[2] - bounds[0]) * args.scale)))
+        height = max(1, int(np.ceil((bounds[3] - bounds[1]) * args.scale)))
+        view = (args.scale, -bounds[0] * args.scale, -bounds[1] * args.scale)
+    else:
+        width, height = args.size
+        view = fit_view(bounds, width, height)
+
+    rasterizer = ShapeRasterizer(width, height, tile_size=args.tile, workers=args.workers)
+    write_png(png_path, rasterizer.render(store, view))
+    rendered = time.perf_counter()
+    write_svg(svg_path, store, width, height, view)
+    done = time.perf_counter()
+
+    n = len(store)
+    stats = rasterizer.stats
+    print(f"{args.scene}: {n} shapes loaded in {loaded - start:.2f} s")
+    print(f"  PNG {width}x{height} -> {png_path} in {rendered - loaded:.2f} s "
+          f"({n / max(rendered - loaded, 1e-9):.0f} shapes/s, {stats['tiles']} tiles, "
+          f"{stats['fragments']} fragments)")
+    print(f"  SVG -> {svg_path} in {done - rendered:.2f} s ({n / max(done - rendered, 1e-9):.0f} shapes/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
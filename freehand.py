@@ -0,0 +1,98 @@
+"""Streaming simplification of freehand strokes.
+
+Mouse samples arrive one at a time, far denser than a stroke needs.
+StrokeSimplifier turns them into a polyline as they come in, so a stroke
+never holds more than its final vertices plus one short run:
+
+1. Radial distance: a sample closer than tolerance / 4 to the last
+   accepted one is dropped outright (jitter, a mouse held still).
+2. Streaming Douglas-Peucker: accepted samples collect in a run that
+   starts at the last emitted vertex. While every sample of the run lies
+   within 3/4 tolerance of the segment from the run's start to its
+   newest sample, the run keeps growing; once one falls off, the sample
+   before the newest becomes a vertex and starts the next run. Runs are
+   capped at max_run samples, which bounds the work per sample.
+
+Every dropped sample therefore ends up within tolerance of the output.
+"""
+import numpy as np
+
+
+def segment_distances(points, a, b):
+    """Distance of each point to the segment a-b"""
+    points = np.asarray(points, dtype=np.float64)
+    a = np.asarray(a, dtype=np.float64)
+    ab = np.asarray(b, dtype=np.float64) - a
+    ap = points - a
+    length2 = float(ab @ ab)
+    t = np.clip(ap @ ab / length2, 0.0, 1.0) if length2 > 0 else np.zeros(len(points))
+    return np.hypot(*(ap - t[:, None] * ab).T)
+
+
+def polyline_deviation(samples, polyline):
+    """Largest distance from any sample to the polyline (a check for tests/benchmarks)"""
+    polyline = np.asarray(polyline, dtype=np.float64)
+    if len(polyline) == 1:
+        return float(np.hypot(*(np.asarray(samples, dtype=np.float64) - polyline[0]).T).max())
+    best = np.full(len(samples), np.inf)
+    for a, b in zip(polyline[:-1], polyline[1:]):
+        np.minimum(best, segment_distances(samples, a, b), out=best)
+    return float(best.max())
+
+
+class StrokeSimplifier:
+    def __init__(self, tolerance=1.5, max_run=256):
+        self.tolerance = float(tolerance)
+        self.max_run = max_run
+        self.vertices = []          # emitted vertices, final
+        self.samples = 0            # raw samples fed in
+        self._run = np.empty((max_run + 1, 2))
+        self._run_length = 0        # _run[0] is the last vertex
+
+    def __len__(self):
+        return len(self.vertices)
+
+    @property
+    def ratio(self):
+        """Raw samples per output vertex"""
+        return self.samples / max(len(self.points()), 1)
+
+    def add(self, x, y):
+        """Feed one sample; returns True when it emitted a vertex"""
+        self.samples += 1
+        radial, chord = self.tolerance / 4, self.tolerance * 0.75
+        n = self._run_length
+        if n == 0:
+            self.vertices.append((float(x), float(y)))
+            self._run[0] = (x, y)
+            self._run_length = 1
+            return True
+        last = self._run[n - 1]
+        if (x - last[0]) ** 2 + (y - last[1]) ** 2 < radial * radial:
+            return False
+        self._run[n] = (x, y)
+        n += 1
+        self._run_length = n
+        if n > 2 and (n > self.max_run or
+                      segment_distances(self._run[1:n - 1], self._run[0], self._run[n - 1]).max() > chord):
+            # The previous sample was the last one the run's segment covered
+            corner = self._run[n - 2].copy()
+            self.vertices.append((float(corner[0]), float(corner[1])))
+            self._run[0] = corner
+            self._run[1] = (x, y)
+            self._run_length = 2
+            return True
+        return False
+
+    def points(self):
+        """Current polyline: the vertices so far plus the open run's newest sample"""
+        if self._run_length > 1:
+            x, y = self._run[self._run_length - 1].tolist()
+            return self.vertices + [(x, y)]
+        return list(self.vertices)
+
+    def finish(self):
+        """Close the stroke; returns its final vertex list"""
+        self.vertices = self.points()
+        self._run_length = 0
+        return self.vertices
@@ -0,0 +1,63 @@
+"""Small GL state cache shared by the 2D editor and the 3D viewer.
+
+Fixed-function state calls (colour, line width, point size, light
+position, enable/disable) go through GLStateCache, which only forwards
+a call to OpenGL when the value actually differs from what was last
+sent. Per-frame counters report how many calls were issued and elided.
+"""
+from OpenGL.GL import *
+
+
+class GLStateCache:
+    def __init__(self):
+        self._state = {}
+        self.issued = 0
+        self.elided = 0
+        self.last_frame = {'issued': 0, 'elided': 0}
+
+    def begin_frame(self):
+        """Start a new frame; returns the counters of the previous one"""
+        self.last_frame = {'issued': self.issued, 'elided': self.elided}
+        self.issued = 0
+        self.elided = 0
+        return self.last_frame
+
+    def invalidate(self, key=None):
+        """Forget cached values, e.g. after GL calls made behind our back"""
+        if key is None:
+            self._state.clear()
+        else:
+            self._state.pop(key, None)
+
+    def _apply(self, key, value, fn, *args):
+        if self._state.get(key) == value:
+            self.elided += 1
+            return False
+        self._state[key] = value
+        fn(*args)
+        self.issued += 1
+        return True
+
+    def color3f(self, r, g, b):
+        return self._apply('color', (r, g, b, 1.0), glColor3f, r, g, b)
+
+    def line_width(self, width):
+        return self._apply('line_width', width, glLineWidth, width)
+
+    def point_size(self, size):
+        return self._apply('point_size', size, glPointSize, size)
+
+    def enable(self, cap):
+        return self._apply(('enabled', cap), True, glEnable, cap)
+
+    def disable(self, cap):
+        return self._apply(('enabled', cap), False, glDisable, cap)
+
+    def light_position(self, light, position, view=None):
+        """Set a light position; view identifies the current modelview.
+
+        GL stores light positions in eye space, so the call only needs
+        repeating when the position or the camera (view) changes.
+        """
+        value = (tuple(position), view)
+        return self._apply(('light_position', light), value, glLightfv, light, GL_POSITION, position)
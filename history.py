@@ -0,0 +1,241 @@
+"""Undo/redo history for the 2D editor.
+
+The log holds small commands instead of scene snapshots:
+
+- TransformCommand: additive deltas of (drag_x, drag_y, rotation_angle,
+  scale_x, scale_y) for the shapes/groups that moved. Every MOUSEMOTION
+  of one drag merges into the same entry.
+- CreateCommand / ClearCommand: keep references to the shapes (or the
+  whole cleared ShapeStore) and their existing vertex blocks, so deleting
+  or restoring never copies vertices.
+- GroupCommand / UngroupCommand: a group made from the selection, or an
+  identity-transform group dissolved again (ungrouping a transformed
+  group bakes vertices and clears the history instead).
+- Checkpoint: every checkpoint_every commands, the absolute parameters
+  of the nodes moved since the previous checkpoint. Undo and redo snap
+  to them when passing, so float error from replayed deltas cannot build
+  up.
+
+Entries are trimmed oldest first once their estimated size exceeds
+budget_bytes.
+"""
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def get_params(nodes):
+    return np.array([node.transform_params() for node in nodes], dtype=np.float64).reshape(-1, 5)
+
+
+def set_params(nodes, params):
+    for node, (dx, dy, angle, sx, sy) in zip(nodes, params.tolist()):
+        node.drag_offset = [dx, dy]
+        node.rotation_angle = angle
+        node.scale_factor = [sx, sy]
+
+
+class TransformCommand:
+    def __init__(self, nodes, delta, merge_key=None):
+        self.nodes = nodes
+        self.delta = delta
+        self.merge_key = merge_key
+
+    @property
+    def nbytes(self):
+        return self.delta.nbytes + 8 * len(self.nodes) + 64
+
+    def undo(self, editor):
+        set_params(self.nodes, get_params(self.nodes) - self.delta)
+
+    def redo(self, editor):
+        set_params(self.nodes, get_params(self.nodes) + self.delta)
+
+
+class CreateCommand:
+    def __init__(self, shape):
+        self.shape = shape
+
+    @property
+    def nbytes(self):
+        # The shape's own vertex block while undone; the store's copy otherwise
+        return len(self.shape.original_points) * 8 + 256
+
+    def undo(self, editor):
+        editor.shapes.remove(self.shape)
+
+    def redo(self, editor):
+        editor.shapes.append(self.shape)
+
+
+class ClearCommand:
+    """Clearing swaps in an empty store; the old one is kept as it was"""
+    def __init__(self, cleared, empty):
+        self.cleared = cleared
+        self.empty = empty
+
+    @property
+    def nbytes(self):
+        store = self.cleared
+        return store.vertex_count * 16 + len(store) * 256
+
+    def undo(self, editor):
+        editor.set_store(self.cleared)
+
+    def redo(self, editor):
+        editor.set_store(self.empty)
+
+
+class GroupCommand:
+    def __init__(self, group, shapes, groups):
+        self.group = group
+        self.shapes = shapes
+        self.groups = groups
+        self.pivot = group.pivot
+
+    @property
+    def nbytes(self):
+        return 8 * (len(self.shapes) + len(self.groups)) + 256
+
+    def undo(self, editor):
+        # Later commands on the group were undone first, so it is back to
+        # identity and ungrouping moves nothing
+        editor.shapes.ungroup(self.group)
+
+    def redo(self, editor):
+        editor.shapes.group(self.shapes, self.groups, handle=self.group, pivot=self.pivot)
+
+
+class UngroupCommand(GroupCommand):
+    def undo(self, editor):
+        GroupCommand.redo(self, editor)
+
+    def redo(self, editor):
+        GroupCommand.undo(self, editor)
+
+
+class Checkpoint:
+    def __init__(self, nodes, params):
+        self.nodes = nodes
+        self.params = params
+
+    @property
+    def nbytes(self):
+        return self.params.nbytes + 8 * len(self.nodes) + 64
+
+    def undo(self, editor):
+        set_params(self.nodes, self.params)
+
+    redo = undo
+
+
+class History:
+    def __init__(self, budget_bytes=8 * 1024 * 1024, checkpoint_every=32):
+        self.budget_bytes = budget_bytes
+        self.checkpoint_every = checkpoint_every
+        self.entries = []       # oldest first; entries[:position] are applied
+        self.position = 0
+        self.nbytes = 0
+        self.trimmed = 0
+        self._since_checkpoint = 0
+        self._moved = {}        # id -> node moved since the last checkpoint
+
+    def __len__(self):
+        return sum(not isinstance(entry, Checkpoint) for entry in self.entries[:self.position])
+
+    def clear(self):
+        self.entries = []
+        self.position = 0
+        self.nbytes = 0
+        self._since_checkpoint = 0
+        self._moved = {}
+
+    def record(self, command):
+        """Append an already applied command, dropping anything that was undone"""
+        for entry in self.entries[self.position:]:
+            self.nbytes -= entry.nbytes
+        del self.entries[self.position:]
+        self.entries.append(command)
+        self.nbytes += command.nbytes
+        self.position = len(self.entries)
+        self._since_checkpoint += 1
+        self._trim()
+
+    def _checkpoint(self):
+        """Snapshot the nodes moved since the last checkpoint, if one is due"""
+        if (self._since_checkpoint < self.checkpoint_every or not self._moved
+                or self.position != len(self.entries)):
+            return
+        nodes = list(self._moved.values())
+        checkpoint = Checkpoint(nodes, get_params(nodes))
+        self.entries.append(checkpoint)
+        self.nbytes += checkpoint.nbytes
+        self.position += 1
+        self._moved = {}
+        self._since_checkpoint = 0
+
+    def _trim(self):
+        drop = 0
+        while self.nbytes > self.budget_bytes and drop < self.position - 1:
+            self.nbytes -= self.entries[drop].nbytes
+            drop += 1
+        if drop:
+            del self.entries[:drop]
+            self.position -= drop
+            self.trimmed += drop
+
+    @contextmanager
+    def transforming(self, nodes, merge_key=None):
+        """Record what the with-block does to the nodes' transforms.
+
+        With a merge_key, consecutive changes under the same key (the
+        motion events of one drag) extend the previous entry.
+        """
+        nodes = list(nodes)
+        last = self.entries[-1] if self.entries else None
+        merging = (merge_key is not None and self.position == len(self.entries)
+                   and isinstance(last, TransformCommand) and last.merge_key == merge_key
+                   and len(last.nodes) == len(nodes) and all(a is b for a, b in zip(last.nodes, nodes)))
+        if not merging:
+            self._checkpoint()
+        before = get_params(nodes)
+        yield
+        delta = get_params(nodes) - before
+        if not delta.any():
+            return
+        for node in nodes:
+            self._moved[id(node)] = node
+        if merging:
+            last.delta += delta
+        else:
+            self.record(TransformCommand(nodes, delta, merge_key))
+
+    def can_undo(self):
+        return any(not isinstance(entry, Checkpoint) for entry in self.entries[:self.position])
+
+    def can_redo(self):
+        return any(not isinstance(entry, Checkpoint) for entry in self.entries[self.position:])
+
+    def undo(self, editor):
+        """Undo one command (passing over checkpoints); returns it or None"""
+        while self.position > 0:
+            self.position -= 1
+            entry = self.entries[self.position]
+            entry.undo(editor)
+            if not isinstance(entry, Checkpoint):
+                return entry
+        return None
+
+    def redo(self, editor):
+        while self.position < len(self.entries):
+            entry = self.entries[self.position]
+            entry.redo(editor)
+            self.position += 1
+            if not isinstance(entry, Checkpoint):
+                # Snap to a checkpoint that directly follows
+                while (self.position < len(self.entries)
+                       and isinstance(self.entries[self.position], Checkpoint)):
+                    self.entries[self.position].redo(editor)
+                    self.position += 1
+                return entry
+        return None
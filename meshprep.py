@@ -0,0 +1,260 @@
+"""Mesh preprocessing: vertex welding, smooth normals and cache ordering.
+
+preprocess() runs the whole pipeline on a MeshData from objloader:
+duplicate (position, normal, uv) vertices are welded into a unique set,
+missing normals are generated with area weighting, triangles are
+reordered with Tipsify (Sander et al., "Fast Triangle Reordering for
+Vertex Locality and Reduced Overdraw") for the post-transform vertex
+cache, and vertices are renumbered in first-use order for fetch
+locality. ACMR (average cache miss ratio, transformed vertices per
+triangle) is reported before and after.
+
+build_lods() derives a chain of coarser levels of detail by quadric
+error metric vertex clustering.
+"""
+import numpy as np
+
+CACHE_SIZE = 16
+
+
+def weld(positions, indices, normals=None, texcoords=None, decimals=None):
+    """Merge vertices whose attributes are identical.
+
+    With decimals set, attributes are compared after rounding, which also
+    merges near-duplicates. Triangles that collapse to a line or point are
+    dropped. Returns (positions, indices, normals, texcoords).
+    """
+    parts = [a for a in (positions, normals, texcoords) if a is not None]
+    attrs = np.hstack(parts).astype(np.float32)
+    key = attrs if decimals is None else np.round(attrs, decimals)
+    # Compare rows as raw bytes; +0.0 keeps -0.0 and 0.0 together
+    key = np.ascontiguousarray(key + np.float32(0.0))
+    rows = key.view(np.dtype((np.void, key.dtype.itemsize * key.shape[1]))).ravel()
+    _, first, remap = np.unique(rows, return_index=True, return_inverse=True)
+    faces = remap.ravel()[indices].reshape(-1, 3)
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    pick = lambda a: None if a is None else np.ascontiguousarray(a[first])
+    return pick(positions), faces[keep].ravel().astype(np.uint32), pick(normals), pick(texcoords)
+
+
+def smooth_normals(positions, indices):
+    """Area-weighted per-vertex normals.
+
+    The unnormalized cross product of two triangle edges is twice the
+    triangle's area, so summing it per corner weights faces by area.
+    """
+    faces = indices.reshape(-1, 3)
+    p = positions.astype(np.float64)
+    face_normals = np.cross(p[faces[:, 1]] - p[faces[:, 0]], p[faces[:, 2]] - p[faces[:, 0]])
+    corners = faces.ravel()
+    weights = np.repeat(face_normals, 3, axis=0)
+    normals = np.column_stack([np.bincount(corners, weights[:, k], minlength=len(positions))
+                               for k in range(3)])
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    return (normals / np.where(length > 0, length, 1)).astype(np.float32)
+
+
+def acmr(indices, cache_size=CACHE_SIZE):
+    """Average cache miss ratio of an index buffer with a FIFO vertex cache"""
+    if len(indices) == 0:
+        return 0.0
+    stamp = {}
+    misses = 0
+    for v in indices.tolist():
+        # v is cached if it entered the FIFO within the last cache_size misses
+        if misses - stamp.get(v, -cache_size - 1) > cache_size:
+            stamp[v] = misses
+            misses += 1
+    return misses / (len(indices) // 3)
+
+
+def tipsify(indices, vertex_count, cache_size=CACHE_SIZE):
+    """Triangle order (array of triangle ids) for vertex cache locality"""
+    faces = indices.reshape(-1, 3)
+    n_tris = len(faces)
+    if n_tris == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Vertex -> triangles adjacency in CSR form
+    corners = faces.ravel()
+    order = np.argsort(corners, kind='stable')
+    adjacency = (order // 3).tolist()
+    live = np.bincount(corners, minlength=vertex_count)
+    starts = np.r_[0, np.cumsum(live)].tolist()
+    live = live.tolist()
+    tris = faces.tolist()
+
+    stamp = [-cache_size - 1] * vertex_count
+    emitted = [False] * n_tris
+    out = []
+    dead_end = []
+    time = cache_size + 1
+    cursor = 0
+    fan = int(corners[0])
+    while fan >= 0:
+        candidates = []
+        for t in adjacency[starts[fan]:starts[fan + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            out.append(t)
+            for v in tris[t]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - stamp[v] > cache_size:
+                    stamp[v] = time
+                    time += 1
+
+        # Next fan: the candidate that stays in cache and has the most work left
+        fan, best = -1, -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if time - stamp[v] + 2 * live[v] <= cache_size:
+                    priority = time - stamp[v]
+                if priority > best:
+                    fan, best = v, priority
+        if fan < 0:
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    fan = v
+                    break
+            else:
+                while cursor < vertex_count and live[cursor] == 0:
+                    cursor += 1
+                fan = cursor if cursor < vertex_count else -1
+    return np.array(out, dtype=np.int64)
+
+
+def reorder_vertices(indices, vertex_count):
+    """Renumber vertices in order of first use; returns (remap, new indices).
+
+    remap[new] = old; unused vertices are dropped.
+    """
+    _, first = np.unique(indices, return_index=True)
+    remap = indices[np.sort(first)]
+    lookup = np.empty(vertex_count, dtype=np.uint32)
+    lookup[remap] = np.arange(len(remap), dtype=np.uint32)
+    return remap, lookup[indices]
+
+
+def preprocess(mesh, cache_size=CACHE_SIZE, decimals=None):
+    """Weld, add normals and cache-optimize a mesh; returns (mesh, report)"""
+    report = {'vertices_before': mesh.vertex_count,
+              'acmr_before': acmr(mesh.indices, cache_size)}
+    positions, indices, normals, texcoords = weld(mesh.positions, mesh.indices,
+                                                  mesh.normals, mesh.texcoords, decimals)
+    if normals is None:
+        normals = smooth_normals(positions, indices)
+
+    order = tipsify(indices, len(positions), cache_size)
+    indices = indices.reshape(-1, 3)[order].ravel()
+    remap, indices = reorder_vertices(indices, len(positions))
+    result = type(mesh)(positions[remap], indices, normals[remap],
+                        None if texcoords is None else texcoords[remap])
+
+    report['vertices_after'] = result.vertex_count
+    report['acmr_after'] = acmr(result.indices, cache_size)
+    return result, report
+
+
+def face_quadrics(positions, faces):
+    """Area-weighted plane quadrics, one (10,) row of the symmetric 4x4 per face.
+
+    Components are aa, ab, ac, ad, bb, bc, bd, cc, cd, dd for the plane
+    ax + by + cz + d = 0.
+    """
+    p = positions.astype(np.float64)
+    p0 = p[faces[:, 0]]
+    normal = np.cross(p[faces[:, 1]] - p0, p[faces[:, 2]] - p0)
+    double_area = np.linalg.norm(normal, axis=1)
+    normal /= np.where(double_area > 0, double_area, 1)[:, None]
+    plane = np.column_stack([normal, -(normal * p0).sum(axis=1)])
+    rows, cols = np.triu_indices(4)
+    return plane[:, rows] * plane[:, cols] * (double_area / 2)[:, None]
+
+
+def _optimal_points(quadrics, fallback, low, high):
+    """Points minimizing each quadric, or fallback where that is ill-posed or leaves [low, high]"""
+    aa, ab, ac, ad, bb, bc, bd, cc, cd, _ = quadrics.T
+    a = np.stack([np.stack([aa, ab, ac], -1), np.stack([ab, bb, bc], -1), np.stack([ac, bc, cc], -1)], 1)
+    b = -np.column_stack([ad, bd, cd])
+    scale = np.abs(a).sum(axis=(1, 2))
+    ok = np.abs(np.linalg.det(a)) > 1e-9 * np.maximum(scale, 1e-30) ** 3
+    points = fallback.copy()
+    if ok.any():
+        solved = np.linalg.solve(a[ok], b[ok][..., None])[..., 0]
+        inside = ((solved >= low[ok]) & (solved <= high[ok])).all(axis=1)
+        points[np.flatnonzero(ok)[inside]] = solved[inside]
+    return points
+
+
+def cluster_simplify(positions, indices, cell):
+    """Quadric-error vertex clustering (Lindstrom 2000) on a grid of the given cell size.
+
+    All vertices in a cell merge into one placed at the minimum of the
+    summed face quadrics, clamped to the cell's neighbourhood. Returns
+    (positions, indices) with collapsed and duplicate triangles removed.
+    """
+    faces = indices.reshape(-1, 3)
+    origin = positions.min(axis=0)
+    coords = np.floor((positions - origin) / cell).astype(np.int64)
+    dims = coords.max(axis=0) + 1
+    key = (coords[:, 0] * dims[1] + coords[:, 1]) * dims[2] + coords[:, 2]
+    _, cluster = np.unique(key, return_inverse=True)
+    cluster = cluster.ravel()
+    n = cluster.max() + 1
+
+    corner_quadrics = np.repeat(face_quadrics(positions, faces), 3, axis=0)
+    corner_cluster = cluster[faces.ravel()]
+    quadrics = np.column_stack([np.bincount(corner_cluster, corner_quadrics[:, k], minlength=n)
+                                for k in range(10)])
+    members = np.bincount(cluster, minlength=n)
+    mean = np.column_stack([np.bincount(cluster, positions[:, k], minlength=n)
+                            for k in range(3)]) / members[:, None]
+    cell_low = np.zeros((n, 3))
+    cell_low[cluster] = coords * cell + origin
+    points = _optimal_points(quadrics, mean, cell_low - cell / 2, cell_low + 1.5 * cell)
+
+    merged = cluster[faces]
+    keep = (merged[:, 0] != merged[:, 1]) & (merged[:, 1] != merged[:, 2]) & (merged[:, 0] != merged[:, 2])
+    merged = merged[keep]
+    # Same three vertices in the same winding: rotate the smallest id first
+    shift = np.argmin(merged, axis=1)
+    rolled = merged[np.arange(len(merged))[:, None], (shift[:, None] + np.arange(3)) % 3]
+    _, first = np.unique(rolled, axis=0, return_index=True)
+    merged = merged[np.sort(first)]
+    used, remap = np.unique(merged, return_inverse=True)
+    return points[used].astype(np.float32), remap.ravel().astype(np.uint32)
+
+
+def build_lods(mesh, levels=3, ratio=0.25, min_triangles=32):
+    """Chain of up to `levels` coarser meshes, each ~ratio times the previous triangle count.
+
+    Levels come from cluster_simplify on the full mesh with the cell size
+    searched to hit the target count; normals are regenerated and
+    texture coordinates are not kept.
+    """
+    faces = mesh.indices.reshape(-1, 3)
+    p = mesh.positions.astype(np.float64)
+    surface = np.linalg.norm(np.cross(p[faces[:, 1]] - p[faces[:, 0]], p[faces[:, 2]] - p[faces[:, 0]]),
+                             axis=1).sum() / 2
+    lods = []
+    target = mesh.triangle_count
+    for _ in range(levels):
+        target = int(target * ratio)
+        if target < min_triangles:
+            break
+        # A grid of cell size c leaves roughly 2 * area / c^2 triangles on a surface
+        cell = np.sqrt(2 * surface / target)
+        for _ in range(6):
+            positions, indices = cluster_simplify(mesh.positions, mesh.indices, cell)
+            count = len(indices) // 3
+            if count <= target * 1.15:
+                break
+            cell *= np.sqrt(count / target)
+        if count == 0 or count >= (lods[-1].triangle_count if lods else mesh.triangle_count):
+            break
+        lods.append(type(mesh)(positions, indices, smooth_normals(positions, indices)))
+    return lods
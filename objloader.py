@@ -0,0 +1,435 @@
+"""Vectorized Wavefront OBJ loader with a binary sidecar cache.
+
+The file is read in large newline-aligned chunks. Each chunk is split
+into v / vt / vn / f record groups and parsed with NumPy bulk
+conversion, faces of any size are fan-triangulated, and the result is
+de-indexed into flat float32 attribute arrays plus a uint32 index
+buffer ready for GPU upload. A .npz sidecar keyed by path, size and
+mtime makes reloading an unchanged file nearly free.
+
+With preprocess=True the mesh also goes through meshprep (welding,
+smooth normals, vertex cache ordering) and the cache stores the result;
+lod_levels > 0 likewise caches a chain of simplified meshes in mesh.lods.
+
+With workers > 1 the file is split into line-aligned byte ranges that
+are parsed in a process pool; each worker hands its arrays back in a
+shared memory block instead of pickling them.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from meshprep import build_lods, preprocess as preprocess_mesh
+
+CHUNK_BYTES = 64 * 1024 * 1024
+CACHE_VERSION = 3
+
+_SPACE, _TAB, _NL, _CR, _SLASH, _HASH = (ord(c) for c in ' \t\n\r/#')
+
+
+class MeshData:
+    """Triangle mesh as flat arrays.
+
+    positions (V, 3) float32, normals (V, 3) float32 or None,
+    texcoords (V, 2) float32 or None and indices (T * 3,) uint32.
+    """
+    def __init__(self, positions, indices, normals=None, texcoords=None, lods=None):
+        self.positions = positions
+        self.indices = indices
+        self.normals = normals
+        self.texcoords = texcoords
+        # Coarser levels of detail, finest first (see meshprep.build_lods)
+        self.lods = lods or []
+
+    @property
+    def vertex_count(self):
+        return len(self.positions)
+
+    @property
+    def triangle_count(self):
+        return len(self.indices) // 3
+
+    @property
+    def faces(self):
+        return self.indices.reshape(-1, 3)
+
+    def interleaved(self):
+        """(V, 3 [+3] [+2]) float32 array: position, normal, texcoord"""
+        parts = [self.positions]
+        if self.normals is not None:
+            parts.append(self.normals)
+        if self.texcoords is not None:
+            parts.append(self.texcoords)
+        return np.ascontiguousarray(np.hstack(parts), dtype=np.float32)
+
+    def bounds(self):
+        if len(self.positions) == 0:
+            return np.zeros(3, np.float32), np.zeros(3, np.float32)
+        return self.positions.min(axis=0), self.positions.max(axis=0)
+
+    def arrays(self):
+        """Dict of arrays for caching; None attributes are left out"""
+        out = {'positions': self.positions, 'indices': self.indices}
+        if self.normals is not None:
+            out['normals'] = self.normals
+        if self.texcoords is not None:
+            out['texcoords'] = self.texcoords
+        for level, lod in enumerate(self.lods, 1):
+            out.update({f'lod{level}_{name}': value for name, value in lod.arrays().items()})
+        return out
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        lods = []
+        while f'lod{len(lods) + 1}_positions' in arrays:
+            prefix = f'lod{len(lods) + 1}_'
+            lods.append(cls.from_arrays({name[len(prefix):]: value for name, value in arrays.items()
+                                         if name.startswith(prefix)}))
+        return cls(arrays['positions'], arrays['indices'],
+                   arrays.get('normals'), arrays.get('texcoords'), lods)
+
+
+def _ranges(starts, ends):
+    """Concatenated np.arange(starts[i], ends[i]) for all i"""
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths), lengths
+
+
+def _gather_lines(buf, starts, ends):
+    """Bytes of the given lines (each ending in its newline) and line lengths"""
+    idx, lengths = _ranges(starts, ends + 1)
+    return buf[idx], lengths
+
+
+def _strip_comments(buf, hashes, ends):
+    """Copy of buf with everything from the first '#' of a line to its end blanked"""
+    line_end = ends[np.searchsorted(ends, hashes)]
+    first = np.r_[True, line_end[1:] != line_end[:-1]]
+    buf = buf.copy()
+    buf[_ranges(hashes[first], line_end[first])[0]] = _SPACE
+    return buf
+
+
+def _token_starts(text):
+    space = (text == _SPACE) | (text == _TAB) | (text == _NL) | (text == _CR)
+    prev_space = np.r_[True, space[:-1]]
+    return ~space & prev_space
+
+
+def _parse_floats(buf, starts, ends, width):
+    """First `width` numbers of each line as a (lines, width) float32 array"""
+    if len(starts) == 0:
+        return np.zeros((0, width), dtype=np.float32)
+    text, lengths = _gather_lines(buf, starts, ends)
+    values = np.fromstring(text.tobytes(), dtype=np.float64, sep=' ')
+    per_line = np.bincount(np.repeat(np.arange(len(starts)), lengths)[_token_starts(text)],
+                           minlength=len(starts))
+    if (per_line == width).all():
+        return values.reshape(-1, width).astype(np.float32)
+    if (per_line < width).any():
+        raise ValueError(f"OBJ record with fewer than {width} values")
+    # Extra values (w coordinates, vertex colors): keep the first `width`
+    first = np.cumsum(per_line) - per_line
+    return values[first[:, None] + np.arange(width)].astype(np.float32)
+
+
+def _resolve(raw, count_before):
+    """OBJ 1-based / negative indices -> 0-based; returns (index, is_relative)"""
+    relative = raw < 0
+    return np.where(relative, count_before + raw, raw - 1), relative
+
+
+def parse_obj_chunk(data):
+    """Parse one newline-aligned chunk of an OBJ file.
+
+    Returns a dict with the chunk's positions / texcoords / normals and
+    its triangulated corners as (T, 3) arrays for the v, vt and vn index
+    streams (-1 when a face has no such index). Negative (relative)
+    indices are resolved against the records seen so far *in this chunk*
+    and flagged in the *_rel arrays, so the caller can add the number of
+    records in all earlier chunks.
+    """
+    buf = np.frombuffer(data + b'\n', dtype=np.uint8)
+    ends = np.flatnonzero(buf == _NL)
+    hashes = np.flatnonzero(buf == _HASH)
+    if len(hashes):
+        buf = _strip_comments(buf, hashes, ends)
+    # Classify lines by their first non-blank byte; records may be indented
+    solid = np.flatnonzero((buf != _SPACE) & (buf != _TAB))
+    starts = solid[np.searchsorted(solid, np.r_[0, ends[:-1] + 1])]
+    padded = np.concatenate([buf, np.full(3, _SPACE, dtype=np.uint8)])
+    c0, c1, c2 = padded[starts], padded[starts + 1], padded[starts + 2]
+    blank1 = (c1 == _SPACE) | (c1 == _TAB)
+    blank2 = (c2 == _SPACE) | (c2 == _TAB)
+    is_v = (c0 == ord('v')) & blank1
+    is_vt = (c0 == ord('v')) & (c1 == ord('t')) & blank2
+    is_vn = (c0 == ord('v')) & (c1 == ord('n')) & blank2
+    is_f = (c0 == ord('f')) & blank1
+
+    # Blank out the keywords so only numbers remain on each line
+    work = buf.copy()
+    for mask, width in ((is_v, 1), (is_f, 1), (is_vt, 2), (is_vn, 2)):
+        for k in range(width):
+            work[starts[mask] + k] = _SPACE
+
+    result = {
+        'positions': _parse_floats(work, starts[is_v] + 1, ends[is_v], 3),
+        'texcoords': _parse_floats(work, starts[is_vt] + 2, ends[is_vt], 2),
+        'normals': _parse_floats(work, starts[is_vn] + 2, ends[is_vn], 3),
+    }
+    result.update(_parse_faces(work, starts, ends, is_f, is_v, is_vt, is_vn))
+    return result
+
+
+def _parse_faces(work, starts, ends, is_f, is_v, is_vt, is_vn):
+    empty = np.zeros((0, 3), dtype=np.int64)
+    if not is_f.any():
+        return {'v': empty, 'vt': empty, 'vn': empty,
+                'v_rel': empty.astype(bool), 'vt_rel': empty.astype(bool), 'vn_rel': empty.astype(bool)}
+
+    text, lengths = _gather_lines(work, starts[is_f] + 1, ends[is_f])
+    n_faces = len(lengths)
+    token_start = _token_starts(text)
+    token_id = np.cumsum(token_start) - 1
+    line_of_byte = np.repeat(np.arange(n_faces), lengths)
+    corners_per_face = np.bincount(line_of_byte[token_start], minlength=n_faces)
+    n_tokens = int(corners_per_face.sum())
+
+    # Work out v, v/t, v//n or v/t/n for every corner from its slashes
+    slash = text == _SLASH
+    double = slash & np.r_[slash[1:], False]
+    slashes = np.bincount(token_id[slash], minlength=n_tokens)
+    doubles = np.bincount(token_id[double], minlength=n_tokens)
+    components = 1 + slashes - doubles
+
+    text = text.copy()
+    text[slash] = _SPACE
+    values = np.fromstring(text.tobytes(), dtype=np.float64, sep=' ').astype(np.int64)
+    first = np.cumsum(components) - components
+    v_raw = values[first]
+    has_t = (slashes >= 1) & (doubles == 0)
+    has_n = slashes == 2
+    t_raw = np.where(has_t, values[np.minimum(first + 1, len(values) - 1)], 0)
+    n_raw = np.where(has_n, values[first + components - 1], 0)
+
+    # Records of each kind seen before every face line, for negative indices
+    face_rows = np.flatnonzero(is_f)
+    corner_face = np.repeat(np.arange(n_faces), corners_per_face)
+    out = {}
+    for name, raw, present, kind in (('v', v_raw, None, is_v), ('vt', t_raw, has_t, is_vt),
+                                     ('vn', n_raw, has_n, is_vn)):
+        before = (np.cumsum(kind) - kind)[face_rows][corner_face]
+        index, relative = _resolve(raw, before)
+        if present is not None:
+            index = np.where(present, index, -1)
+            relative &= present
+        out[name], out[name + '_rel'] = index, relative
+
+    # Fan triangulation: (c0, c1, c2), (c0, c2, c3), ...
+    tris_per_face = np.maximum(corners_per_face - 2, 0)
+    face_first = np.cumsum(corners_per_face) - corners_per_face
+    tri_face = np.repeat(np.arange(n_faces), tris_per_face)
+    j = np.arange(tris_per_face.sum()) - np.repeat(np.cumsum(tris_per_face) - tris_per_face, tris_per_face) + 1
+    a = face_first[tri_face]
+    corners = np.column_stack([a, a + j, a + j + 1])
+    return {key: value[corners] for key, value in out.items()}
+
+
+def _iter_chunks(f, chunk_bytes):
+    """Yield newline-aligned blocks of roughly chunk_bytes"""
+    tail = b''
+    while True:
+        block = f.read(chunk_bytes)
+        if not block:
+            if tail:
+                yield tail
+            return
+        block = tail + block
+        cut = block.rfind(b'\n') + 1
+        if cut == 0:
+            tail = block
+            continue
+        tail = block[cut:]
+        yield block[:cut]
+
+
+def split_ranges(filename, parts):
+    """Up to `parts` (start, end) byte ranges of a file, cut after newlines"""
+    size = os.path.getsize(filename)
+    cuts = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, cuts[-1]))
+            f.readline()
+            cut = min(f.tell(), size)
+            if cut > cuts[-1]:
+                cuts.append(cut)
+    if size > cuts[-1]:
+        cuts.append(size)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _parse_range(filename, start, end):
+    """Pool worker: parse one byte range into a shared memory block.
+
+    Returns (block name, [(key, dtype, shape, offset), ...]). The block
+    is handed over to the caller, who copies the arrays out and unlinks it.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        chunk = parse_obj_chunk(f.read(end - start))
+    layout, offset = [], 0
+    for key, value in chunk.items():
+        layout.append((key, value.dtype.str, value.shape, offset))
+        offset += -(-value.nbytes // 8) * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (key, dtype, shape, at), value in zip(layout, chunk.values()):
+        np.ndarray(shape, dtype, shm.buf, at)[...] = value
+    # Ownership passes to the parent; keep our tracker from unlinking it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+    return shm.name, layout
+
+
+def _collect(name, layout):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return {key: np.ndarray(shape, dtype, shm.buf, at).copy()
+                for key, dtype, shape, at in layout}
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def parse_parallel(filename, workers, chunk_bytes=CHUNK_BYTES):
+    """Parse a file in a pool of `workers` processes, chunks in file order"""
+    size = os.path.getsize(filename)
+    ranges = split_ranges(filename, max(workers, -(-size // chunk_bytes)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_parse_range, filename, start, end) for start, end in ranges]
+    # The pool has drained here; free every block even if one range failed
+    blocks = [future.result() for future in futures if future.exception() is None]
+    chunks = [_collect(*block) for block in blocks]
+    for future in futures:
+        future.result()
+    return chunks
+
+
+def merge_chunks(chunks):
+    """Concatenate parsed chunks, rebasing relative indices, into MeshData"""
+    bases = {'v': 0, 'vt': 0, 'vn': 0}
+    attrs = {'positions': 'v', 'texcoords': 'vt', 'normals': 'vn'}
+    corners = {'v': [], 'vt': [], 'vn': []}
+    arrays = {'positions': [], 'texcoords': [], 'normals': []}
+    for chunk in chunks:
+        for name in corners:
+            index = chunk[name]
+            corners[name].append(np.where(chunk[name + '_rel'], index + bases[name], index))
+        for attr, name in attrs.items():
+            arrays[attr].append(chunk[attr])
+            bases[name] += len(chunk[attr])
+
+    data = {attr: np.concatenate(parts) if parts else np.zeros((0, 3 if attr != 'texcoords' else 2), np.float32)
+            for attr, parts in arrays.items()}
+    v, vt, vn = (np.concatenate(corners[k]).ravel() if corners[k] else np.zeros(0, np.int64)
+                 for k in ('v', 'vt', 'vn'))
+    return _deindex(data['positions'], data['texcoords'], data['normals'], v, vt, vn)
+
+
+def _deindex(positions, texcoords, normals, v, vt, vn):
+    """Turn OBJ's per-attribute index streams into one shared vertex index"""
+    if (v >= len(positions)).any() or (v < 0).any():
+        raise ValueError("OBJ face references a vertex that does not exist")
+    use_t = bool(len(texcoords) and len(vt) and (vt >= 0).all())
+    use_n = bool(len(normals) and len(vn) and (vn >= 0).all())
+    if not use_t and not use_n:
+        return MeshData(positions, v.astype(np.uint32))
+
+    # One int64 key per (v, vt, vn) corner; unique keys become vertices
+    sizes = [len(positions)] + [len(texcoords)] * use_t + [len(normals)] * use_n
+    if np.prod(np.array(sizes, dtype=np.float64)) < 2.0 ** 62:
+        key = v.astype(np.int64)
+        if use_t:
+            key = key * len(texcoords) + vt
+        if use_n:
+            key = key * len(normals) + vn
+    else:
+        key = np.column_stack([v] + [vt] * use_t + [vn] * use_n)
+    _, first, inverse = np.unique(key, axis=0 if key.ndim == 2 else None,
+                                  return_index=True, return_inverse=True)
+    return MeshData(positions[v[first]], inverse.astype(np.uint32).ravel(),
+                    normals[vn[first]] if use_n else None,
+                    texcoords[vt[first]] if use_t else None)
+
+
+def _cache_path(filename, processed=False, lod_levels=0):
+    suffix = ('.prep' if processed else '') + (f'.lod{lod_levels}' if lod_levels else '')
+    return filename + suffix + '.cache.npz'
+
+
+def _cache_key(filename, processed=False, lod_levels=0):
+    st = os.stat(filename)
+    key = np.array([CACHE_VERSION, st.st_size, st.st_mtime_ns, processed, lod_levels], dtype=np.int64)
+    return key, os.path.abspath(filename)
+
+
+def _load_cache(filename, *options):
+    path = _cache_path(filename, *options)
+    try:
+        key, source = _cache_key(filename, *options)
+        with np.load(path) as cached:
+            if str(cached['source']) != source or not np.array_equal(cached['key'], key):
+                return None
+            return MeshData.from_arrays({name: cached[name] for name in cached.files})
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_cache(filename, mesh, *options):
+    path = _cache_path(filename, *options)
+    key, source = _cache_key(filename, *options)
+    tmp = path + '.tmp.npz'
+    try:
+        np.savez(tmp, key=key, source=np.array(source), **mesh.arrays())
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def load_obj_file(filename, use_cache=True, chunk_bytes=CHUNK_BYTES, workers=1, preprocess=False,
+                  lod_levels=0):
+    """
+    Load vertices dan faces dari file .obj
+    Return: MeshData (positions, normals, texcoords, indices) atau None
+    workers > 1 mem-parse file di beberapa proses sekaligus
+    preprocess=True: weld vertex, hitung normal, urutkan untuk vertex cache
+    lod_levels > 0: buat level of detail yang lebih kasar di mesh.lods
+    """
+    if use_cache:
+        mesh = _load_cache(filename, preprocess, lod_levels)
+        if mesh is not None:
+            return mesh
+    try:
+        if workers > 1:
+            mesh = merge_chunks(parse_parallel(filename, workers, chunk_bytes))
+        else:
+            with open(filename, 'rb') as file:
+                mesh = merge_chunks(parse_obj_chunk(chunk) for chunk in _iter_chunks(file, chunk_bytes))
+    except FileNotFoundError:
+        print(f"File {filename} tidak ditemukan. Menggunakan kubus default.")
+        return None
+
+    print(f"Loaded {mesh.vertex_count} vertices and {mesh.triangle_count} triangles from {filename}")
+    if preprocess:
+        mesh, report = preprocess_mesh(mesh)
+        print(f"Preprocessed: {report['vertices_before']} -> {report['vertices_after']} vertices, "
+              f"ACMR {report['acmr_before']:.3f} -> {report['acmr_after']:.3f}")
+    if lod_levels:
+        mesh.lods = build_lods(mesh, lod_levels)
+        print("LODs: " + ", ".join(f"{lod.triangle_count}" for lod in mesh.lods) + " triangles")
+    if use_cache:
+        _save_cache(filename, mesh, preprocess, lod_levels)
+    return mesh
@@ -0,0 +1,168 @@
+"""Per-frame profiler shared by the 2D editor and the 3D viewer.
+
+Code is wrapped in named scopes (``with profiler.scope('render'):``)
+between begin_frame() and end_frame(). Per-frame totals of every scope
+go into fixed-size ring buffers for percentile summaries and the
+on-screen frame-time graph; individual scope events go into a bounded
+deque that export_chrome_trace() writes as Chrome trace JSON (open it
+in chrome://tracing or Perfetto). While disabled, scope() returns one
+shared no-op context manager, so instrumented code pays only for a
+method call.
+"""
+import json
+import os
+from collections import deque
+from contextlib import nullcontext
+from time import perf_counter
+
+import numpy as np
+from OpenGL.GL import *
+
+_NULL_SCOPE = nullcontext()
+
+
+class _Scope:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, perf_counter())
+        return False
+
+
+class Profiler:
+    def __init__(self, capacity=600, enabled=False, max_events=200000):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.frame_times = np.zeros(capacity)
+        self.scope_times = {}           # scope name -> ring buffer of per-frame totals (s)
+        self.frame_count = 0
+        self.events = deque(maxlen=max_events)  # (name, start, duration) in seconds
+        self._frame_start = None
+        self._totals = {}
+
+    def scope(self, name):
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self, name)
+
+    def record(self, name, start, end):
+        self._totals[name] = self._totals.get(name, 0.0) + (end - start)
+        self.events.append((name, start, end - start))
+
+    def begin_frame(self):
+        if self.enabled:
+            self._frame_start = perf_counter()
+            self._totals = {}
+
+    def end_frame(self):
+        if not self.enabled or self._frame_start is None:
+            return
+        end = perf_counter()
+        slot = self.frame_count % self.capacity
+        self.frame_times[slot] = end - self._frame_start
+        for name in self.scope_times.keys() | self._totals.keys():
+            times = self.scope_times.setdefault(name, np.zeros(self.capacity))
+            times[slot] = self._totals.get(name, 0.0)
+        self.events.append(('frame', self._frame_start, end - self._frame_start))
+        self.frame_count += 1
+        self._frame_start = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self._frame_start = None
+        return self.enabled
+
+    def history(self, times=None):
+        """Samples of a ring buffer (frame times by default), oldest first"""
+        times = self.frame_times if times is None else times
+        n = min(self.frame_count, self.capacity)
+        if self.frame_count <= self.capacity:
+            return times[:n]
+        slot = self.frame_count % self.capacity
+        return np.concatenate([times[slot:], times[:slot]])
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """{name: {'p50': ms, ..., 'max': ms, 'mean': ms}} for 'frame' and every scope"""
+        out = {}
+        for name, times in [('frame', self.frame_times)] + sorted(self.scope_times.items()):
+            samples = self.history(times) * 1e3
+            if len(samples) == 0:
+                continue
+            row = {f'p{p}': float(v) for p, v in zip(percentiles, np.percentile(samples, percentiles))}
+            row['max'] = float(samples.max())
+            row['mean'] = float(samples.mean())
+            out[name] = row
+        return out
+
+    def format_summary(self):
+        lines = []
+        for name, row in self.summary().items():
+            lines.append(f"{name:>12}  p50 {row['p50']:6.2f}  p95 {row['p95']:6.2f}  "
+                         f"p99 {row['p99']:6.2f}  max {row['max']:6.2f} ms")
+        return lines
+
+    def export_chrome_trace(self, path):
+        """Write recorded events as Chrome trace JSON ('X' complete events, microseconds)"""
+        pid = os.getpid()
+        events = [{'name': name, 'cat': 'frame' if name == 'frame' else 'scope', 'ph': 'X',
+                   'ts': start * 1e6, 'dur': duration * 1e6, 'pid': pid, 'tid': 0}
+                  for name, start, duration in self.events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+    def graph_vertices(self, x, y, width, height, budget_ms=1000 / 60):
+        """Line strip of recent frame times; budget_ms sits at half the graph height"""
+        samples = self.history()[-int(width):] * 1e3
+        if len(samples) < 2:
+            return np.zeros((0, 2), dtype=np.float32)
+        xs = x + np.arange(len(samples)) * (width / max(len(samples) - 1, 1))
+        ys = y + np.minimum(samples / (2 * budget_ms), 1.0) * height
+        return np.column_stack([xs, ys]).astype(np.float32)
+
+    def draw_graph(self, screen_width, screen_height, width=300, height=80, margin=10):
+        """Frame-time graph in the top-right corner, drawn in window pixels over any scene"""
+        x, y = screen_width - width - margin, screen_height - height - margin
+        strip = self.graph_vertices(x, y, width, height)
+        glPushAttrib(GL_ENABLE_BIT | GL_CURRENT_BIT | GL_LINE_BIT)
+        glDisable(GL_LIGHTING)
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_TEXTURE_2D)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, screen_width, 0, screen_height, -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glLineWidth(1)
+        # Frame and the budget line (60 FPS)
+        glColor3f(0.4, 0.4, 0.4)
+        glBegin(GL_LINE_LOOP)
+        for px, py in ((x, y), (x + width, y), (x + width, y + height), (x, y + height)):
+            glVertex2f(px, py)
+        glEnd()
+        glColor3f(0.2, 0.6, 0.2)
+        glBegin(GL_LINES)
+        glVertex2f(x, y + height / 2)
+        glVertex2f(x + width, y + height / 2)
+        glEnd()
+        if len(strip):
+            glColor3f(1.0, 0.8, 0.2)
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glVertexPointer(2, GL_FLOAT, 0, strip)
+            glDrawArrays(GL_LINE_STRIP, 0, len(strip))
+            glDisableClientState(GL_VERTEX_ARRAY)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glPopAttrib()
@@ -0,0 +1,302 @@
+"""Headless NumPy software renderer for Viewer3D scenes.
+
+Renders what Viewer3D would show without a window or GL context: the
+same Camera matrices, the same PhongLighting parameters and the same
+fixed-function lighting equation. Vertices are transformed in one
+batch, triangles are clipped against the near plane, binned into
+screen tiles and rasterized per tile with a z-buffer; tiles run in a
+thread pool (NumPy releases the GIL in its inner loops). Shading is
+per pixel ('phong') or per vertex ('gouraud', as glShadeModel(GL_SMOOTH)
+does in the interactive view). Frames can be written as PNG or .npy.
+"""
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from meshprep import smooth_normals
+
+TILE_SIZE = 64
+# Upper bound on candidate fragments examined in one vectorized step
+MAX_FRAGMENTS = 1 << 20
+
+
+class SoftwareRenderer:
+    """Offscreen renderer for meshes placed with 4x4 model matrices.
+
+    color mirrors GL_COLOR_MATERIAL in PhongLighting.setup: material
+    ambient and diffuse follow the current colour, which Viewer3D leaves
+    at white. Pass color=None to use the lighting's material colours.
+    """
+    def __init__(self, width, height, camera, lighting, shading='phong', tile_size=TILE_SIZE,
+                 workers=None, clear_color=(0.1, 0.1, 0.1), color=(1.0, 1.0, 1.0)):
+        if shading not in ('phong', 'gouraud'):
+            raise ValueError(f"unknown shading {shading!r}")
+        self.width = width
+        self.height = height
+        self.camera = camera
+        self.lighting = lighting
+        self.shading = shading
+        self.tile_size = tile_size
+        self.workers = workers or os.cpu_count() or 1
+        self.clear_color = np.asarray(clear_color, dtype=np.float32)
+        self.color = color
+        self.stats = {'triangles': 0, 'clipped': 0, 'tiles': 0, 'fragments': 0}
+
+    def render(self, items):
+        """Render (mesh, model_matrix) pairs; returns an (H, W, 3) float32 image, top row first.
+
+        mesh is a GRAFKOM3D.Mesh (vertices = position + normal) or an
+        objloader.MeshData.
+        """
+        view = self.camera.view_matrix()
+        projection = self.camera.projection_matrix(self.width / self.height)
+        corners = []
+        for mesh, model in items:
+            corners.append(self._transform(mesh, view @ np.asarray(model, dtype=np.float64), projection))
+        corners = np.concatenate(corners) if corners else np.zeros((0, 3, 4 + self._attr_size()))
+        self.stats = {'triangles': len(corners), 'clipped': 0, 'tiles': 0, 'fragments': 0}
+
+        corners = self._clip_near(corners)
+        setup = self._setup(corners)
+        image = np.empty((self.height, self.width, 3), dtype=np.float32)
+        image[:] = self.clear_color
+        tiles = self._bin(setup)
+        self.stats['tiles'] = len(tiles)
+        if self.workers > 1 and len(tiles) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                counts = list(pool.map(lambda tile: self._raster_tile(image, setup, *tile), tiles))
+        else:
+            counts = [self._raster_tile(image, setup, *tile) for tile in tiles]
+        self.stats['fragments'] = int(sum(counts))
+        return image[::-1]
+
+    def render_scene(self, scene, root=None):
+        """Render a Scene3D the way Scene3D.draw would, LOD and culling included"""
+        root = np.eye(4) if root is None else root
+        ids = np.sort(scene.cull(self.camera.frustum_planes(self.width / self.height) @ root))
+        levels = scene.select_lods(ids, scene.screen_size(ids, self.camera, self.height, root))
+        return self.render((scene.meshes[level], root @ scene.world[i]) for i, level in zip(ids, levels))
+
+    # Geometry
+
+    def _attr_size(self):
+        return 6 if self.shading == 'phong' else 3
+
+    def _transform(self, mesh, modelview, projection):
+        """Per-corner (T, 3, 4 + attrs) array: clip position then shading attributes"""
+        if hasattr(mesh, 'vertices'):
+            positions, normals = mesh.vertices[:, :3], mesh.vertices[:, 3:6]
+        else:
+            positions, normals = mesh.positions, mesh.normals
+            if normals is None:
+                normals = smooth_normals(positions, mesh.indices)
+        eye = positions @ modelview[:3, :3].T + modelview[:3, 3]
+        # GL transforms normals by the inverse transpose; GL_NORMALIZE rescales them
+        normal_matrix = np.linalg.inv(modelview[:3, :3]).T
+        eye_normals = normals @ normal_matrix.T
+        eye_normals /= np.maximum(np.linalg.norm(eye_normals, axis=1, keepdims=True), 1e-12)
+        clip = np.column_stack([eye, np.ones(len(eye))]) @ projection.T
+        if self.shading == 'phong':
+            attrs = np.hstack([eye, eye_normals])
+        else:
+            attrs = self._shade(eye, eye_normals)
+        vertex = np.hstack([clip, attrs])
+        return vertex[np.asarray(mesh.indices).reshape(-1, 3)]
+
+    def _clip_near(self, corners):
+        """Clip triangles against the near plane (z_clip >= -w) in clip space"""
+        d = corners[:, :, 2] + corners[:, :, 3]
+        inside = d >= 0
+        n_in = inside.sum(axis=1)
+        keep = [corners[n_in == 3]]
+        for count in (1, 2):
+            tris, dist, mask = corners[n_in == count], d[n_in == count], inside[n_in == count]
+            if len(tris) == 0:
+                continue
+            # Rotate corners (keeping the winding) so the odd one out comes first
+            odd = np.argmax(mask if count == 1 else ~mask, axis=1)
+            roll = (odd[:, None] + np.arange(3)) % 3
+            rows = np.arange(len(tris))[:, None]
+            a, b, c = (tris[rows, roll][:, k] for k in range(3))
+            da, db, dc = (dist[rows, roll][:, k][:, None] for k in range(3))
+            ab = a + (b - a) * (da / (da - db))
+            ac = a + (c - a) * (da / (da - dc))
+            if count == 1:
+                keep.append(np.stack([a, ab, ac], axis=1))
+            else:
+                keep.append(np.stack([ab, b, c], axis=1))
+                keep.append(np.stack([ab, c, ac], axis=1))
+        clipped = np.concatenate(keep)
+        self.stats['clipped'] = len(corners) - int((n_in == 3).sum())
+        return clipped
+
+    def _setup(self, corners):
+        """Window coordinates, depth and edge setup for each triangle"""
+        w = corners[:, :, 3]
+        inv_w = 1.0 / w
+        ndc = corners[:, :, :3] * inv_w[..., None]
+        x = (ndc[:, :, 0] + 1) * (self.width / 2)
+        y = (ndc[:, :, 1] + 1) * (self.height / 2)
+        area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+        ok = np.abs(area) > 1e-12
+        return {'x': x[ok], 'y': y[ok], 'z': ndc[ok, :, 2], 'inv_w': inv_w[ok],
+                'area': area[ok], 'attrs': corners[ok, :, 4:]}
+
+    def _bin(self, setup):
+        """(tile x0, tile y0, triangle ids) for every tile touched by a triangle bounding box"""
+        x, y = setup['x'], setup['y']
+        size = self.tile_size
+        tiles_x = -(-self.width // size)
+        tiles_y = -(-self.height // size)
+        tx0 = np.clip(np.floor(x.min(axis=1) / size), 0, tiles_x - 1).astype(np.int64)
+        tx1 = np.clip(np.floor(x.max(axis=1) / size), 0, tiles_x - 1).astype(np.int64)
+        ty0 = np.clip(np.floor(y.min(axis=1) / size), 0, tiles_y - 1).astype(np.int64)
+        ty1 = np.clip(np.floor(y.max(axis=1) / size), 0, tiles_y - 1).astype(np.int64)
+        onscreen = ((x.max(axis=1) >= 0) & (x.min(axis=1) < self.width) &
+                    (y.max(axis=1) >= 0) & (y.min(axis=1) < self.height))
+        tris = np.flatnonzero(onscreen)
+        wx = (tx1 - tx0 + 1)[tris]
+        wy = (ty1 - ty0 + 1)[tris]
+        n = wx * wy
+        tri = np.repeat(tris, n)
+        k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        tile = (ty0[tri] + k // np.repeat(wx, n)) * tiles_x + tx0[tri] + k % np.repeat(wx, n)
+        order = np.argsort(tile, kind='stable')
+        tile, tri = tile[order], tri[order]
+        bounds = np.flatnonzero(np.r_[True, tile[1:] != tile[:-1]]) if len(tile) else np.zeros(0, int)
+        ends = np.r_[bounds[1:], len(tile)]
+        return [((tile[s] % tiles_x) * size, (tile[s] // tiles_x) * size, tri[s:e])
+                for s, e in zip(bounds, ends)]
+
+    # Rasterization
+
+    def _raster_tile(self, image, setup, x0, y0, tris):
+        """Rasterize and shade one tile into image (rows bottom-up); returns fragments tested"""
+        w = min(self.tile_size, self.width - x0)
+        h = min(self.tile_size, self.height - y0)
+        depth = np.full(h * w, np.inf)
+        winner = np.full(h * w, -1, dtype=np.int64)
+        bary = np.zeros((h * w, 3))
+        x, y, z = setup['x'][tris], setup['y'][tris], setup['z'][tris]
+        # Pixel range of each bounding box inside the tile (pixel centers at +0.5)
+        px0 = np.clip(np.ceil(x.min(axis=1) - 0.5), x0, x0 + w).astype(np.int64)
+        px1 = np.clip(np.floor(x.max(axis=1) - 0.5) + 1, x0, x0 + w).astype(np.int64)
+        py0 = np.clip(np.ceil(y.min(axis=1) - 0.5), y0, y0 + h).astype(np.int64)
+        py1 = np.clip(np.floor(y.max(axis=1) - 0.5) + 1, y0, y0 + h).astype(np.int64)
+        bw = np.maximum(px1 - px0, 0)
+        n = bw * np.maximum(py1 - py0, 0)
+        tested = 0
+        start = 0
+        while start < len(tris):
+            # Take as many triangles as fit in one fragment batch
+            stop = start + max(1, int(np.searchsorted(np.cumsum(n[start:]), MAX_FRAGMENTS, side='right')))
+            sel = np.arange(start, stop)
+            start = stop
+            counts = n[sel]
+            if counts.sum() == 0:
+                continue
+            t = np.repeat(sel, counts)
+            k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            px = px0[t] + k % bw[t]
+            py = py0[t] + k // bw[t]
+            cx, cy = px + 0.5, py + 0.5
+            tested += len(t)
+
+            xt, yt, area = x[t], y[t], setup['area'][tris[t]]
+            # Edge functions = barycentric weights scaled by the signed area
+            b0 = ((xt[:, 1] - cx) * (yt[:, 2] - cy) - (xt[:, 2] - cx) * (yt[:, 1] - cy)) / area
+            b1 = ((xt[:, 2] - cx) * (yt[:, 0] - cy) - (xt[:, 0] - cx) * (yt[:, 2] - cy)) / area
+            b2 = 1.0 - b0 - b1
+            frag_z = b0 * z[t, 0] + b1 * z[t, 1] + b2 * z[t, 2]
+            ok = (b0 >= 0) & (b1 >= 0) & (b2 >= 0) & (frag_z >= -1) & (frag_z <= 1)
+            pixel = (py - y0) * w + (px - x0)
+            pixel, frag_z, t = pixel[ok], frag_z[ok], t[ok]
+            weights = np.column_stack([b0[ok], b1[ok], b2[ok]])
+
+            # Nearest fragment per pixel, then the depth test against the tile z-buffer
+            order = np.lexsort((frag_z, pixel))
+            first = order[np.r_[True, pixel[order][1:] != pixel[order][:-1]]] if len(order) else order
+            closer = frag_z[first] < depth[pixel[first]]
+            first = first[closer]
+            depth[pixel[first]] = frag_z[first]
+            winner[pixel[first]] = tris[t[first]]
+            bary[pixel[first]] = weights[first]
+
+        covered = np.flatnonzero(winner >= 0)
+        if len(covered):
+            image[y0 + covered // w, x0 + covered % w] = self._fragment_colors(setup, winner[covered],
+                                                                               bary[covered])
+        return tested
+
+    def _fragment_colors(self, setup, tris, bary):
+        # Perspective-correct interpolation: weight by 1/w and renormalize
+        weights = bary * setup['inv_w'][tris]
+        weights /= weights.sum(axis=1, keepdims=True)
+        attrs = np.einsum('fk,fkc->fc', weights, setup['attrs'][tris])
+        if self.shading == 'gouraud':
+            return attrs
+        normals = attrs[:, 3:6]
+        normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+        return self._shade(attrs[:, :3], normals)
+
+    # Lighting
+
+    def _shade(self, eye, normals):
+        """Fixed-function GL lighting for eye-space points and unit normals (LIGHT0, local light)"""
+        lighting = self.lighting
+        if self.color is not None:
+            mat_ambient = mat_diffuse = np.asarray(self.color[:3], dtype=np.float64)
+        else:
+            mat_ambient = np.asarray(lighting.material_ambient[:3], dtype=np.float64)
+            mat_diffuse = np.asarray(lighting.material_diffuse[:3], dtype=np.float64)
+        mat_specular = np.asarray(lighting.material_specular[:3], dtype=np.float64)
+        # GL_LIGHT_MODEL_AMBIENT term; LIGHT0's own ambient stays at GL's default of zero
+        color = np.asarray(lighting.ambient_color[:3]) * mat_ambient + np.zeros_like(eye)
+
+        light = np.asarray(lighting.diffuse_position, dtype=np.float64)
+        light_eye = self.camera.view_matrix() @ light
+        if light[3] != 0:
+            to_light = light_eye[:3] / light_eye[3] - eye
+        else:
+            to_light = np.broadcast_to(light_eye[:3], eye.shape)
+        to_light = to_light / np.maximum(np.linalg.norm(to_light, axis=1, keepdims=True), 1e-12)
+        n_dot_l = (normals * to_light).sum(axis=1)
+        diffuse = np.maximum(n_dot_l, 0)[:, None] * np.asarray(lighting.diffuse_color[:3]) * mat_diffuse
+        # Infinite viewer (GL's default): half vector between the light and +z
+        half = to_light + np.array([0.0, 0.0, 1.0])
+        half /= np.maximum(np.linalg.norm(half, axis=1, keepdims=True), 1e-12)
+        n_dot_h = np.maximum((normals * half).sum(axis=1), 0)
+        spec = np.where(n_dot_l > 0, n_dot_h ** lighting.material_shininess, 0)
+        specular = spec[:, None] * np.asarray(lighting.specular_color[:3]) * mat_specular
+        return np.clip(color + diffuse + specular, 0, 1)
+
+
+def to_uint8(image):
+    return (np.clip(image, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+
+def write_png(path, image):
+    """Write an (H, W, 3) float or uint8 image as an 8-bit RGB PNG"""
+    pixels = image if image.dtype == np.uint8 else to_uint8(image)
+    height, width = pixels.shape[:2]
+    rows = np.concatenate([np.zeros((height, 1), np.uint8), pixels.reshape(height, -1)], axis=1)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def save_frame(path, image):
+    """Save a rendered frame as .png or, for any other extension, as a NumPy .npy"""
+    if path.lower().endswith('.png'):
+        write_png(path, image)
+    else:
+        np.save(path, image)
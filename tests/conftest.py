@@ -0,0 +1,24 @@
+import os
+import sys
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import pytest
+
+import GRAFKOM2D
+
+
+@pytest.fixture
+def make_editor(monkeypatch):
+    """Build Graphics2DEditor instances without a window or GL context"""
+    monkeypatch.setattr(pygame.display, 'set_mode', lambda *args, **kwargs: None)
+    monkeypatch.setattr(pygame.display, 'set_caption', lambda *args: None)
+    monkeypatch.setattr(GRAFKOM2D, 'glClearColor', lambda *args: None)
+    monkeypatch.setattr(GRAFKOM2D, 'glBlendFunc', lambda *args: None)
+
+    def make(scene_path=None):
+        return GRAFKOM2D.Graphics2DEditor(scene_path)
+    return make
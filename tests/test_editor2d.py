@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pygame
+
+from GRAFKOM2D import Shape, ShapeStore, load_scene, save_scene
+
+
+def saved_scene(path):
+    store = ShapeStore()
+    store.append(Shape('rectangle', [[0, 0], [40, 0], [40, 30], [0, 30]], (1.0, 0.0, 0.0), 2.0))
+    store.append(Shape('line', [[5, 5], [60, 70]], (0.0, 1.0, 0.0), 1.0))
+    save_scene(store, path)
+    return store
+
+
+def press(editor, key):
+    pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0))
+    editor.handle_events()
+
+
+def test_editor_starts_from_saved_scene(make_editor, tmp_path):
+    path = str(tmp_path / 'scene.gk2d')
+    store = saved_scene(path)
+
+    editor = make_editor(path)
+    assert len(editor.shapes) == 2
+    assert editor.renderer.store is editor.shapes
+    assert editor.selected_shapes == [] and editor.selection_targets == []
+    assert not editor.history.can_undo()
+    np.testing.assert_allclose(editor.shapes.transformed, store.transformed)
+
+
+def test_editor_starts_empty_without_scene(make_editor):
+    editor = make_editor()
+    assert len(editor.shapes) == 0
+
+
+def test_without_a_path_nothing_is_loaded_or_overwritten(make_editor, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    saved_scene('drawing.gk2d')
+    before = open('drawing.gk2d', 'rb').read()
+
+    editor = make_editor()
+    assert len(editor.shapes) == 0
+    editor.add_shape(Shape('point', [[1, 2]], (1.0, 1.0, 1.0), 1.0))
+    press(editor, pygame.K_F5)
+    assert open('drawing.gk2d', 'rb').read() == before
+    assert editor.scene_path == 'drawing-2.gk2d'
+    assert len(load_scene('drawing-2.gk2d')) == 1
+
+    # Later saves and loads use the file picked by the first save
+    editor.add_shape(Shape('point', [[3, 4]], (1.0, 1.0, 1.0), 1.0))
+    press(editor, pygame.K_F5)
+    press(editor, pygame.K_F9)
+    assert len(editor.shapes) == 2
+    assert sorted(os.listdir('.')) == ['drawing-2.gk2d', 'drawing.gk2d']
+
+
+def test_f5_saves_to_the_path_given(make_editor, tmp_path):
+    path = str(tmp_path / 'scene.gk2d')
+    saved_scene(path)
+    editor = make_editor(path)
+    editor.add_shape(Shape('point', [[1, 2]], (1.0, 1.0, 1.0), 1.0))
+    press(editor, pygame.K_F5)
+    assert len(load_scene(path)) == 3
@@ -0,0 +1,65 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+from export2d import BACKGROUND, ShapeRasterizer, write_svg
+from GRAFKOM2D import Shape, ShapeStore
+
+WIDTH, HEIGHT = 64, 48
+VIEW = (1.0, 0.0, 0.0)      # world units are pixels, y up
+RED, GREEN, BLUE = (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)
+
+
+@pytest.fixture
+def store():
+    store = ShapeStore()
+    store.append(Shape('line', [[5.0, 10.5], [40.0, 10.5]], RED, 1.0))
+    store.append(Shape('point', [[20.5, 30.5]], GREEN, 2.0))
+    # Drawn last, crossing the red line at x = 30
+    store.append(Shape('polyline', [[30.5, 2.0], [30.5, 20.0], [55.0, 40.0]], BLUE, 1.0))
+    return store
+
+
+def pixel(image, x, y):
+    """Colour of the pixel with bottom-up coordinates (x, y)"""
+    return image[HEIGHT - 1 - y, x]
+
+
+def test_shapes_land_on_known_pixels(store):
+    image = ShapeRasterizer(WIDTH, HEIGHT, workers=1).render(store, VIEW)
+    assert image.shape == (HEIGHT, WIDTH, 3)
+    np.testing.assert_allclose(pixel(image, 10, 10), RED)
+    np.testing.assert_allclose(pixel(image, 20, 30), GREEN)
+    np.testing.assert_allclose(pixel(image, 30, 15), BLUE)
+    # The polyline is drawn over the line where they cross
+    np.testing.assert_allclose(pixel(image, 30, 10), BLUE)
+    # Points are squares of side 2 * thickness, anti-aliased at the border
+    np.testing.assert_allclose(pixel(image, 21, 31), GREEN)
+    assert 0 < pixel(image, 22, 30)[1] < 1
+    # Background elsewhere; a polyline has no closing edge
+    np.testing.assert_allclose(pixel(image, 60, 5), BACKGROUND, atol=1e-6)
+    np.testing.assert_allclose(pixel(image, 42, 21), BACKGROUND, atol=1e-6)
+
+
+def test_tiles_and_workers_do_not_change_the_image(store):
+    whole = ShapeRasterizer(WIDTH, HEIGHT, tile_size=256, workers=1).render(store, VIEW)
+    tiled = ShapeRasterizer(WIDTH, HEIGHT, tile_size=16, workers=3).render(store, VIEW)
+    np.testing.assert_array_equal(tiled, whole)
+    fitted = ShapeRasterizer(WIDTH, HEIGHT, tile_size=256, workers=1).render(store)
+    tiled = ShapeRasterizer(WIDTH, HEIGHT, tile_size=8, workers=2).render(store)
+    np.testing.assert_array_equal(tiled, fitted)
+
+
+def test_svg_has_one_element_per_shape(store, tmp_path):
+    path = tmp_path / 'scene.svg'
+    write_svg(str(path), store, WIDTH, HEIGHT, VIEW)
+    root = ET.parse(path).getroot()
+    ns = '{http://www.w3.org/2000/svg}'
+    assert root.tag == ns + 'svg' and root.get('width') == str(WIDTH)
+    shapes = list(root.find(ns + 'g'))
+    assert [element.tag[len(ns):] for element in shapes] == ['path', 'rect', 'polyline']
+    assert shapes[0].get('stroke') == '#ff0000'
+    assert shapes[0].get('d') == 'M5.00,37.50 L40.00,37.50'  # SVG y points down
+    assert shapes[1].get('fill') == '#00ff00' and shapes[1].get('width') == '4'
+    assert len(shapes[2].get('points').split()) == 3
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from GRAFKOM2D import Shape, ShapeStore, load_scene, save_scene
+
+
+def rect(x, y, w=20, h=10):
+    return Shape('rectangle', [[x, y], [x + w, y], [x + w, y + h], [x, y + h]], (1.0, 1.0, 1.0), 1.0)
+
+
+@pytest.fixture
+def tree():
+    """top(g1(g1a, s3-5), g2(s6-8)) with s0-2 in g1a and s9-11 ungrouped"""
+    store = ShapeStore()
+    shapes = [store.append(rect(30 * i, 10 * (i % 3))) for i in range(12)]
+    shapes[4].rotation_angle = 30
+    shapes[7].scale_factor = [1.5, 0.5]
+    g1a = store.group(shapes[0:3])
+    g1 = store.group(shapes[3:6], [g1a])
+    g2 = store.group(shapes[6:9])
+    top = store.group(groups=[g1, g2])
+    store.flush()
+    return store, shapes, {'g1a': g1a, 'g1': g1, 'g2': g2, 'top': top}
+
+
+def rebuilt(store, nodes, change):
+    """(shape ids, group names) recomputed by the flush after change()"""
+    shapes = store.rebuild_counts.copy()
+    groups = store.group_rebuild_counts.copy()
+    change()
+    store.flush()
+    names = {group.index: name for name, group in nodes.items()}
+    return (set(np.flatnonzero(store.rebuild_counts - shapes).tolist()),
+            {names[g] for g in np.flatnonzero(store.group_rebuild_counts - groups).tolist()})
+
+
+def world_points(store, shapes):
+    """Each shape's points through its own and every ancestor's transform, composed by hand"""
+    out = []
+    for shape in shapes:
+        matrix = shape.compute_transform()
+        group = shape.group
+        while group is not None:
+            i = group.index
+            dx, dy, angle, sx, sy = group.transform_params()
+            px, py = store._group_pivots[i]
+            c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+            scale = np.diag([sx, sy, 1.0])
+            pivot = np.array([[1, 0, px], [0, 1, py], [0, 0, 1]])
+            rotate = np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+            move = np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]])
+            local = move @ pivot @ rotate @ scale @ np.linalg.inv(pivot) @ store._group_base[i]
+            matrix = local @ matrix
+            group = group.parent
+        points = shape.original_points.astype(np.float64)
+        out.append(points @ matrix[:2, :2].T + matrix[:2, 2])
+    return np.concatenate(out)
+
+
+@pytest.mark.parametrize('name, shapes, groups', [
+    ('g1a', {0, 1, 2}, {'g1a'}),
+    ('g1', {0, 1, 2, 3, 4, 5}, {'g1', 'g1a'}),
+    ('g2', {6, 7, 8}, {'g2'}),
+    ('top', set(range(9)), {'top', 'g1', 'g1a', 'g2'}),
+])
+def test_only_the_dirty_subtree_is_recomputed(tree, name, shapes, groups):
+    store, all_shapes, nodes = tree
+
+    def change():
+        nodes[name].rotation_angle += 20
+        nodes[name].drag_offset[0] += 5
+    assert rebuilt(store, nodes, change) == (shapes, groups)
+    np.testing.assert_allclose(store.transformed, world_points(store, all_shapes), atol=1e-3)
+
+
+def test_shape_edit_recomputes_no_groups(tree):
+    store, shapes, nodes = tree
+
+    def change():
+        shapes[1].drag_offset[1] += 3
+    assert rebuilt(store, nodes, change) == ({1}, set())
+    assert rebuilt(store, nodes, lambda: None) == (set(), set())
+
+
+def test_ungroup_keeps_geometry(tree):
+    store, shapes, nodes = tree
+    nodes['top'].rotation_angle = 25
+    nodes['g1'].scale_factor = [2.0, 1.0]
+    store.flush()
+    before = store.transformed.copy()
+
+    assert store.ungroup(nodes['g2']) is False    # identity: nothing to bake
+    assert store.ungroup(nodes['top'])          # transformed: baked into its children
+    np.testing.assert_allclose(store.transformed, before, atol=1e-3)
+    assert [group.parent for group in store.groups] == [nodes['g1'], None]
+    assert nodes['top'].store is None
+
+    # The baked children still move as a subtree
+    nodes['g1'].rotation_angle += 10
+    store.flush()
+    np.testing.assert_allclose(store.transformed, world_points(store, shapes), atol=1e-3)
+    assert store.ungroup(nodes['g1a']) is False
+    assert store.group_of(0) is nodes['g1']
+
+
+def test_save_load_round_trip_with_groups(tree, tmp_path):
+    store, shapes, nodes = tree
+    nodes['g1'].rotation_angle = 40
+    nodes['top'].drag_offset[0] = 12
+    store.flush()
+    path = str(tmp_path / 'groups.gk2d')
+    save_scene(store, path)
+    loaded = load_scene(path)
+
+    np.testing.assert_allclose(loaded.transformed, store.transformed, atol=1e-4)
+    np.testing.assert_array_equal(loaded.parents, store.parents)
+    assert len(loaded.groups) == 4
+    assert [g.parent.index if g.parent else -1 for g in loaded.groups] == \
+           [g.parent.index if g.parent else -1 for g in store.groups]
+
+    # Editing after loading matches the same edit in the original store
+    for s in (store, loaded):
+        s.groups[nodes['g1'].index].rotation_angle += 15
+        s.flush()
+    np.testing.assert_allclose(loaded.transformed, store.transformed, atol=1e-3)
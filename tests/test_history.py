@@ -0,0 +1,184 @@
+import numpy as np
+import pygame
+import pytest
+
+from GRAFKOM2D import Group, Shape
+from history import Checkpoint, CreateCommand, History, TransformCommand
+
+
+def key(editor, key, mod=0):
+    editor.handle_events([pygame.event.Event(pygame.KEYDOWN, key=key, mod=mod)])
+
+
+def rect(x, y, w=20, h=10):
+    return Shape('rectangle', [[x, y], [x + w, y], [x + w, y + h], [x, y + h]], (1.0, 1.0, 1.0), 1.0)
+
+
+def snapshot(editor):
+    store = editor.shapes
+    return len(store), store.transformed.copy(), store.parents.copy(), len(store.groups)
+
+
+def assert_same(a, b):
+    assert a[0] == b[0] and a[3] == b[3]
+    np.testing.assert_array_equal(a[1], b[1])
+    np.testing.assert_array_equal(a[2], b[2])
+
+
+def test_one_drag_merges_into_one_entry(make_editor):
+    editor = make_editor()
+    shape = editor.add_shape(rect(0, 0))
+    for _ in range(20):
+        with editor.history.transforming([shape], merge_key=1):
+            shape.drag_offset[0] += 1.5
+            shape.drag_offset[1] -= 0.5
+    assert len(editor.history) == 2  # create + one drag
+    delta = editor.history.entries[-1].delta
+    np.testing.assert_allclose(delta, [[30.0, -10.0, 0.0, 0.0, 0.0]])
+
+    # A new drag (another key) is a separate entry
+    with editor.history.transforming([shape], merge_key=2):
+        shape.rotation_angle += 45
+    assert len(editor.history) == 3
+
+    editor.undo()
+    editor.undo()
+    assert shape.transform_params() == (0.0, 0.0, 0.0, 1.0, 1.0)
+    editor.redo()
+    assert shape.transform_params() == (30.0, -10.0, 0.0, 1.0, 1.0)
+
+
+def test_create_and_clear_round_trip(make_editor):
+    editor = make_editor()
+    empty = snapshot(editor)
+    shapes = [editor.add_shape(rect(30 * i, 0)) for i in range(3)]
+    full = snapshot(editor)
+
+    key(editor, pygame.K_c)
+    assert len(editor.shapes) == 0
+    editor.undo()
+    assert_same(snapshot(editor), full)
+    assert all(shape.store is editor.shapes for shape in shapes)
+
+    for _ in range(3):
+        editor.undo()
+    assert_same(snapshot(editor), empty)
+    assert not editor.history.can_undo()
+    for _ in range(4):
+        editor.redo()
+    assert len(editor.shapes) == 0      # back to the cleared store
+    editor.undo()
+    assert_same(snapshot(editor), full)
+
+
+def test_group_and_ungroup_round_trip(make_editor):
+    editor = make_editor()
+    shapes = [editor.add_shape(rect(30 * i, 0)) for i in range(4)]
+    before = snapshot(editor)
+
+    editor.set_selection(shapes[:3])
+    key(editor, pygame.K_g)
+    group = editor.shapes.groups[0]
+    assert editor.selection_targets == [group]
+    grouped = snapshot(editor)
+    assert grouped[3] == 1
+
+    editor.set_selection([shapes[0]])
+    assert editor.selection_targets == [group]
+    key(editor, pygame.K_u)
+    assert_same(snapshot(editor), before)
+
+    editor.undo()   # ungroup
+    assert_same(snapshot(editor), grouped)
+    assert editor.shapes.groups[0] is group
+    editor.undo()   # group
+    assert_same(snapshot(editor), before)
+    editor.redo()
+    assert_same(snapshot(editor), grouped)
+    editor.redo()
+    assert_same(snapshot(editor), before)
+
+
+def test_undo_of_grouped_transform(make_editor):
+    editor = make_editor()
+    shapes = [editor.add_shape(rect(30 * i, 0)) for i in range(2)]
+    editor.set_selection(shapes)
+    key(editor, pygame.K_g)
+    before = snapshot(editor)
+    group = editor.selection_targets[0]
+    assert isinstance(group, Group)
+    key(editor, pygame.K_q)
+    assert group.rotation_angle == 15
+    editor.undo()
+    assert group.rotation_angle == 0
+    np.testing.assert_allclose(editor.shapes.transformed, before[1], atol=1e-4)
+
+
+def test_checkpoints_are_inserted_and_snapped_to(make_editor):
+    editor = make_editor()
+    editor.history = History(checkpoint_every=4)
+    shape = editor.add_shape(rect(0, 0))
+    for _ in range(10):
+        with editor.history.transforming([shape]):
+            shape.drag_offset[0] += 1.0
+    kinds = [type(entry).__name__ for entry in editor.history.entries]
+    assert kinds.count('Checkpoint') == 2
+    assert len(editor.history) == 11
+    # Checkpoints follow every fourth command (the create counts too), so
+    # the second one holds the state after seven moves
+    checkpoint = [entry for entry in editor.history.entries if isinstance(entry, Checkpoint)][1]
+    assert checkpoint.params[0, 0] == 7.0
+
+    # Drift that replayed deltas would carry along is dropped at a checkpoint
+    shape.drag_offset[0] += 1e-3
+    for _ in range(3):
+        editor.undo()
+    assert shape.drag_offset[0] == pytest.approx(7.0 + 1e-3)
+    editor.undo()   # passes the checkpoint first
+    assert shape.drag_offset[0] == 6.0
+    shape.drag_offset[0] -= 1e-3
+    editor.redo()   # the checkpoint right after is applied too
+    assert shape.drag_offset[0] == 7.0
+
+    while editor.history.can_undo():
+        editor.undo()
+    assert len(editor.shapes) == 0
+    assert shape.drag_offset[0] == 0.0
+
+
+class Node:
+    def transform_params(self):
+        return (0.0, 0.0, 0.0, 1.0, 1.0)
+
+
+def command(i):
+    entry = TransformCommand([Node()], np.zeros((1, 5)))
+    entry.label = i
+    return entry
+
+
+def test_trim_drops_oldest_first():
+    size = command(0).nbytes
+    history = History(budget_bytes=5 * size)
+    for i in range(12):
+        history.record(command(i))
+    assert history.nbytes <= history.budget_bytes
+    assert history.nbytes == sum(entry.nbytes for entry in history.entries)
+    assert [entry.label for entry in history.entries] == [7, 8, 9, 10, 11]
+    assert history.trimmed == 7
+    assert history.position == len(history.entries)
+
+
+def test_record_discards_the_redo_tail(make_editor):
+    editor = make_editor()
+    shapes = [editor.add_shape(rect(30 * i, 0)) for i in range(3)]
+    editor.undo()
+    editor.undo()
+    assert editor.history.can_redo()
+    extra = editor.add_shape(rect(0, 50))
+    assert not editor.history.can_redo()
+    assert [entry.shape for entry in editor.history.entries] == [shapes[0], extra]
+    assert editor.history.nbytes == sum(entry.nbytes for entry in editor.history.entries)
+    assert isinstance(editor.history.entries[-1], CreateCommand)
+    assert editor.redo() is None
+    assert len(editor.shapes) == 2
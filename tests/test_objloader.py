@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+import objloader
+from objloader import load_obj_file
+
+SQUARE = [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]]
+
+
+def write(tmp_path, text, name='model.obj'):
+    path = tmp_path / name
+    path.write_bytes(text.encode())
+    return str(path)
+
+
+def triangles(mesh):
+    """Corner positions of every triangle, (T, 3, 3)"""
+    return mesh.positions[mesh.indices].reshape(-1, 3, 3)
+
+
+def square_triangles():
+    square = np.array(SQUARE, dtype=np.float32)
+    return square[[[0, 1, 2], [0, 2, 3]]]
+
+
+def test_comments_blank_lines_and_indentation(tmp_path):
+    path = write(tmp_path, "# exported by hand\n"
+                           "\n"
+                           "v 0 0 0 # origin\n"
+                           "  v 1 0 0\n"
+                           "\tv 1 1 0#no space before the comment\n"
+                           "v 0 1 0\r\n"
+                           "   # indented comment with f 9 9 9 in it\n"
+                           "  f 1 2 3 4   # quad\n")
+    mesh = load_obj_file(path, use_cache=False)
+    np.testing.assert_array_equal(mesh.positions, SQUARE)
+    np.testing.assert_array_equal(triangles(mesh), square_triangles())
+
+
+@pytest.mark.parametrize('face, has_t, has_n', [
+    ('f 1 2 3 4', False, False),
+    ('f 1/1 2/2 3/3 4/4', True, False),
+    ('f 1//1 2//1 3//1 4//1', False, True),
+    ('f 1/1/1 2/2/1 3/3/1 4/4/1', True, True),
+])
+def test_every_face_form(tmp_path, face, has_t, has_n):
+    text = "".join(f"v {x} {y} {z}\n" for x, y, z in SQUARE)
+    text += "".join(f"vt {x} {y}\n" for x, y, _ in SQUARE) + "vn 0 0 1\n" + face + "\n"
+    mesh = load_obj_file(write(tmp_path, text), use_cache=False)
+    np.testing.assert_array_equal(triangles(mesh), square_triangles())
+    corners = mesh.indices
+    if has_t:
+        np.testing.assert_array_equal(mesh.texcoords[corners], mesh.positions[corners][:, :2])
+    else:
+        assert mesh.texcoords is None
+    if has_n:
+        np.testing.assert_array_equal(mesh.normals[corners], [[0, 0, 1]] * len(corners))
+    else:
+        assert mesh.normals is None
+
+
+def test_negative_indices_across_chunks(tmp_path):
+    lines = []
+    for k in range(20):
+        lines += [f"v {k} 0 0", f"v {k} 1 0", f"v {k + 1} 0 0", "vn 0 0 1", "f -3//-1 -2//-1 -1//-1"]
+    path = write(tmp_path, "\n".join(lines) + "\n")
+    whole = load_obj_file(path, use_cache=False)
+    # Small chunks put earlier records in other chunks than the faces using them
+    chunked = load_obj_file(path, use_cache=False, chunk_bytes=64)
+    for mesh in (whole, chunked):
+        expected = np.array([[[k, 0, 0], [k, 1, 0], [k + 1, 0, 0]] for k in range(20)])
+        np.testing.assert_array_equal(triangles(mesh), expected)
+    np.testing.assert_array_equal(chunked.indices, whole.indices)
+
+
+def test_missing_vertex_is_an_error(tmp_path):
+    with pytest.raises(ValueError):
+        load_obj_file(write(tmp_path, "v 0 0 0\nv 1 0 0\nf 1 2 3\n"), use_cache=False)
+
+
+def test_missing_file_returns_none(tmp_path):
+    assert load_obj_file(str(tmp_path / 'nothing.obj')) is None
+
+
+def test_cache_hit_and_invalidation(tmp_path, monkeypatch):
+    text = "".join(f"v {x} {y} {z}\n" for x, y, z in SQUARE) + "f 1 2 3 4\n"
+    path = write(tmp_path, text)
+    first = load_obj_file(path)
+    assert os.path.exists(path + '.cache.npz')
+
+    # A hit never parses the file
+    def fail(chunk):
+        raise AssertionError("parsed despite a valid cache")
+    monkeypatch.setattr(objloader, 'parse_obj_chunk', fail)
+    cached = load_obj_file(path)
+    np.testing.assert_array_equal(cached.positions, first.positions)
+    np.testing.assert_array_equal(cached.indices, first.indices)
+    monkeypatch.undo()
+
+    # Editing the file invalidates the cache
+    write(tmp_path, text.replace("v 1 1 0", "v 2 2 0"))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    edited = load_obj_file(path)
+    np.testing.assert_array_equal(edited.positions[2], [2, 2, 0])
+
+    # use_cache=False neither reads nor writes the sidecar
+    os.remove(path + '.cache.npz')
+    load_obj_file(path, use_cache=False)
+    assert not os.path.exists(path + '.cache.npz')
@@ -0,0 +1,111 @@
+import numpy as np
+import pygame
+
+from GRAFKOM2D import SHAPE_KINDS, Shape, hit_test, tessellate_ellipse
+
+
+def random_shape(rng):
+    kind = rng.choice(['point', 'line', 'polyline', 'rectangle', 'ellipse'])
+    x, y = rng.uniform(0, 400, 2)
+    w, h = rng.uniform(5, 120, 2)
+    color, thickness = (1.0, 1.0, 1.0), float(rng.choice([1.0, 3.0]))
+    if kind == 'point':
+        return Shape('point', [[x, y]], color, thickness)
+    if kind in ('line', 'polyline'):
+        points = [[x, y]] + (rng.uniform(-1, 1, (1 if kind == 'line' else 3, 2)) * [w, h] + [x, y]).tolist()
+        return Shape(kind, points, color, thickness)
+    if kind == 'rectangle':
+        return Shape('rectangle', [[x, y], [x + w, y], [x + w, y + h], [x, y + h]], color, thickness)
+    shape = Shape('ellipse', tessellate_ellipse(x, y, w / 2, h / 2, 32), color, thickness)
+    shape.ellipse = (x, y, w / 2, h / 2)
+    return shape
+
+
+def brute_force_pick(store, points, counts, x, y, tolerance):
+    """Topmost shape under (x, y) from an exact test of every shape, no index"""
+    kinds = [SHAPE_KINDS[shape.type] for shape in store]
+    thickness = [shape.thickness for shape in store]
+    hit = np.flatnonzero(hit_test(kinds, thickness, points, counts, (x, y), tolerance))
+    return store[hit[-1]] if len(hit) else None
+
+
+def assert_picks_match(editor, rng, samples=150):
+    store = editor.shapes
+    # Random clicks plus clicks right on vertices, so there are plenty of hits
+    clicks = rng.uniform(-50, 500, (samples, 2)).tolist()
+    if len(store):
+        for i in rng.choice(len(store), min(len(store), samples // 3), replace=False).tolist():
+            points = store[i].transformed_points
+            clicks.append(points[rng.integers(len(points))].tolist())
+    shapes = [store[i].transformed_points for i in range(len(store))]
+    points = np.concatenate(shapes) if shapes else np.zeros((0, 2))
+    counts = [len(shape) for shape in shapes]
+    hits = 0
+    for x, y in clicks:
+        expected = brute_force_pick(store, points, counts, x, y, 3.0)
+        editor.select_shape_at(x, y)
+        assert editor.selected_shape is expected, (x, y)
+        hits += expected is not None
+    assert hits > 0 or len(store) == 0
+
+
+def test_picking_follows_every_edit(make_editor):
+    rng = np.random.default_rng(7)
+    editor = make_editor()
+    store = editor.shapes
+
+    # Created one by one, with clicks in between: the grid is updated, not rebuilt
+    for _ in range(6):
+        for _ in range(10):
+            store.append(random_shape(rng))
+        assert_picks_match(editor, rng, 40)
+    # One huge shape goes to the grid's list of large shapes
+    store.append(Shape('rectangle', [[-40, -40], [480, -40], [480, 480], [-40, 480]], (0.5, 0.5, 0.5), 1.0))
+    for _ in range(5):
+        store.append(random_shape(rng))
+    rebuilds = store.grid.rebuild_count
+    assert_picks_match(editor, rng)
+
+    # Move, scale and rotate a few shapes, including one under others
+    for i, edit in zip((3, 20, 44, 60), ('move', 'scale', 'rotate', 'move')):
+        shape = store[i]
+        if edit == 'move':
+            shape.drag_offset[0] += 150
+            shape.drag_offset[1] -= 80
+        elif edit == 'scale':
+            shape.scale_factor = [2.5, 0.5]
+        else:
+            shape.rotation_angle = 70
+        assert_picks_match(editor, rng, 60)
+    assert store.grid.rebuild_count == rebuilds
+
+    # Remove shapes from the bottom, middle and top of the stack
+    for where in (0, 0.5, 1):
+        store.remove(store[int(where * (len(store) - 1))])
+        assert_picks_match(editor, rng, 60)
+
+    # Clear, then draw again
+    store.clear()
+    assert_picks_match(editor, rng, 30)
+    for _ in range(15):
+        store.append(random_shape(rng))
+        editor.select_shape_at(*rng.uniform(0, 400, 2))
+    assert_picks_match(editor, rng)
+    editor.handle_events([pygame.event.Event(pygame.KEYDOWN, key=pygame.K_c, mod=0)])
+    assert len(editor.shapes) == 0
+    assert_picks_match(editor, rng, 30)
+
+
+def test_many_moves_fold_the_overlay_back_into_the_table(make_editor):
+    rng = np.random.default_rng(8)
+    editor = make_editor()
+    store = editor.shapes
+    for _ in range(1200):
+        store.append(random_shape(rng))
+    assert_picks_match(editor, rng, 50)
+    rebuilds = store.grid.rebuild_count
+    for i in range(1100):
+        store[i].drag_offset[0] += 5
+        store.flush()
+    assert store.grid.rebuild_count > rebuilds
+    assert_picks_match(editor, rng, 100)
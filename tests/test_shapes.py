@@ -0,0 +1,61 @@
+import numpy as np
+
+from GRAFKOM2D import Shape, ShapeStore
+
+
+def rect(x, y, w=20, h=10):
+    return Shape('rectangle', [[x, y], [x + w, y], [x + w, y + h], [x, y + h]], (1.0, 1.0, 1.0), 1.0)
+
+
+def read_everything(shape):
+    shape.transformed_points
+    shape.transform_matrix
+    shape.get_bounding_box()
+    shape.get_transformed_center()
+
+
+def test_standalone_shape_is_lazy():
+    shape = rect(0, 0)
+    read_everything(shape)
+    counts = shape.recompute_counts
+    for _ in range(10):
+        read_everything(shape)
+    assert shape.recompute_counts == counts
+
+    # Edits only mark the shape dirty; the next read rebuilds once
+    shape.drag_offset[0] += 5
+    shape.rotation_angle = 30
+    shape.scale_factor = [2.0, 2.0]
+    assert shape.recompute_counts == counts
+    for _ in range(3):
+        read_everything(shape)
+    assert shape.recompute_counts == {key: value + 1 for key, value in counts.items()}
+
+
+def test_idle_shapes_in_a_store_are_never_recomputed():
+    store = ShapeStore()
+    shapes = [store.append(rect(30 * i, 0)) for i in range(50)]
+    for shape in shapes:
+        read_everything(shape)
+    flushes = store.flush_count
+    rebuilds = store.rebuild_counts.copy()
+    matrices = [shape.recompute_counts['matrix'] for shape in shapes]
+
+    for _ in range(5):
+        for shape in shapes:
+            read_everything(shape)
+        store.bounds, store.transformed, store.centers
+    assert store.flush_count == flushes
+    np.testing.assert_array_equal(store.rebuild_counts, rebuilds)
+
+    # One edit recomputes exactly the edited shape, in one flush
+    shapes[17].rotation_angle = 45
+    shapes[17].drag_offset[1] -= 2
+    for shape in shapes:
+        read_everything(shape)
+    assert store.flush_count == flushes + 1
+    changed = np.flatnonzero(store.rebuild_counts != rebuilds)
+    assert changed.tolist() == [17]
+    assert store.rebuild_counts[17] == rebuilds[17] + 1
+    assert [shape.recompute_counts['matrix'] for shape in shapes] == \
+           [m + (i == 17) for i, m in enumerate(matrices)]
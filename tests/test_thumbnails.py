@@ -0,0 +1,24 @@
+import json
+import os
+
+from thumbnails import is_current, manifest_key, output_dir, render_model
+
+SETTINGS = {'angles': 2, 'size': [24, 16], 'shading': 'gouraud', 'format': 'npy'}
+
+
+def test_render_model_leaves_the_source_tree_alone(tmp_path):
+    models = tmp_path / 'models'
+    models.mkdir()
+    path = str(models / 'tri.obj')
+    with open(path, 'w') as f:
+        f.write("v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n")
+    folder = output_dir(str(tmp_path / 'out'), path)
+
+    result = render_model(path, folder, SETTINGS)
+    assert result['frames'] == 2 and result['triangles'] == 1
+    assert os.listdir(models) == ['tri.obj']
+    assert sorted(os.listdir(folder)) == ['angle_000.npy', 'angle_001.npy', 'manifest.json']
+    with open(os.path.join(folder, 'manifest.json')) as f:
+        assert json.load(f)['key'] == manifest_key(path, SETTINGS)
+    assert is_current(folder, manifest_key(path, SETTINGS))
+    assert not is_current(folder, manifest_key(path, dict(SETTINGS, angles=3)))
@@ -0,0 +1,149 @@
+import numpy as np
+
+import glstate
+import GRAFKOM3D
+from benchmark import recording_gl
+from GRAFKOM3D import Camera, Cube3D, Object3D, Scene3D
+from glstate import GLStateCache
+
+
+def cube_scene(n=27, spacing=3.0):
+    scene = Scene3D(Cube3D().mesh)
+    grid = np.stack(np.meshgrid(*[np.arange(3)] * 3), axis=-1).reshape(-1, 3)[:n]
+    scene.add((grid - 1) * spacing, scales=0.5)
+    return scene
+
+
+def test_normalize_goes_through_the_state_cache():
+    scene = cube_scene()
+    model = Object3D(Cube3D().mesh, scale=0.5)
+    state = GLStateCache()
+    with recording_gl(GRAFKOM3D, glstate) as calls:
+        for _ in range(3):
+            state.begin_frame()
+            scene.draw(Camera(), 4 / 3, state=state)
+            model.draw(state)
+    assert calls['glEnable'] == 1
+    assert state.last_frame['elided'] >= 1
+
+
+def test_merge_instances_transforms_each_copy():
+    mesh = Cube3D().mesh
+    scene = cube_scene(4)
+    scene.move([1], rotations=[[30, 45, 10]])
+    scene.update()
+    merged = GRAFKOM3D.merge_instances(mesh, scene.world)
+    v = len(mesh.vertices)
+    assert merged.triangle_count == 4 * mesh.triangle_count
+    for i, world in enumerate(scene.world):
+        copy = merged.vertices[i * v:(i + 1) * v]
+        np.testing.assert_allclose(copy[:, :3], mesh.vertices[:, :3] @ world[:3, :3].T + world[:3, 3], atol=1e-5)
+        normals = copy[:, 3:] / np.linalg.norm(copy[:, 3:], axis=1, keepdims=True)
+        np.testing.assert_allclose(normals, mesh.vertices[:, 3:] @ world[:3, :3].T / 0.5, atol=1e-5)
+    np.testing.assert_array_equal(merged.indices[-len(mesh.indices):], mesh.indices + 3 * v)
+
+
+def test_visible_objects_are_drawn_in_merged_batches():
+    scene = cube_scene()
+    with recording_gl(GRAFKOM3D, glstate) as calls:
+        stats = scene.draw(Camera(), 4 / 3)
+        assert stats['submitted'] == stats['drawn'] == 27
+        assert stats['draw_calls'] == calls['glDrawElements'] == 1
+        assert calls['glLoadMatrixf'] == 1
+        merged = scene._merged[0, 0][1]
+
+        # Only the camera moved: the merged buffers are reused
+        camera = Camera()
+        camera.position = [0.5, 0.0, 10.0]
+        scene.draw(camera, 4 / 3)
+        assert scene._merged[0, 0][1] is merged
+
+        # A moved object rebuilds them
+        scene.move([0], positions=[[-3.0, -3.0, -2.0]])
+        scene.draw(camera, 4 / 3)
+        assert scene._merged[0, 0][1] is not merged
+
+        # Batches are capped at MERGE_VERTICES
+        scene.MERGE_VERTICES = 10 * len(scene.mesh.vertices)
+        assert scene.draw(camera, 4 / 3)['draw_calls'] == 3
+
+
+def row_scene(n=4000):
+    """Cubes spaced along the z axis, so a camera flying down it sees a changing subset"""
+    scene = Scene3D(Cube3D().mesh, lods=[Cube3D().mesh])
+    scene.add(np.stack([np.zeros(n), np.zeros(n), -np.arange(n) * 0.5], axis=1), scales=0.1)
+    return scene
+
+
+def fly(scene, z, viewport_height=None):
+    camera = Camera()
+    camera.position = [0.0, 0.0, z]
+    camera.target = [0.0, 0.0, z - 1]
+    camera.far = 100.0
+    return scene.draw(camera, 4 / 3, viewport_height=viewport_height)
+
+
+def test_camera_motion_only_merges_newly_visible_clusters():
+    scene = row_scene()
+    with recording_gl(GRAFKOM3D, glstate):
+        stats = fly(scene, 1.0)
+        assert 0 < stats['submitted'] < len(scene)
+        assert stats['submitted'] <= stats['drawn'] <= stats['submitted'] + 2 * scene.CLUSTER_OBJECTS
+        assert scene.merge_count == stats['drawn']
+        chunks = {key: value[1] for key, value in scene._merged.items()}
+
+        # A small step changes the visible set but stays within the same clusters
+        stats = fly(scene, 0.5)
+        assert scene.merge_count == stats['drawn']
+        assert all(scene._merged[key][1] is merged for key, merged in chunks.items())
+
+        # Flying on merges the clusters that come into view, each only once
+        builds = scene.bvh.build_count
+        for z in range(-5, -60, -5):
+            stats = fly(scene, float(z))
+            assert stats['submitted'] <= stats['drawn']
+        assert len(scene._merged) > len(chunks)
+        assert scene.merge_count == sum(batch.triangle_count for _, batches in scene._merged.values()
+                                        for batch in batches) // scene.mesh.triangle_count
+        assert scene.bvh.build_count == builds
+        assert all(scene._merged[key][1] is merged for key, merged in chunks.items())
+
+
+def test_moving_one_object_re_merges_only_its_cluster():
+    scene = row_scene()
+    with recording_gl(GRAFKOM3D, glstate):
+        fly(scene, 1.0)
+        chunks = {key: value[1] for key, value in scene._merged.items()}
+        merged = scene.merge_count
+        scene.move([3], positions=[[0.0, 0.1, -1.5]])
+        fly(scene, 1.0)
+    cluster = scene.clusters()[3]
+    assert scene.merge_count - merged == len(scene._clusters[1][cluster])
+    for (c, level), batches in chunks.items():
+        assert (scene._merged[c, level][1] is batches) == (c != cluster)
+
+
+def test_lod_switches_re_merge_only_the_switching_clusters():
+    scene = row_scene()
+    with recording_gl(GRAFKOM3D, glstate):
+        fly(scene, 1.0, viewport_height=768)
+        levels = scene.levels.copy()
+        assert set(levels[levels > 0]) == {1}
+        chunks = {key: value[1] for key, value in scene._merged.items()}
+        fly(scene, -2.0, viewport_height=768)
+    switched = np.flatnonzero(scene.levels != levels)
+    assert len(switched)
+    touched = set(scene.clusters()[switched].tolist())
+    for (cluster, level), batches in chunks.items():
+        if cluster not in touched:
+            assert scene._merged[cluster, level][1] is batches
+
+
+def test_meshes_too_big_to_merge_are_drawn_per_object():
+    scene = cube_scene()
+    scene.MERGE_VERTICES = len(scene.mesh.vertices)
+    with recording_gl(GRAFKOM3D, glstate) as calls:
+        stats = scene.draw(Camera(), 4 / 3)
+    assert stats['draw_calls'] == calls['glDrawElements'] == calls['glLoadMatrixf'] == 27
+    assert stats['drawn'] == 27
+    assert scene._merged == {}
@@ -0,0 +1,187 @@
+import numpy as np
+import pygame
+import pytest
+
+import glstate
+import GRAFKOM2D
+from benchmark import recording_gl
+from GRAFKOM2D import Shape, ShapeRenderer, ShapeStore, Viewport2D, ellipse_segments
+
+WIDTH, HEIGHT = 1200, 800
+VIEWS = [(1.0, (0.0, 0.0)), (3.7, (250.0, -40.0)), (0.05, (-900.0, 1200.0)), (640.0, (12.5, 7.25))]
+
+
+def rect(x, y, w=20, h=10, color=(1.0, 1.0, 1.0)):
+    return Shape('rectangle', [[x, y], [x + w, y], [x + w, y + h], [x, y + h]], color, 1.0)
+
+
+def ellipse(cx, cy, rx, ry, segments=None):
+    segments = segments or ellipse_segments(rx, ry)
+    shape = Shape('ellipse', GRAFKOM2D.tessellate_ellipse(cx, cy, rx, ry, segments), (1.0, 1.0, 1.0), 1.0)
+    shape.ellipse = (cx, cy, rx, ry)
+    return shape
+
+
+def view(zoom, pan):
+    viewport = Viewport2D(WIDTH, HEIGHT)
+    viewport.zoom_at(WIDTH / 2, HEIGHT / 2, zoom)
+    viewport.pan(*pan)
+    return viewport
+
+
+@pytest.mark.parametrize('zoom, pan', VIEWS)
+def test_screen_world_round_trip(zoom, pan):
+    viewport = view(zoom, pan)
+    screen = np.random.default_rng(0).uniform(0, [WIDTH, HEIGHT], (50, 2))
+    for x, y in screen:
+        np.testing.assert_allclose(viewport.world_to_screen(*viewport.screen_to_world(x, y)), (x, y),
+                                   atol=1e-6 * max(1.0, zoom))
+    # The window corners map onto the visible rectangle
+    x0, y0, x1, y1 = viewport.visible_rect()
+    np.testing.assert_allclose(viewport.screen_to_world(0, 0), (x0, y0))
+    np.testing.assert_allclose(viewport.screen_to_world(WIDTH, HEIGHT), (x1, y1))
+
+
+def test_zoom_at_keeps_the_cursor_point_fixed():
+    viewport = view(2.0, (30.0, 10.0))
+    for x, y, factor in ((100, 700, 1.2), (1100, 50, 1 / 1.2 ** 3), (600, 400, 7.0), (0, 0, 0.5)):
+        before = viewport.screen_to_world(x, y)
+        viewport.zoom_at(x, y, factor)
+        np.testing.assert_allclose(viewport.screen_to_world(x, y), before, rtol=1e-9)
+    # Zoom is clamped, and the cursor point still stays put
+    before = viewport.screen_to_world(300, 200)
+    viewport.zoom_at(300, 200, 1e9)
+    assert viewport.zoom == Viewport2D.MAX_ZOOM
+    np.testing.assert_allclose(viewport.screen_to_world(300, 200), before, rtol=1e-9)
+
+
+def click(editor, wx, wy):
+    """Left click in select mode at a world point, through the window coordinates"""
+    sx, sy = editor.viewport.world_to_screen(wx, wy)
+    pos = (sx, editor.screen_height - sy)
+    editor.handle_events([pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=pos),
+                          pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=pos)])
+    return editor.selected_shape
+
+
+def test_pick_after_zoom_and_pan(make_editor):
+    editor = make_editor()
+    below = editor.add_shape(rect(100, 100, 200, 100))
+    above = editor.add_shape(rect(250, 150, 20, 20))
+    tiny = editor.add_shape(rect(1000, 1000, 0.02, 0.02))
+
+    editor.viewport.zoom_at(400, 300, 8.0)
+    editor.viewport.pan(-350, 120)
+    assert click(editor, 260, 160) is above
+    assert click(editor, 150, 120) is below
+    assert click(editor, 285, 160) is below
+
+    # Three screen pixels of slack, however far in or out the view is
+    editor.viewport.zoom_at(0, 0, 1 / 400)
+    assert click(editor, 250 - 2.0 / editor.viewport.zoom, 160) is above
+    editor.viewport.fit((999, 999, 1001, 1001))
+    assert click(editor, 1000.01, 1000.01) is tiny
+    assert click(editor, 1000.5, 1000.5) is None
+
+
+def visible(renderer, viewport):
+    """(ids submitted as outlines, number drawn as LOD points, culled) for one frame"""
+    with recording_gl(GRAFKOM2D, glstate):
+        stats = renderer.draw(viewport)
+    store = renderer.store
+    first_to_id = {int(first): i for i, first in enumerate(store.offsets)}
+    draws, points, culled = renderer._visible
+    ids = {first_to_id[int(first)] for _, _, _, firsts, _ in draws for first in firsts}
+    assert stats['culled'] == culled and stats['lod'] == len(points[0])
+    return ids, len(points[0]), culled
+
+
+def test_shapes_outside_the_view_are_not_submitted():
+    store = ShapeStore()
+    for i in range(10):
+        for j in range(10):
+            store.append(rect(100 * i, 100 * j, 50, 50, color=(i / 10, j / 10, 0.5)))
+    renderer = ShapeRenderer(store)
+    viewport = Viewport2D(WIDTH, HEIGHT)
+    viewport.fit((180, 180, 420, 320), margin=0)
+
+    ids, lod, culled = visible(renderer, viewport)
+    x0, y0, x1, y1 = viewport.visible_rect()
+    b = store.bounds
+    overlaps = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+    assert ids == set(np.flatnonzero(overlaps).tolist())
+    assert lod == 0 and culled == len(store) - len(ids)
+
+    # Panning brings other shapes in; the plan follows the view
+    viewport.pan(-300, 0)
+    ids, _, _ = visible(renderer, viewport)
+    x0, y0, x1, y1 = viewport.visible_rect()
+    overlaps = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+    assert ids == set(np.flatnonzero(overlaps).tolist())
+
+
+def test_small_shapes_fall_back_to_points():
+    store = ShapeStore()
+    big = store.append(rect(0, 0, 400, 300))
+    small = store.append(rect(500, 500, 20, 10))
+    store.append(Shape('point', [[50, 50]], (1.0, 0.0, 0.0), 3.0))
+    renderer = ShapeRenderer(store)
+    viewport = Viewport2D(WIDTH, HEIGHT)
+    assert visible(renderer, viewport) == ({big.index, small.index, 2}, 0, 0)
+
+    # Zoomed out until the 20-unit rectangle spans under LOD_PIXELS
+    viewport.zoom_at(0, 0, 1.5 / 20)
+    ids, lod, _ = visible(renderer, viewport)
+    assert ids == {big.index, 2} and lod == 1
+    # Points are never reduced, however small
+    viewport.zoom_at(0, 0, 1e-3)
+    ids, lod, _ = visible(renderer, viewport)
+    assert ids == {2} and lod == 2
+
+
+def test_ellipses_are_tessellated_for_the_view_zoom(make_editor):
+    editor = make_editor()
+    editor.viewport.zoom_at(0, 0, 50.0)
+    shape = editor.create_shape('ellipse', [(0, 0), (40, 20)])
+    assert len(shape.original_points) == ellipse_segments(20, 10, 50.0) > ellipse_segments(20, 10)
+
+    editor.viewport.reset()
+    shape = editor.create_shape('ellipse', [(0, 0), (40, 20)])
+    assert len(shape.original_points) == ellipse_segments(20, 10)
+
+
+def test_zooming_re_tessellates_visible_ellipses_past_the_band():
+    store = ShapeStore()
+    near = store.append(ellipse(0, 0, 20, 10))
+    far = store.append(ellipse(5000, 5000, 20, 10))
+    store.append(rect(30, 30))
+    store.flush()
+    base = len(near.original_points)
+    rebuilds = store.rebuild_counts.copy()
+
+    # Within the hysteresis band nothing is rebuilt
+    store.update_tessellation(1.3, (-100, -100, 100, 100))
+    store.flush()
+    np.testing.assert_array_equal(store.rebuild_counts, rebuilds)
+
+    # Far enough in, only the ellipse in view is refined
+    store.update_tessellation(100.0, (-100, -100, 100, 100))
+    store.flush()
+    assert len(near.original_points) == ellipse_segments(20, 10, 100.0) > base
+    assert len(far.original_points) == base
+    assert np.flatnonzero(store.rebuild_counts != rebuilds).tolist() == [near.index]
+    corners = near.transformed_points
+    np.testing.assert_allclose(np.hypot(corners[:, 0] / 20, corners[:, 1] / 10), 1.0, atol=1e-5)
+
+    # The other one catches up once it comes into view, or when it is edited
+    store.update_tessellation(100.0, (4900, 4900, 5100, 5100))
+    store.flush()
+    assert len(far.original_points) == len(near.original_points)
+
+    # Zooming out coarsens again, and scale counts as much as zoom
+    store.update_tessellation(0.5, None)
+    store.flush()
+    assert len(near.original_points) == ellipse_segments(20, 10, 0.5)
+    near.scale_factor = [40.0, 40.0]
+    store.flush()
+    assert len(near.original_points) == ellipse_segments(20, 10, 20.0)
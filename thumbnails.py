@@ -0,0 +1,173 @@
+"""Batch turntable thumbnails for directories of OBJ models.
+
+Run: python thumbnails.py MODELS... [--out DIR] [--angles N] [--size WxH]
+
+MODELS are .obj files, directories (searched recursively) or glob
+patterns. Every model is loaded, framed from its bounds and rendered at
+N angles around the vertical axis with the headless SoftwareRenderer;
+models are spread over a process pool. A small JSON manifest next to
+each model's frames records the source size/mtime and render settings,
+so unchanged models are skipped on the next run.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+
+from GRAFKOM3D import Camera, PhongLighting, compose_world_matrices
+from objloader import load_obj_file
+from softrender import SoftwareRenderer, save_frame
+
+MANIFEST_VERSION = 1
+
+
+def find_models(patterns):
+    """Sorted unique .obj paths from files, directories and glob patterns"""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found.update(glob.glob(os.path.join(pattern, '**', '*.obj'), recursive=True))
+        else:
+            found.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    return sorted(found)
+
+
+def output_dir(out, path):
+    """Per-model folder: file stem plus a short hash of the full path"""
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+    return os.path.join(out, f"{os.path.splitext(os.path.basename(path))[0]}-{digest}")
+
+
+def manifest_key(path, settings):
+    st = os.stat(path)
+    return {'version': MANIFEST_VERSION, 'source': os.path.abspath(path),
+            'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'settings': settings}
+
+
+def is_current(folder, key):
+    try:
+        with open(os.path.join(folder, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return manifest.get('key') == key and all(
+        os.path.exists(os.path.join(folder, name)) for name in manifest.get('frames', []))
+
+
+def frame_camera(low, high, fov=45.0, elevation=20.0):
+    """Camera looking at the box center from a distance where the bounding sphere fits the view"""
+    center = (np.asarray(low, dtype=np.float64) + np.asarray(high, dtype=np.float64)) / 2
+    radius = max(float(np.linalg.norm(np.asarray(high) - np.asarray(low))) / 2, 1e-6)
+    distance = radius / math.sin(math.radians(fov) / 2) * 1.05
+    pitch = math.radians(elevation)
+    camera = Camera()
+    camera.fov = fov
+    camera.target = center.tolist()
+    camera.position = (center + distance * np.array([0.0, math.sin(pitch), math.cos(pitch)])).tolist()
+    camera.near = max(distance - radius * 1.5, distance * 1e-3)
+    camera.far = distance + radius * 1.5
+    return camera, center, radius
+
+
+def render_model(path, folder, settings):
+    """Render one model's turntable; returns a result dict (runs in a worker process)"""
+    start = time.perf_counter()
+    # No .cache.npz sidecar: the manifest already skips unchanged models,
+    # and the source tree should be left as it was
+    mesh = load_obj_file(path, use_cache=False)
+    if mesh is None or mesh.triangle_count == 0:
+        return {'path': path, 'error': 'no triangles'}
+    loaded = time.perf_counter()
+
+    camera, center, radius = frame_camera(*mesh.bounds())
+    lighting = PhongLighting()
+    # Key light above and to the right of the camera, as in the interactive default
+    eye = np.asarray(camera.position)
+    lighting.diffuse_position = (eye + radius * np.array([2.0, 2.0, 0.0])).tolist() + [1.0]
+    width, height = settings['size']
+    renderer = SoftwareRenderer(width, height, camera, lighting, shading=settings['shading'], workers=1)
+
+    os.makedirs(folder, exist_ok=True)
+    frames = []
+    to_origin = np.eye(4)
+    to_origin[:3, 3] = -center
+    for i in range(settings['angles']):
+        angle = 360.0 * i / settings['angles']
+        # Spin the model about its own vertical axis through the box center
+        model = compose_world_matrices([center], [[0.0, angle, 0.0]], [1.0])[0] @ to_origin
+        name = f"angle_{i:03d}.{settings['format']}"
+        save_frame(os.path.join(folder, name), renderer.render([(mesh, model)]))
+        frames.append(name)
+    done = time.perf_counter()
+
+    with open(os.path.join(folder, 'manifest.json'), 'w') as f:
+        json.dump({'key': manifest_key(path, settings), 'frames': frames,
+                   'triangles': mesh.triangle_count}, f, indent=1)
+    return {'path': path, 'triangles': mesh.triangle_count, 'frames': len(frames),
+            'load_s': loaded - start, 'render_s': done - loaded}
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height or width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('models', nargs='+', help=".obj files, directories or glob patterns")
+    parser.add_argument('--out', default='thumbnails')
+    parser.add_argument('--angles', type=int, default=8)
+    parser.add_argument('--size', type=parse_size, default=(256, 256), help="WxH, e.g. 256x256")
+    parser.add_argument('--shading', choices=('phong', 'gouraud'), default='phong')
+    parser.add_argument('--format', choices=('png', 'npy'), default='png')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--force', action='store_true', help="re-render even if up to date")
+    args = parser.parse_args()
+
+    settings = {'angles': args.angles, 'size': list(args.size), 'shading': args.shading,
+                'format': args.format}
+    paths = find_models(args.models)
+    jobs, skipped = [], 0
+    for path in paths:
+        folder = output_dir(args.out, path)
+        if not args.force and is_current(folder, manifest_key(path, settings)):
+            skipped += 1
+        else:
+            jobs.append((path, folder))
+    print(f"{len(paths)} models: {len(jobs)} to render, {skipped} up to date")
+
+    start = time.perf_counter()
+    rendered = failed = frames = triangles = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(render_model, path, folder, settings) for path, folder in jobs]
+        for (path, _), future in zip(jobs, futures):
+            try:
+                result = future.result()
+            except Exception as exc:
+                result = {'path': path, 'error': repr(exc)}
+            if 'error' in result:
+                failed += 1
+                print(f"  FAILED {result['path']}: {result['error']}")
+                continue
+            rendered += 1
+            frames += result['frames']
+            triangles += result['triangles']
+            print(f"  {result['path']}: {result['triangles']} tris, load {result['load_s']:.2f} s, "
+                  f"render {result['render_s']:.2f} s ({result['frames']} frames)")
+    elapsed = time.perf_counter() - start
+    rate = (f"({rendered / elapsed:.2f} models/s, {frames / elapsed:.1f} frames/s, "
+            f"{triangles * settings['angles'] / elapsed / 1e6:.2f} M tris/s)" if rendered else "")
+    print(f"Done: {rendered} rendered, {skipped} skipped, {failed} failed in {elapsed:.2f} s {rate}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())